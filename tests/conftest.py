@@ -0,0 +1,31 @@
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Synthetic scans shared by the tests.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+import numpy as np
+import pytest
+
+from xPlotUtil.Source.PeakModels import peakValue
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+
+def syntheticMatrix(whichFit='G', nRow=120, nCol=24, seed=0):
+    """A PVvalue-like matrix whose columns hold one peak drifting across the rows on a sloped background, with
+    noise.
+    :return: 2D array, rows are points and columns are bins
+    """
+    rng = np.random.RandomState(seed)
+    x = np.arange(nRow, dtype=np.float64).reshape(-1, 1)
+    centers = np.linspace(0.4, 0.6, nCol) * nRow
+    sigmas = np.linspace(4.0, 6.0, nCol)
+    TT = peakValue(whichFit, x, 800.0, centers, sigmas) + 0.02 * x + 5.0
+    return TT + rng.normal(0, 0.5, TT.shape)
+
+
+@pytest.fixture(scope='session')
+def matrix():
+    return syntheticMatrix()
@@ -0,0 +1,49 @@
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Convergence reported by the batched Levenberg-Marquardt solver.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+import numpy as np
+
+from xPlotUtil.Source import BatchedSolver
+from xPlotUtil.Source.BatchedSolver import batchedLevenbergMarquardt, evaluateModel
+from xPlotUtil.Source.FitEngine import varyingParams
+from xPlotUtil.Source.PeakSeeding import seedColumns
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+
+def test_noisy_columns_converge(matrix):
+    x = np.arange(matrix.shape[0])
+    P, chisqr, nfev, success = batchedLevenbergMarquardt('G', 1, x, matrix, seedColumns(matrix, 'G', 1),
+                                                         varyingParams('G', 1))
+    assert success.all()
+    np.testing.assert_allclose(P[:, 1], np.linspace(0.4, 0.6, matrix.shape[1]) * matrix.shape[0], atol=0.2)
+
+
+def test_exact_start_converges():
+    x = np.arange(100)
+    P0 = np.array([[900.0, 47.3, 5.2, 0.03, 4.0]])
+    Y = evaluateModel('G', 1, x.reshape(-1, 1), P0)
+    P, chisqr, nfev, success = batchedLevenbergMarquardt('G', 1, x, Y, P0)
+    assert success.all()
+    np.testing.assert_allclose(P, P0)
+
+
+def test_stagnated_columns_do_not_converge(matrix, monkeypatch):
+    # Every step away from the seeds is rejected, so the damping grows until the columns stagnate
+    x = np.arange(matrix.shape[0])
+    P0 = seedColumns(matrix, 'G', 1)
+    evaluate = BatchedSolver.evaluateModel
+
+    def rejectSteps(whichFit, peaks, x, P, out=None):
+        values = evaluate(whichFit, peaks, x, P, out)
+        values[:, ~np.all(np.isin(P, P0), axis=1)] = np.inf
+        return values
+
+    monkeypatch.setattr(BatchedSolver, 'evaluateModel', rejectSteps)
+    P, chisqr, nfev, success = batchedLevenbergMarquardt('G', 1, x, matrix, P0)
+    assert not success.any()
+    np.testing.assert_array_equal(P, P0)
@@ -0,0 +1,71 @@
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C The fit engine gives the same parameters whether the columns are fitted in process or on the process pool.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+import numpy as np
+import pytest
+
+from xPlotUtil.Source import FitEngine as fitEngineModule
+from xPlotUtil.Source.FitEngine import FitEngine
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+
+def fitParams(matrix, **kwargs):
+    engine = FitEngine(**kwargs)
+    try:
+        store = engine.fitColumns(matrix, 'G', 1)
+    finally:
+        engine.shutdown()
+    assert store.success.all()
+    return store.params[:, :, 0]
+
+
+@pytest.fixture(scope='module')
+def serial(matrix):
+    return fitParams(matrix, maxWorkers=1)
+
+
+def test_serial_fit_finds_the_peaks(serial):
+    centers = np.linspace(0.4, 0.6, serial.shape[0]) * 120
+    np.testing.assert_allclose(serial[:, 1], centers, atol=0.2)
+
+
+def test_shared_memory_pool_matches_serial(matrix, serial):
+    assert fitEngineModule.shared_memory is not None
+    pooled = fitParams(matrix, maxWorkers=2, chunkSize=6)
+    np.testing.assert_allclose(pooled, serial, rtol=1e-5, atol=1e-6)
+
+
+def test_pickled_pool_matches_serial(matrix, serial, monkeypatch):
+    monkeypatch.setattr(fitEngineModule, 'shared_memory', None)
+    pooled = fitParams(matrix, maxWorkers=2, chunkSize=6)
+    np.testing.assert_allclose(pooled, serial, rtol=1e-5, atol=1e-6)
+
+
+def test_pool_workers_are_spawned(matrix):
+    engine = FitEngine(maxWorkers=2)
+    try:
+        assert engine.getExecutor()._mp_context.get_start_method() == 'spawn'
+    finally:
+        engine.shutdown()
+
+
+def test_candidates_have_their_own_store_files(matrix, tmp_path):
+    candidates = [('G', 1), ('L', 1), ('G', 2)]
+    storeFile = str(tmp_path / 'fit.store')
+    engine = FitEngine(maxWorkers=1, storeFile=storeFile)
+    inMemory = FitEngine(maxWorkers=1)
+    try:
+        selection = engine.fitCandidates(matrix[:, :6], candidates)
+        expected = inMemory.fitCandidates(matrix[:, :6], candidates)
+    finally:
+        engine.shutdown()
+        inMemory.shutdown()
+    assert len(set(store.fileName for store in selection.stores)) == len(candidates)
+    for store, reference in zip(selection.stores, expected.stores):
+        np.testing.assert_allclose(store.params, reference.params, rtol=1e-6, atol=1e-8)
+    assert selection.best() == expected.best()
@@ -0,0 +1,109 @@
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C The analytic Jacobians handed to leastsq match central differences of the residual of the composite models.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+import numpy as np
+import pytest
+
+from xPlotUtil.Source import ModelKernels
+from xPlotUtil.Source.FitEngine import buildModel, seedParams
+from xPlotUtil.Source.ModelKernels import modelJacobian
+from xPlotUtil.Source.PeakModels import RESIDUAL_SIGN, paramNames
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+FITS = ['G', 'L', 'V', 'P']
+STEP = 1e-6  # Relative step of the central differences
+
+
+def modelParams(whichFit, peaks):
+    """Parameters away from the data, so that every derivative is far from zero.
+    :return: composite model and its parameters
+    """
+    mod = buildModel(whichFit, peaks)
+    if peaks == 1:
+        seed = [900.0, 47.3, 5.2, 0.03, 4.0]
+    else:
+        seed = [600.0, 38.1, 4.4, 500.0, 63.7, 6.1, 0.03, 4.0]
+    return mod, seedParams(mod, whichFit, peaks, seed)
+
+
+def numericJacobian(mod, pars, data, weights, x):
+    """Central differences of the residual, one row per varying parameter like col_deriv=1.
+    """
+    rows = []
+    for name in paramNames(len(mod.components) - 1):
+        if not pars[name].vary:
+            continue
+        value = pars[name].value
+        h = STEP * max(abs(value), 1.0)
+        pars[name].value = value + h
+        upper = mod._residual(pars, data, weights, x=x)
+        pars[name].value = value - h
+        lower = mod._residual(pars, data, weights, x=x)
+        pars[name].value = value
+        rows.append((upper - lower) / (2 * h))
+    return np.array(rows)
+
+
+@pytest.fixture(params=[True, False], ids=['kernels', 'numpy'])
+def kernels(request, monkeypatch):
+    """Runs a test with the compiled kernels, when Numba is installed, and with the numpy fallback.
+    """
+    if request.param and not ModelKernels.NUMBA_AVAILABLE:
+        pytest.skip("Numba is not installed")
+    monkeypatch.setattr(ModelKernels, 'NUMBA_AVAILABLE', request.param)
+
+
+@pytest.mark.parametrize('peaks', [1, 2])
+@pytest.mark.parametrize('whichFit', FITS)
+@pytest.mark.parametrize('weighted', [False, True])
+def test_jacobian_matches_central_differences(kernels, whichFit, peaks, weighted):
+    x = np.arange(100, dtype=np.float64)
+    data = np.random.RandomState(1).normal(10, 1, len(x))
+    weights = np.linspace(0.5, 2.0, len(x)) if weighted else None
+    mod, pars = modelParams(whichFit, peaks)
+
+    jac = modelJacobian(whichFit, peaks)(pars, data, weights, x=x)
+    expected = numericJacobian(mod, pars, data, weights, x)
+    assert jac.shape == expected.shape == (sum(pars[name].vary for name in paramNames(peaks)), len(x))
+    scale = np.abs(expected).max(axis=1, keepdims=True)
+    np.testing.assert_allclose(jac / scale, expected / scale, atol=1e-6)
+
+
+@pytest.mark.parametrize('whichFit', FITS)
+def test_two_peak_background_columns(whichFit):
+    x = np.arange(100, dtype=np.float64)
+    mod, pars = modelParams(whichFit, 2)
+    jac = modelJacobian(whichFit, 2)(pars, np.zeros(len(x)), None, x=x)
+    # The intercept is always the last row, and the slope the one before it when it varies
+    np.testing.assert_allclose(jac[-1], RESIDUAL_SIGN * np.ones(len(x)))
+    if pars['slope'].vary:
+        np.testing.assert_allclose(jac[-2], RESIDUAL_SIGN * x)
+    else:
+        assert jac.shape[0] == len(paramNames(2)) - 1
+
+
+def test_residual_sign_follows_lmfit():
+    mod, pars = modelParams('G', 1)
+    x = np.arange(10, dtype=np.float64)
+    residual = mod._residual(pars, np.zeros(len(x)), None, x=x)
+    np.testing.assert_allclose(residual, RESIDUAL_SIGN * mod.eval(pars, x=x))
+
+
+@pytest.mark.parametrize('whichFit', FITS)
+def test_fit_with_jacobian_matches_fit_without(whichFit):
+    x = np.arange(100, dtype=np.float64)
+    mod, pars = modelParams(whichFit, 1)
+    truth = mod.eval(pars, x=x) + np.random.RandomState(2).normal(0, 0.5, len(x))
+    start = pars.copy()
+    start['center'].value += 3
+    start['sigma'].value *= 1.4
+    numeric = mod.fit(truth, start.copy(), x=x)
+    analytic = mod.fit(truth, start.copy(), x=x, fit_kws={'Dfun': modelJacobian(whichFit, 1), 'col_deriv': 1})
+    assert analytic.success
+    for name in paramNames(1):
+        assert analytic.params[name].value == pytest.approx(numeric.params[name].value, rel=1e-4, abs=1e-6)
@@ -0,0 +1,65 @@
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C The sidecars of the matrix cache stay under their size cap, dropping the least recently loaded ones.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+import os
+
+import numpy as np
+
+from xPlotUtil.Source.PVvalueFile import MatrixCache
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+
+def pvFiles(directory, count):
+    fileNames = []
+    for i in range(count):
+        fileName = str(directory.join('PVvalue.%d' % i))
+        np.savetxt(fileName, np.full((50, 40), i + 1.0))
+        fileNames.append(fileName)
+    return fileNames
+
+
+def sidecarScans(cache):
+    return sorted(name.split('.')[1] for name in os.listdir(cache.directory))
+
+
+def setUsed(cache, fileName, used):
+    """Back-dates the last load of the sidecar of a file, as the resolution of modification times varies.
+    """
+    os.utime(cache.sidecarName(fileName), (used, used))
+
+
+def test_least_recently_loaded_sidecars_are_evicted(tmpdir):
+    fileNames = pvFiles(tmpdir.mkdir('scans'), 4)
+    sidecarSize = 50 * 40 * 8 + 128
+    cache = MatrixCache(str(tmpdir.join('cache')), maxBytes=3 * sidecarSize)
+    for i, fileName in enumerate(fileNames[:3]):
+        cache.load(fileName)
+        setUsed(cache, fileName, 1000 + i)
+    cache.load(fileNames[0])  # Loaded again, so the sidecar of scan 1 is the least recently used
+    cache.load(fileNames[3])
+    assert sidecarScans(cache) == ['0', '2', '3']
+    assert cache.size() <= cache.maxBytes
+    np.testing.assert_array_equal(cache.load(fileNames[0]), np.full((50, 40), 1.0))
+    assert cache.hit
+
+
+def test_matrix_larger_than_the_cap_has_no_sidecar(tmpdir):
+    fileName, = pvFiles(tmpdir.mkdir('scans'), 1)
+    cache = MatrixCache(str(tmpdir.join('cache')), maxBytes=1000)
+    np.testing.assert_array_equal(cache.load(fileName), np.full((50, 40), 1.0))
+    assert not cache.hit and cache.error is None
+    assert cache.size() == 0
+
+
+def test_clear_deletes_every_sidecar(tmpdir):
+    fileNames = pvFiles(tmpdir.mkdir('scans'), 2)
+    cache = MatrixCache(str(tmpdir.join('cache')))
+    for fileName in fileNames:
+        cache.load(fileName)
+    cache.clear()
+    assert cache.size() == 0
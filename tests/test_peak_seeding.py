@@ -0,0 +1,27 @@
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Starting values of the columns.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+import warnings
+
+import numpy as np
+
+from xPlotUtil.Source.PeakSeeding import seedBackground, seedColumns
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+
+def test_seeds_find_the_peaks(matrix):
+    seeds = seedColumns(matrix, 'G', 1)
+    np.testing.assert_allclose(seeds[:, 1], np.linspace(0.4, 0.6, matrix.shape[1]) * matrix.shape[0], atol=1.0)
+
+
+def test_one_row_background_is_flat():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        m, b = seedBackground(np.array([[3.0, 5.0]]))
+    np.testing.assert_array_equal(m, [0.0, 0.0])
+    np.testing.assert_array_equal(b, [3.0, 5.0])
@@ -10,7 +10,8 @@ See LICENSE file.
 from __future__ import unicode_literals
 
 import gc
-from threading import Timer
+import multiprocessing
+import time
 
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
@@ -18,7 +19,10 @@ from PyQt5.QtWidgets import *
 from matplotlib.backends.backend_qt5 import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from pylab import *
+from xPlotUtil.Source.ColumnViewer import ColumnViewer
+from xPlotUtil.Source.FitDiagnostics import FitDiagnosticsView
 from xPlotUtil.Source.DockedOptions import DockedOption
+from xPlotUtil.Source.PVvalueFile import pvHeader
 
 # ---------------------------------------------------------------------------------------------------------------------#
 
@@ -105,14 +109,23 @@ class MainWindow (QMainWindow):
         self.myStatusBar.addWidget(self.progressLabel)
         self.myStatusBar.addWidget(self.spaceLabel)
         self.myStatusBar.addWidget(self.progressBar, 1)
+        self.cancelProgressBtn = QPushButton('Cancel')
+        self.cancelProgressBtn.setStatusTip("Stops the fit, keeping the columns fitted so far in the fit cache")
+        self.myStatusBar.addWidget(self.cancelProgressBtn)
+        self.cancelProgressFunction = None
+        self.cancelProgressBtn.clicked.connect(self.cancelProgress)
         self.spaceLabel.hide()
         self.progressLabel.hide()
         self.progressBar.hide()
+        self.cancelProgressBtn.hide()
         self.myStatusBar.showMessage('Ready', 3000)
 
         self.CreateActions()
         self.CreateMenus()
         self.fileMenu.addAction(self.openAction)
+        self.fileMenu.addAction(self.catalogAction)
+        self.fileMenu.addAction(self.followAction)
+        self.fileMenu.addAction(self.prefetchAction)
         self.exportMenu = self.fileMenu.addMenu("Export")
         self.exportMenu.addAction(self.reportAction)
         self.exportMenu.addAction(self.binGausFitReportAction)
@@ -122,11 +135,22 @@ class MainWindow (QMainWindow):
         self.graphMenu.addAction(self.mainOptionsAction)
         self.graphMenu.addAction(self.normalizeAction)
         self.graphMenu.addAction(self.algebraicExpAction)
+        self.graphMenu.addAction(self.columnViewerAction)
         self.fitMenu = self.graphMenu.addMenu("Fits")
         self.fitMenu.addAction(self.gaussianFitAction)
         self.fitMenu.addAction(self.lorentzianFitAction)
         self.fitMenu.addAction(self.voigtFitAction)
+        self.fitMenu.addAction(self.pseudoVoigtFitAction)
+        self.fitMenu.addAction(self.autoFitAction)
         self.fitMenu.addAction(self.latticeFitAction)
+        self.fitMenu.addAction(self.fitDiagnosticsAction)
+        self.fitMenu.addAction(self.streamingFitAction)
+        self.fitMenu.addSeparator()
+        self.fitMenu.addAction(self.fitWindowAction)
+        self.fitMenu.addAction(self.fastSolverAction)
+        self.fitMenu.addAction(self.bootstrapErrorsAction)
+        self.fitMenu.addAction(self.clearFitCacheAction)
+        self.fitMenu.addAction(self.clearMatrixCacheAction)
         self.graphMenu.addSeparator()
         self.helpMenu.addSeparator()  
         self.helpMenu.addAction(self.aboutAction)
@@ -141,6 +165,17 @@ class MainWindow (QMainWindow):
         self.openAction.setStatusTip("Open an existing file")
         self.openAction.triggered.connect(self.readSpec.openSpecFile)
 
+        self.catalogAction = QAction('Beamtime Catalog', self, statusTip="Finds the scans of the spec files under a "
+                                                                         "directory.",
+                                     triggered=self.readSpec.BeamtimeCatalog)
+
+        self.followAction = QAction('Follow Spec File', self, checkable=True,
+                                    statusTip="Lists the new scans and PVvalue files as they are written.",
+                                    toggled=self.readSpec.setFollow)
+        self.prefetchAction = QAction('Prefetch', self, statusTip="Sets how many scans around the open one are loaded "
+                                                                  "in the background.",
+                                      triggered=self.readSpec.PrefetchDialog)
+
         self.exitAction = QAction(QIcon('exit.png'), 'E&xit',
                                         self, shortcut="Ctrl+Q",
                                         statusTip="Exit the Application",
@@ -160,8 +195,39 @@ class MainWindow (QMainWindow):
                                          triggered=self.lorentFit.WhichPeakLorentzianFit)
         self.voigtFitAction = QAction('Voigt Fit', self, statusTip="Voigt fit.",
                                          triggered=self.lorentFit.WhichPeakVoigtFit)
+        self.pseudoVoigtFitAction = QAction('Pseudo-Voigt Fit', self,
+                                            statusTip="Fast pseudo-Voigt approximation of the Voigt fit.",
+                                            triggered=self.lorentFit.WhichPeakPseudoVoigtFit)
+        self.autoFitAction = QAction('Auto Fit', self, statusTip="Fits one and two peak Gaussian, Lorentzian and "
+                                                                 "Voigt models and keeps the best by BIC.",
+                                     triggered=self.gausFit.AutoFit)
         self.latticeFitAction = QAction('Lattice Fit', self, statusTip="Lattice fit.",
                                   triggered =self.dockedOpt.GraphingLatticeOptionsTree)
+        self.fastSolverAction = QAction('Fast Solver', self, checkable=True,
+                                        statusTip="Fit all the columns at once with the batched solver.",
+                                        toggled=self.gausFit.setFastSolver)
+        self.fitDiagnosticsAction = QAction('Fit Diagnostics', self, statusTip="Convergence, chi-square, R², "
+                                                                              "function evaluations and time of the "
+                                                                              "fit of each column.",
+                                            triggered=self.FitDiagnosticsTab)
+        self.streamingFitAction = QAction('Streaming Fit', self, checkable=True,
+                                          statusTip="Refits the PVvalue file each time the running scan adds "
+                                                    "points.",
+                                          toggled=self.gausFit.setStreaming)
+        self.fitWindowAction = QAction('Fit Window', self, statusTip="Restricts the fits to a window of L.",
+                                       triggered=self.gausFit.FitWindowDialog)
+        self.bootstrapErrorsAction = QAction('Bootstrap Errors', self, checkable=True,
+                                             statusTip="Estimate the errors of the next fits from resampled refits "
+                                                       "instead of the covariance.",
+                                             toggled=self.gausFit.setBootstrapErrors)
+        self.clearFitCacheAction = QAction('Clear Fit Cache', self, statusTip="Forget the fits kept on disk.",
+                                           triggered=self.gausFit.clearFitCache)
+        self.clearMatrixCacheAction = QAction('Clear Matrix Cache', self,
+                                              statusTip="Forget the parsed PVvalue files kept on disk.",
+                                              triggered=self.dockedOpt.clearMatrixCache)
+        self.columnViewerAction = QAction('Column Viewer', self, statusTip="Steps through the columns of the data "
+                                                                           "and their fits.",
+                                          triggered=self.ColumnViewerTab)
         self.normalizeAction = QAction('Normalize', self, statusTip='Normalizes the data',
                                        triggered=self.readSpec.NormalizerDialog)
         self.algebraicExpAction = QAction('Algebraic Expressions', self, statusTip='Algebraic expressions.',
@@ -176,15 +242,61 @@ class MainWindow (QMainWindow):
         self.spaceLabel.show()
 
         self.progressLabel.setText(txt)
+        self.progressBar.setMaximum(100)
         self.progressBar.setValue(100)
-        stop = Timer(1.5, self.hideProgress)
-        stop.start()
+        QTimer.singleShot(1500, self.hideProgress)
+
+    def startProgress(self, txt, total, cancel):
+        """Shows a progress bar that counts the columns of a fit, with its estimated time left and a Cancel
+        button.
+        :param txt: label of the progress bar
+        :param total: number of columns
+        :param cancel: function called when Cancel is pressed
+        """
+        self.progressTxt = txt
+        self.progressDone = 0
+        self.progressClock = None  # Time and count of the first report, cached columns all come in at once
+        self.cancelProgressFunction = cancel
+        self.progressBar.setMaximum(max(total, 1))
+        self.progressBar.setValue(0)
+        self.progressLabel.setText(txt)
+        self.progressBar.show()
+        self.progressLabel.show()
+        self.spaceLabel.show()
+        self.cancelProgressBtn.setEnabled(True)
+        self.cancelProgressBtn.show()
+
+    def advanceProgress(self, count):
+        """Adds columns to the progress bar and updates the estimated time left.
+        :param count: number of columns done since the last call
+        """
+        self.progressDone += count
+        total = self.progressBar.maximum()
+        self.progressBar.setValue(min(self.progressDone, total))
+        txt = "%s: %d/%d columns" % (self.progressTxt, self.progressDone, total)
+        now = time.time()
+        if self.progressClock is None:
+            self.progressClock = (now, self.progressDone)
+        elif self.progressDone > self.progressClock[1] and now > self.progressClock[0]:
+            rate = (self.progressDone - self.progressClock[1]) / (now - self.progressClock[0])
+            txt += ", %d s left" % np.ceil(max(total - self.progressDone, 0) / rate)
+        self.progressLabel.setText(txt)
+
+    def cancelProgress(self):
+        """Asks the running fit to stop.
+        """
+        if self.cancelProgressFunction is not None:
+            self.cancelProgressFunction()
+        self.cancelProgressBtn.setEnabled(False)
+        self.progressLabel.setText(self.progressTxt + ": cancelling")
 
     def hideProgress(self):
         self.progressBar.setValue(0)
         self.progressBar.hide()
         self.progressLabel.hide()
         self.spaceLabel.hide()
+        self.cancelProgressBtn.hide()
+        self.cancelProgressFunction = None
 
     def CreateMenus(self):
         """This is where I initialize the menu bar and create the menus
@@ -204,6 +316,15 @@ class MainWindow (QMainWindow):
         else:
             pass
 
+    def closeEvent(self, event):
+        """Stops a running fit before the window goes away.
+        """
+        fitWorker = self.gausFit.fitWorker
+        if fitWorker is not None and fitWorker.isRunning():
+            self.gausFit.fitEngine.cancel()
+            fitWorker.wait()
+        event.accept()
+
     def aboutHelp(self):
         """Talks briefly about the program.
         """
@@ -218,18 +339,11 @@ class MainWindow (QMainWindow):
     def PlotColorGraphRawData(self):
         """This function uses the raw data to plot a color graph of the data.
         """
-        # Reads file header for voltage
-        inF = open(self.dockedOpt.fileName, 'r')
-        lines = inF.readlines()
-        header = ''
-        for (iL, line) in enumerate(lines):
-            if line.startswith('#'):
-                header = line
-        inF.close()
-        words = header.split()
-        ampl = ''
-        if len(words) > 6:
-            ampl = words[6]
+        # Voltage amplitude from the file header
+        try:
+            ampl = '%g' % pvHeader(self.dockedOpt.fileName).amplitude
+        except (OSError, ValueError, KeyError):
+            ampl = ''
         line1 = '[-' + str(ampl) + '] --> [0] --> [+' + str(ampl) + '] --> [0] --> [-' + str(ampl) + '] '
 
         xx = self.readSpec.L
@@ -406,6 +520,34 @@ class MainWindow (QMainWindow):
         if gTitle != 0:
              self.GraphUtilRawDataLineGraphs(gTitle, xLabel, 'Intensity', statTip, tabName, xx, 'L')
 
+    def ColumnViewerTab(self):
+        """Opens a tab that steps through the columns of the data, with the current fit and its residual.
+        """
+        if self.dockedOpt.FileError() == False:
+            if self.dockedOpt.fitStat:
+                if not self.gausFit.fitReady():
+                    return
+                viewer = ColumnViewer(self.dockedOpt.TT, self.gausFit.fitStore.bestFit, self.gausFit.fitStore.rows())
+            else:
+                viewer = ColumnViewer(self.dockedOpt.TT)
+            name = 'Column Viewer (Scan#: ' + self.readSpec.scan + ')'
+            viewer.setStatusTip(name)
+            self.savingCanvasTabs(viewer, name, viewer.canvas, viewer.fig)
+
+    def FitDiagnosticsTab(self):
+        """Opens a tab with the diagnostics of the fit of each column.
+        """
+        if self.dockedOpt.FileError() == False:
+            if not self.dockedOpt.fitStat:
+                QMessageBox.warning(self, "Error", "Please fit the data first.")
+                return
+            if not self.gausFit.fitReady():
+                return
+            view = FitDiagnosticsView(self.gausFit.fitStore)
+            name = 'Fit Diagnostics (Scan#: ' + self.readSpec.scan + ')'
+            view.setStatusTip(name)
+            self.savingCanvasTabs(view, name, view.canvas, view.fig)
+
     # -----------------------------------Creating Report---------------------------------------------------------------#
     def ReportButton(self):
         """This button creates a report.
@@ -426,6 +568,8 @@ class MainWindow (QMainWindow):
         """
         if self.reportCbGausFit.isChecked() or self.reportCbLFit.isChecked():
             self.reportDialog.close()
+            if not self.gausFit.fitReady():
+                return
             selectedFilters = ".txt"
             self.reportFile, self.reportFileFilter = QFileDialog.getSaveFileName(self, "Save Report", "",
                                                                                  selectedFilters)
@@ -460,7 +604,7 @@ class MainWindow (QMainWindow):
         """
         self.reportGroupBx = QGroupBox("Select the data")
 
-        self.reportCbGausFit = QCheckBox("Gaussian Fit")
+        self.reportCbGausFit = QCheckBox("Peak Fit")
         self.reportCbLFit = QCheckBox("Lattice Fit")
         self.reportCbGausFit.setEnabled(False)
         self.reportCbLFit.setEnabled(False)
@@ -487,12 +631,17 @@ class MainWindow (QMainWindow):
         comment = "#C PVvalue #" + scanNum + "\n"
 
         if self.reportCbGausFit.isChecked():
+            fitStore = self.gausFit.fitStore
+            # The columns of each peak in turn, as the reports have always had them. The positions are in the
+            # whole scan, not the fit window.
+            peakData = fitStore.peakData().copy()
+            peakData[:, 2::6] += fitStore.rowOffset
             if self.dockedOpt.onePeakStat == True:
                 header += "Amp Err Position Err Width Err "
-                reportData = np.concatenate((reportData, self.gausFit.OnePkFitData), axis=1)
+                reportData = np.concatenate((reportData, peakData), axis=1)
             if self.dockedOpt.twoPeakStat == True:
                 header += "Amp Err Amp Err Pos Err Pos Err Wid Err Wid Err "
-                reportData = np.concatenate((reportData, self.gausFit.TwoPkGausFitData), axis=1)
+                reportData = np.concatenate((reportData, peakData), axis=1)
 
         if self.reportCbLFit.isChecked():
             if self.dockedOpt.onePeakStat == True:
@@ -516,11 +665,12 @@ class MainWindow (QMainWindow):
 def main():
     """Main method.
     """
+    multiprocessing.freeze_support()  # Fit engine workers in frozen executables
     app = QApplication(sys.argv)
     myMainWindow = MainWindow()
     myMainWindow.show()
     sys.exit(app.exec_())
 
 
-if __name__.endswith('__main__'):
+if __name__ == '__main__':  # Fit engine workers import this module as __mp_main__
     main()
\ No newline at end of file
@@ -32,14 +32,14 @@ class AlgebraicExpress:
         self.lorentFit = LorentzianFitting(self)
 
 
-    def singularValueDecomposition(self):
-        """This method calculates the svd of the raw data.
+    def singularValueDecomposition(self, TT):
+        """Computes the 'svd' node of the processing graph, the svd of the normalized data.
+        :param TT: normalized data
+        :return: U, S and V
         """
-        self.U = []
-        self.S = []
-        self.V = []
-
-        self.U, self.S, self.V = svd(self.dockedOpt.TT)
+        if TT is None:
+            return None
+        return svd(TT)
 
     def PlotAlgebraicExpGraphs(self, title, name1, x, y1, xLabel, yLabel1, y2, name2, yLabel2, y3, name3, yLabel3):
         """Generic plotting method that creates a canvas with 3 subplots.
@@ -97,19 +97,20 @@ class AlgebraicExpress:
         """This method plots the theta2theta graphs.
         """
         title = '\u03B82\u03B8 (Scan#: ' + self.readSpec.scan + ')'
+        U, S, V = self.dockedOpt.graph.get('svd')
 
         name1 = "\u03B82\u03B8"
         x = self.readSpec.L
-        y1 = -self.U[:, 0]
+        y1 = -U[:, 0]
         xLabel = "RLU"
         yLabel1 = "TH2TH"
 
         name2 = "\u03B82\u03B8'"
-        y2 = self.U[:, 1]
+        y2 = U[:, 1]
         yLabel2 = "Counts"
 
         name3 = "\u03B82\u03B8''"
-        y3 = self.U[:, 3]
+        y3 = U[:, 3]
         yLabel3 = "Counts"
         self.PlotAlgebraicExpGraphs(title, name1, x, y1, xLabel, yLabel1, y2, name2, yLabel2, y3, name3, yLabel3)
 
@@ -117,19 +118,20 @@ class AlgebraicExpress:
         """This method plots the weighting graphs.
         """
         title = 'Weighting (Scan#: ' + self.readSpec.scan + ')'
+        U, S, V = self.dockedOpt.graph.get('svd')
 
         name1 = "Weighting 1"
         x = self.gausFit.getVoltage()
-        y1 = -self.V[0]
+        y1 = -V[0]
         xLabel = "Voltage"
         yLabel1 = "Weighting 1"
 
         name2 = "Weighting 2"
-        y2 = self.V[1]
+        y2 = V[1]
         yLabel2 = "Weighting 2"
 
         name3 = "Weighting 3"
-        y3 = self.V[2]
+        y3 = V[2]
         yLabel3 = "Weighting 3"
         self.PlotAlgebraicExpGraphs(title, name1, x, y1, xLabel, yLabel1, y2, name2, yLabel2, y3, name3, yLabel3)
 
@@ -171,9 +173,10 @@ class AlgebraicExpress:
         """Plots the single value index graph.
         """
         title = 'Singular Value Index (Scan#: ' + self.readSpec.scan + ')'
+        U, S, V = self.dockedOpt.graph.get('svd')
         name = "Singular Value Index"
         x = self.gausFit.getVoltage()
-        y = log(self.S)
+        y = log(S)
         xLabel = "Voltage"
         yLabel = "Singular Value"
         self.PlotAlgebraicExpGraph(title, name, x, y, xLabel, yLabel)
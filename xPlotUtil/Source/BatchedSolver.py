@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Levenberg-Marquardt solver that fits all the columns of the raw data at once with numpy.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import numpy as np
+
+from xPlotUtil.Source.ModelKernels import compositeValues, compositeJacobians
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+MAX_ITERATIONS = 200
+FTOL = 1.5e-8  # Relative reduction of chi-square below which a column has converged
+XTOL = 1.5e-8  # Relative step size below which a column has converged
+GTOL = 1.0e-10  # Cosine between the residual and the Jacobian columns below which a column is at its minimum
+MAX_DAMPING = 1.0e10  # Damping above which a column has stagnated
+
+
+def evaluateModel(whichFit, peaks, x, P, out=None):
+    """Evaluates the peaks plus linear background for many columns.
+    :param whichFit: char that represents the fit
+    :param peaks: number of peaks
+    :param x: x-values as a column (nRow x 1)
+    :param P: parameters (nCol x nPar), ordered as PeakModels.paramNames
+    :param out: buffer (nRow x nCol) to evaluate into, allocated when None
+    :return: model values (nRow x nCol)
+    """
+    if out is None:
+        out = np.empty((x.shape[0], P.shape[0]))
+    return compositeValues(whichFit, peaks, x, P, out)
+
+
+def modelJacobians(whichFit, peaks, x, P, out=None):
+    """Jacobian of the model of every column.
+    :param out: buffer (nCol x nRow x nPar) to evaluate into, allocated when None
+    :return: 3D array (nCol x nRow x nPar)
+    """
+    if out is None:
+        out = np.empty((P.shape[0], x.shape[0], P.shape[1]))
+    return compositeJacobians(whichFit, peaks, x, P, out)
+
+
+def positiveWidths(peaks, P):
+    """Checks that the sigma of every peak is positive.
+    :return: boolean array (nCol)
+    """
+    return np.all(P[:, 2:3 * peaks:3] > 0, axis=1)
+
+
+def batchedLevenbergMarquardt(whichFit, peaks, x, Y, P0, vary=None, maxIterations=MAX_ITERATIONS):
+    """Fits every column of Y at the same time. The residuals and Jacobians of the columns that are still
+    iterating are stacked into 3D arrays, and the damped normal equations of all of them are solved with one
+    batched np.linalg.solve. Columns drop out as they converge, and the model and Jacobians of the remaining ones
+    are evaluated into the first columns of buffers allocated once. A column has converged when an accepted step
+    barely reduces its chi-square or barely moves it, or when its gradient vanishes. A column whose steps are
+    rejected until the damping exceeds MAX_DAMPING has stagnated, and is reported as not converged.
+    :param whichFit: 'G' (Gaussian), 'L' (Lorentzian), 'V' (Voigt) or 'P' (pseudo-Voigt)
+    :param peaks: number of peaks
+    :param x: x-values (nRow)
+    :param Y: data (nRow x nCol)
+    :param P0: starting parameters (nCol x nPar), ordered as PeakModels.paramNames
+    :param vary: boolean array (nPar), False for parameters held fixed
+    :param maxIterations: iterations before a column is given up as not converged
+    :return: best parameters, chi-square, model evaluations and convergence of each column
+    """
+    x = np.asarray(x, dtype=np.float64).reshape(-1, 1)
+    Y = np.asarray(Y, dtype=np.float64)
+    P = np.array(P0, dtype=np.float64)
+    nCol, nPar = P.shape
+    fixed = np.zeros(nPar, dtype=bool) if vary is None else ~np.asarray(vary, dtype=bool)
+    diagonalIndex = np.arange(nPar)
+
+    values = np.empty(Y.shape)
+    jacobians = np.empty((nCol, x.shape[0], nPar))
+
+    chisqr = np.sum((Y - evaluateModel(whichFit, peaks, x, P, values)) ** 2, axis=0)
+    nfev = np.ones(nCol, dtype=int)
+    success = np.zeros(nCol, dtype=bool)
+    damping = np.full(nCol, 1e-3)
+    active = np.flatnonzero(np.isfinite(chisqr) & positiveWidths(peaks, P))
+
+    for iteration in range(maxIterations):
+        if len(active) == 0:
+            break
+        Pa = P[active]
+        nActive = len(active)
+        r = Y[:, active] - evaluateModel(whichFit, peaks, x, Pa, values[:, :nActive])
+        J = modelJacobians(whichFit, peaks, x, Pa, jacobians[:nActive])
+        J[:, :, fixed] = 0
+
+        # Marquardt's damping: (JTJ + lambda diag(JTJ)) delta = JT r
+        A = np.einsum('cnp,cnq->cpq', J, J)
+        g = np.einsum('cnp,nc->cp', J, r)
+        diagonal = np.maximum(A[:, diagonalIndex, diagonalIndex], 1e-12)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cosine = np.max(np.abs(g) / np.sqrt(diagonal * chisqr[active].reshape(-1, 1)), axis=1)
+        stationary = (chisqr[active] == 0) | (cosine <= GTOL)
+        A[:, diagonalIndex, diagonalIndex] += damping[active].reshape(-1, 1) * diagonal
+        A[:, fixed, fixed] = 1
+        try:
+            delta = np.linalg.solve(A, g[:, :, np.newaxis])[:, :, 0]
+        except np.linalg.LinAlgError:
+            delta = np.array([np.linalg.lstsq(a, b, rcond=None)[0] for a, b in zip(A, g)])
+
+        trial = Pa + delta
+        trialChi = np.sum((Y[:, active] - evaluateModel(whichFit, peaks, x, trial, values[:, :nActive])) ** 2, axis=0)
+        nfev[active] += 1
+        trialChi[~positiveWidths(peaks, trial) | ~np.isfinite(trialChi)] = np.inf
+
+        better = trialChi < chisqr[active]
+        smallReduction = chisqr[active] - trialChi <= FTOL * chisqr[active]
+        smallStep = np.all(np.abs(delta) <= XTOL * (np.abs(Pa) + XTOL), axis=1)
+
+        accepted = active[better]
+        P[accepted] = trial[better]
+        chisqr[accepted] = trialChi[better]
+        damping[accepted] /= 10
+        damping[active[~better]] *= 10
+
+        converged = stationary | (better & (smallReduction | smallStep))
+        stagnated = damping[active] > MAX_DAMPING
+        success[active[converged]] = True
+        active = active[~(converged | stagnated)]
+
+    return P, chisqr, nfev, success
+
+
+def batchedStandardErrors(whichFit, peaks, x, P, chisqr, vary=None):
+    """Standard errors of the best parameters of every column, from the covariance estimated as
+    inv(JTJ) * reduced chi-square, the same estimate lmfit reports.
+    :param x: x-values (nRow)
+    :param P: best parameters (nCol x nPar)
+    :param chisqr: chi-square of every column
+    :param vary: boolean array (nPar), False for parameters held fixed
+    :return: standard errors (nCol x nPar), 0 for fixed parameters and singular columns
+    """
+    x = np.asarray(x, dtype=np.float64).reshape(-1, 1)
+    nCol, nPar = P.shape
+    vary = np.ones(nPar, dtype=bool) if vary is None else np.asarray(vary, dtype=bool)
+    J = modelJacobians(whichFit, peaks, x, P)[:, :, vary]
+    A = np.einsum('cnp,cnq->cpq', J, J)
+    stderr = np.zeros((nCol, nPar))
+    regular = np.all(np.isfinite(A), axis=(1, 2))
+    regular[regular] = np.linalg.matrix_rank(A[regular]) == vary.sum()
+    if np.any(regular):
+        redchi = chisqr[regular] / max(x.shape[0] - vary.sum(), 1)
+        covariance = np.linalg.inv(A[regular]) * redchi.reshape(-1, 1, 1)
+        variance = np.diagonal(covariance, axis1=1, axis2=2)
+        stderr[np.ix_(regular, vary)] = np.sqrt(np.maximum(variance, 0))
+    return stderr
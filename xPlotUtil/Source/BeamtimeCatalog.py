@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C SQLite catalog of the spec files and scans of a beamtime, so that a scan is found without parsing the files.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from spec2nexus.spec import is_spec_file
+
+from xPlotUtil.Source.ScanList import SCAN_RANGE, pvFileIndex, scanNumberKey
+from xPlotUtil.Source.SpecIndex import SpecIndex
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+DEFAULT_CATALOG = os.path.join(os.path.expanduser('~'), '.xPlotUtil', 'catalog.sqlite')
+SEARCH_LIMIT = 2000  # Scans returned by a search
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS specFiles (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime INTEGER,
+    directoryMtime INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS scans (
+    specFile TEXT REFERENCES specFiles(path) ON DELETE CASCADE,
+    key TEXT,
+    number INTEGER,
+    command TEXT,
+    date TEXT,
+    g1 TEXT,
+    lattice REAL,
+    lMin REAL,
+    lMax REAL,
+    points INTEGER,
+    normalizers TEXT,
+    pvFile TEXT,
+    start INTEGER,
+    stop INTEGER,
+    PRIMARY KEY (specFile, key)
+);
+CREATE INDEX IF NOT EXISTS scanNumbers ON scans (number);
+"""
+SCAN_COLUMNS = ('specFile', 'key', 'number', 'command', 'date', 'g1', 'lattice', 'lMin', 'lMax', 'points',
+                'normalizers', 'pvFile', 'start', 'stop')
+
+
+class CatalogScan(namedtuple('CatalogScan', SCAN_COLUMNS)):
+    """One scan of the catalog. normalizers is a comma separated list of the Ion_Ch_ columns, pvFile the path of
+    the PVvalue file of the scan or None, start and stop the offsets of the scan in its spec file.
+    """
+    __slots__ = ()
+
+
+def fileStamp(path):
+    """
+    :param path: file or directory
+    :return: size and modification time in ns
+    """
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def findSpecFiles(root):
+    """
+    :param root: directory of the beamtime
+    :return: paths of the spec files under root, PVvalue files skipped without reading them
+    """
+    specFiles = []
+    for directory, subdirectories, fileNames in os.walk(root):
+        subdirectories.sort()
+        for fileName in sorted(fileNames):
+            path = os.path.join(directory, fileName)
+            if not fileName.startswith("PVvalue") and is_spec_file(path):
+                specFiles.append(path)
+    return specFiles
+
+
+def pvFiles(directory):
+    """
+    :param directory: directory of a spec file
+    :return: dict of scan key to the path of its first PVvalue file
+    """
+    byScan = pvFileIndex(f for f in os.listdir(directory) if f.find("PVvalue") == 0)
+    return dict((key, os.path.join(directory, files[0])) for key, files in byScan.items())
+
+
+def scanMetadata(index, key):
+    """Parses one scan and takes what the catalog keeps of it. A scan that does not parse keeps its title and
+    offsets only.
+    :param index: SpecIndex of the spec file
+    :param key: scan key
+    :return: dict of the columns of the scan, but specFile and pvFile
+    """
+    number = scanNumberKey(key)[0]
+    command, date = index.titles.get(key, ("", ""))
+    start, stop = index.sections[key][2]
+    row = dict(key=key, number=number if isinstance(number, int) else None, command=command, date=date, g1=None,
+               lattice=None, lMin=None, lMax=None, points=None, normalizers="", start=start, stop=stop)
+    try:
+        scan = index.scan(key)
+        g1 = scan.G.get("G1")
+        if g1:
+            row['g1'] = g1
+            row['lattice'] = float(g1.split(" ")[2])  # The lattice constant ReadSpec.currentScan uses
+        row['normalizers'] = ",".join(label for label in scan.L if label.find("Ion_Ch_") == 0)
+        if scan.data:
+            row['points'] = len(next(iter(scan.data.values())))
+        L = scan.data.get("L")
+        if L:
+            row['lMin'], row['lMax'] = float(L[0]), float(L[-1])
+    except Exception:  # Kept with what the index knows, e.g. an aborted scan
+        pass
+    finally:
+        index.parsed.pop(key, None)  # The worker goes through every scan once
+    return row
+
+
+def catalogSpecFile(path, known):
+    """Indexes one spec file and parses the scans that are new or whose bytes changed. Run in a worker process.
+    :param path: spec file
+    :param known: dict of scan key to (start, stop) of the scans in the catalog
+    :return: path, (size, mtime) read, every scan key, rows of the scans parsed, error or None
+    """
+    try:
+        stamp = fileStamp(path)
+        index = SpecIndex(path)
+    except Exception as e:
+        return path, None, [], [], str(e)
+    rows = [scanMetadata(index, key) for key in index.keys if known.get(key) != index.sections[key][2]]
+    return path, stamp, list(index.keys), rows, None
+
+
+class BeamtimeCatalog:
+    """The spec files under the directories of beamtimes and the scans in them, in a SQLite database. Updating a
+    directory parses only the spec files whose size or modification time changed, in worker processes, and in
+    them only the scans whose bytes changed; the PVvalue files of a spec file are matched again when its directory
+    changed.
+    """
+
+    def __init__(self, fileName=DEFAULT_CATALOG):
+        """
+        :param fileName: database, created with its directory when needed
+        """
+        self.fileName = fileName
+        directory = os.path.dirname(fileName)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(fileName)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Closes the database.
+        """
+        self.connection.close()
+
+    def update(self, root, workers=None, progress=None):
+        """Brings the catalog of the spec files under root up to date.
+        :param root: directory of the beamtime
+        :param workers: number of worker processes, None for one per CPU
+        :param progress: function called with the spec files done and the number of them to parse, or None
+        :return: spec files parsed, spec files removed, scans parsed
+        """
+        root = os.path.abspath(root)
+        specFiles = findSpecFiles(root)
+        stamps = dict((path, (size, mtime, directoryMtime)) for path, size, mtime, directoryMtime in
+                      self.connection.execute("SELECT path, size, mtime, directoryMtime FROM specFiles"))
+
+        # Spec files gone from under root
+        prefix = os.path.join(root, '')
+        present = set(specFiles)
+        removed = [path for path in stamps if path.startswith(prefix) and path not in present]
+        with self.connection:
+            self.connection.executemany("DELETE FROM specFiles WHERE path = ?", [(path,) for path in removed])
+
+        changed = []
+        for path in specFiles:
+            try:
+                size, mtime = fileStamp(path)
+            except OSError:
+                continue
+            if stamps.get(path, (None, None))[:2] != (size, mtime):
+                changed.append(path)
+            elif stamps[path][2] != fileStamp(os.path.dirname(path))[1]:
+                self.matchPvFiles(path)  # Only PVvalue files appeared or went
+
+        scans = 0
+        if changed:
+            known = [self.knownSections(path) for path in changed]
+            context = multiprocessing.get_context('spawn')  # Forking the threads of the window is not safe
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as executor:
+                for done, result in enumerate(executor.map(catalogSpecFile, changed, known), 1):
+                    scans += self.store(*result)
+                    if progress is not None:
+                        progress(done, len(changed))
+        return len(changed), len(removed), scans
+
+    def knownSections(self, path):
+        """
+        :param path: spec file
+        :return: dict of scan key to the (start, stop) of the scans of the catalog
+        """
+        return dict((key, (start, stop)) for key, start, stop in
+                    self.connection.execute("SELECT key, start, stop FROM scans WHERE specFile = ?", (path,)))
+
+    def store(self, path, stamp, keys, rows, error):
+        """Writes the result of catalogSpecFile, in one transaction.
+        :return: number of scans written
+        """
+        directory = os.path.dirname(path)
+        try:
+            directoryMtime = fileStamp(directory)[1]
+            pvFilesByScan = pvFiles(directory)
+        except OSError:
+            directoryMtime, pvFilesByScan = None, {}
+        size, mtime = stamp if stamp is not None else (None, None)
+        with self.connection:
+            # Not INSERT OR REPLACE, which deletes the row first and its scans with it
+            if self.connection.execute("UPDATE specFiles SET size = ?, mtime = ?, directoryMtime = ?, error = ? "
+                                       "WHERE path = ?", (size, mtime, directoryMtime, error, path)).rowcount == 0:
+                self.connection.execute("INSERT INTO specFiles (path, size, mtime, directoryMtime, error) "
+                                        "VALUES (?, ?, ?, ?, ?)", (path, size, mtime, directoryMtime, error))
+            current = set(keys)
+            self.connection.executemany("DELETE FROM scans WHERE specFile = ? AND key = ?",
+                                        [(path, key) for key in self.knownSections(path) if key not in current])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO scans (%s) VALUES (%s)" % (", ".join(SCAN_COLUMNS),
+                                                                   ", ".join("?" * len(SCAN_COLUMNS))),
+                [tuple(dict(row, specFile=path, pvFile=pvFilesByScan.get(row['key']))[column]
+                       for column in SCAN_COLUMNS) for row in rows])
+            self.updatePvFiles(path, pvFilesByScan)
+        return len(rows)
+
+    def matchPvFiles(self, path):
+        """Matches the scans of a spec file to the PVvalue files of its directory again.
+        :param path: spec file
+        """
+        directory = os.path.dirname(path)
+        try:
+            directoryMtime = fileStamp(directory)[1]
+            pvFilesByScan = pvFiles(directory)
+        except OSError:
+            return
+        with self.connection:
+            self.connection.execute("UPDATE specFiles SET directoryMtime = ? WHERE path = ?", (directoryMtime, path))
+            self.updatePvFiles(path, pvFilesByScan)
+
+    def updatePvFiles(self, path, pvFilesByScan):
+        """Sets the PVvalue file of every scan of a spec file, in the transaction of the caller.
+        :param path: spec file
+        :param pvFilesByScan: dict of scan key to PVvalue file
+        """
+        self.connection.execute("UPDATE scans SET pvFile = NULL WHERE specFile = ?", (path,))
+        self.connection.executemany("UPDATE scans SET pvFile = ? WHERE specFile = ? AND key = ?",
+                                    [(pvFile, path, key) for key, pvFile in pvFilesByScan.items()])
+
+    def search(self, text="", pvOnly=False, limit=SEARCH_LIMIT):
+        """The scans matching every word of text: a scan number, a range of scan numbers such as 10-20, or a part
+        of the command, date, normalizers or spec file path of the scan.
+        :param text: words, empty for every scan
+        :param pvOnly: truth value of returning only the scans with a PVvalue file
+        :param limit: most scans returned
+        :return: list of CatalogScan, by spec file and scan number
+        """
+        conditions = []
+        values = []
+        for word in text.split():
+            scanRange = SCAN_RANGE.match(word)
+            if word.isdigit():
+                conditions.append("number = ?")
+                values.append(int(word))
+            elif scanRange is not None:
+                conditions.append("number BETWEEN ? AND ?")
+                values.extend([int(scanRange.group(1)), int(scanRange.group(2))])
+            else:
+                conditions.append("(command LIKE ? OR date LIKE ? OR normalizers LIKE ? OR specFile LIKE ?)")
+                values.extend(["%" + word + "%"] * 4)
+        if pvOnly:
+            conditions.append("pvFile IS NOT NULL")
+        query = "SELECT %s FROM scans" % ", ".join(SCAN_COLUMNS)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY specFile, number, key LIMIT ?"
+        return [CatalogScan(*row) for row in self.connection.execute(query, values + [limit])]
+
+    def counts(self):
+        """
+        :return: number of spec files and of scans in the catalog
+        """
+        return (self.connection.execute("SELECT COUNT(*) FROM specFiles").fetchone()[0],
+                self.connection.execute("SELECT COUNT(*) FROM scans").fetchone()[0])
+
+
+def main():
+    """Updates or searches the catalog from the command line, e.g.
+    python -m xPlotUtil.Source.BeamtimeCatalog update /data/2021-1
+    python -m xPlotUtil.Source.BeamtimeCatalog search --pv "ascan Ion_Ch_2 100-200"
+    """
+    parser = argparse.ArgumentParser(description="Catalog of the spec files and scans of beamtimes.")
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG, help="SQLite database (default: %(default)s)")
+    commands = parser.add_subparsers(dest='command')
+    updateParser = commands.add_parser('update', help="Catalog the spec files under directories")
+    updateParser.add_argument('directories', nargs='+')
+    updateParser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    searchParser = commands.add_parser('search', help="Print the scans matching every word")
+    searchParser.add_argument('text', nargs='?', default="")
+    searchParser.add_argument('--pv', action='store_true', help="Only the scans with a PVvalue file")
+    searchParser.add_argument('--limit', type=int, default=SEARCH_LIMIT)
+    args = parser.parse_args()
+
+    catalog = BeamtimeCatalog(args.catalog)
+    try:
+        if args.command == 'update':
+            for directory in args.directories:
+                parsed, removed, scans = catalog.update(directory, workers=args.workers)
+                print("%s: %d spec file(s) parsed, %d removed, %d scan(s) parsed" % (directory, parsed, removed,
+                                                                                   scans))
+            print("%d spec file(s), %d scan(s) in %s" % (catalog.counts() + (args.catalog,)))
+        elif args.command == 'search':
+            for scan in catalog.search(args.text, args.pv, args.limit):
+                print("%s\t#%s\t%s\t%s\t%s" % (scan.specFile, scan.key, scan.command, scan.normalizers,
+                                               scan.pvFile or ""))
+        else:
+            parser.print_help()
+    finally:
+        catalog.close()
+
+
+if __name__ == '__main__':
+    main()
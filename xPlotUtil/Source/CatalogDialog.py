@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Window searching the beamtime catalog, which opens the spec file and PVvalue file of a scan.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import os
+
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+
+from xPlotUtil.Source.BeamtimeCatalog import DEFAULT_CATALOG, SEARCH_LIMIT, BeamtimeCatalog
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+HEADINGS = ['Spec File', 'Scan', 'Command', 'Date', 'L', 'Normalizers', 'PVvalue File']
+
+
+class CatalogWorker(QThread):
+    """Thread updating the catalog of a directory, with a connection of its own.
+    """
+    progress = pyqtSignal(int, int)  # Spec files done, spec files to parse
+    updateFinished = pyqtSignal(object)  # Result of BeamtimeCatalog.update
+    updateFailed = pyqtSignal(str)
+
+    def __init__(self, fileName, root, parent=None):
+        """
+        :param fileName: catalog database
+        :param root: directory of the beamtime
+        :param parent: parent object
+        """
+        super(CatalogWorker, self).__init__(parent)
+        self.fileName = fileName
+        self.root = root
+
+    def run(self):
+        try:
+            catalog = BeamtimeCatalog(self.fileName)
+            try:
+                result = catalog.update(self.root, progress=self.progress.emit)
+            finally:
+                catalog.close()
+        except Exception as e:
+            self.updateFailed.emit(str(e))
+            return
+        self.updateFinished.emit(result)
+
+
+class CatalogDialog(QDialog):
+    """Updates the catalog of a beamtime directory in the background and lists the scans matching the search box.
+    Double clicking a scan opens its spec file, if it is not the open one, and its PVvalue file.
+    """
+
+    def __init__(self, readSpec, fileName=DEFAULT_CATALOG, parent=None):
+        """
+        :param readSpec: ReadSpec opening the scans
+        :param fileName: catalog database
+        :param parent: parent widget
+        """
+        super(CatalogDialog, self).__init__(parent)
+        self.readSpec = readSpec
+        self.fileName = fileName
+        self.catalog = BeamtimeCatalog(fileName)
+        self.worker = None
+        self.results = []
+        self.setWindowTitle("Beamtime Catalog")
+
+        self.directoryEdit = QLineEdit()
+        if self.readSpec.specFileName:
+            self.directoryEdit.setText(os.path.dirname(self.readSpec.specFileName))
+        browseBtn = QPushButton('Browse')
+        browseBtn.clicked.connect(self.browse)
+        self.updateBtn = QPushButton('Update')
+        self.updateBtn.setStatusTip("Catalogs the new and changed spec files under the directory")
+        self.updateBtn.clicked.connect(self.updateCatalog)
+        self.statusLabel = QLabel()
+
+        self.searchEdit = QLineEdit()
+        self.searchEdit.setPlaceholderText("Search: scan number, 10-20, command, date, normalizer or spec file")
+        self.searchEdit.setClearButtonEnabled(True)
+        self.searchEdit.textChanged.connect(self.search)
+        self.pvOnly = QCheckBox('With a PVvalue file only')
+        self.pvOnly.setChecked(True)
+        self.pvOnly.toggled.connect(self.search)
+
+        self.table = QTableWidget(0, len(HEADINGS))
+        self.table.setHorizontalHeaderLabels(HEADINGS)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.verticalHeader().hide()
+        self.table.cellDoubleClicked.connect(self.openScan)
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(QLabel("Directory:"))
+        hbox.addWidget(self.directoryEdit, 1)
+        hbox.addWidget(browseBtn)
+        hbox.addWidget(self.updateBtn)
+        searchBox = QHBoxLayout()
+        searchBox.addWidget(self.searchEdit, 1)
+        searchBox.addWidget(self.pvOnly)
+        vbox = QVBoxLayout()
+        vbox.addLayout(hbox)
+        vbox.addWidget(self.statusLabel)
+        vbox.addLayout(searchBox)
+        vbox.addWidget(self.table, 1)
+        self.setLayout(vbox)
+        self.resize(900, 500)
+        self.search()
+
+    def browse(self):
+        """Picks the beamtime directory.
+        """
+        directory = QFileDialog.getExistingDirectory(self, "Beamtime Directory", self.directoryEdit.text())
+        if directory:
+            self.directoryEdit.setText(directory)
+
+    def updateCatalog(self):
+        """Starts updating the catalog of the directory.
+        """
+        root = self.directoryEdit.text()
+        if not os.path.isdir(root):
+            QMessageBox.warning(self, "Error", "Please choose a directory.")
+            return
+        self.updateBtn.setEnabled(False)
+        self.statusLabel.setText("Looking for spec files under " + root)
+        self.worker = CatalogWorker(self.fileName, root, parent=self)
+        self.worker.progress.connect(self.updateProgress)
+        self.worker.updateFinished.connect(self.updateFinished)
+        self.worker.updateFailed.connect(self.updateFailed)
+        self.worker.start()
+
+    def updateProgress(self, done, total):
+        self.statusLabel.setText("%d of %d spec file(s) parsed" % (done, total))
+
+    def updateFinished(self, result):
+        parsed, removed, scans = result
+        self.updateBtn.setEnabled(True)
+        self.statusLabel.setText("%d spec file(s) parsed, %d removed, %d scan(s) parsed; %d spec file(s), %d scan(s) "
+                                 "in the catalog" % ((parsed, removed, scans) + self.catalog.counts()))
+        self.search()
+
+    def updateFailed(self, error):
+        self.updateBtn.setEnabled(True)
+        self.statusLabel.setText("")
+        QMessageBox.warning(self, "Error", "The catalog could not be updated.\n\nException: " + error)
+
+    def search(self):
+        """Lists the scans matching the search box.
+        """
+        self.results = self.catalog.search(self.searchEdit.text(), self.pvOnly.isChecked())
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(self.results))
+        for row, scan in enumerate(self.results):
+            lRange = "%g to %g" % (scan.lMin, scan.lMax) if scan.lMin is not None else ""
+            texts = [scan.specFile, scan.key, scan.command, scan.date, lRange, scan.normalizers,
+                     os.path.basename(scan.pvFile) if scan.pvFile else ""]
+            for column, text in enumerate(texts):
+                item = QTableWidgetItem(text)
+                item.setData(Qt.UserRole, row)  # Index of the result, wherever sorting moves the row
+                self.table.setItem(row, column, item)
+        self.table.setSortingEnabled(True)
+        self.table.resizeColumnsToContents()
+        if len(self.results) == SEARCH_LIMIT:
+            self.statusLabel.setText("The first %d scans are listed" % SEARCH_LIMIT)
+
+    def openScan(self, row, column):
+        """Opens the spec file of a scan, unless it is open, and the PVvalue file of the scan.
+        """
+        scan = self.results[self.table.item(row, column).data(Qt.UserRole)]
+        if scan.pvFile is None:
+            QMessageBox.warning(self, "Error", "Scan %s has no PVvalue file." % scan.key)
+            return
+        if not self.readSpec.specFileName or os.path.abspath(self.readSpec.specFileName) != scan.specFile:
+            self.readSpec.openSpec(scan.specFile)
+        sourceRows = [i for i, (key, fileName) in enumerate(self.readSpec.scanList.rows) if key == scan.key]
+        if not sourceRows:
+            QMessageBox.warning(self, "Error", "Scan %s is not in the list of %s." % (scan.key, scan.specFile))
+            return
+        self.readSpec.dockedOpt.specDataList.setCurrentRow(sourceRows[0])
+        self.readSpec.dockedOpt.openPVFile()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Steps through the columns of the data with a slider, showing the fit and residual of each column.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+from matplotlib.backends.backend_qt5 import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+import numpy as np
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+PLAY_INTERVAL = 40  # Milliseconds between columns while playing
+
+
+class ColumnViewer(QWidget):
+    """Tab with a slider over the columns of the data. The axes limits are set once from the whole data, so the
+    empty axes are cached and moving the slider only blits the lines of the new column onto them.
+    """
+
+    def __init__(self, TT, bestFit=None, rows=None, parent=None):
+        """
+        :param TT: 2D array, rows are points and columns are bins
+        :param bestFit: 2D array of the fitted curves, None before any fit
+        :param rows: slice of the rows of TT that were fitted, defaults to all of them
+        :param parent: parent widget
+        """
+        super(ColumnViewer, self).__init__(parent)
+        self.TT = TT
+        self.bestFit = bestFit
+        self.xx = np.arange(TT.shape[0])
+        self.rows = slice(0, TT.shape[0]) if rows is None else rows
+        self.background = None  # Axes without the lines, cached by onDraw
+
+        self.fig = Figure((5.0, 4.0), dpi=100)
+        self.canvas = FigureCanvas(self.fig)
+        if bestFit is None:
+            self.axes = self.fig.add_subplot(111)
+            self.residualAxes = None
+        else:
+            self.axes = self.fig.add_subplot(211)
+            self.residualAxes = self.fig.add_subplot(212, sharex=self.axes)
+        self.setLimits()
+
+        self.dataLine = self.axes.plot([], [], 'b+:', label='data', animated=True)[0]
+        self.fitLine = self.axes.plot([], [], 'r-', label='fit', animated=True)[0]
+        self.label = self.axes.text(0.02, 0.95, '', transform=self.axes.transAxes, va='top', animated=True)
+        self.artists = [self.dataLine, self.fitLine, self.label]
+        self.axes.set_ylabel('Intensity')
+        if self.residualAxes is None:
+            self.axes.set_xlabel('Bins')
+        else:
+            self.axes.legend(loc='upper right')
+            self.residualLine = self.residualAxes.plot([], [], 'g.-', animated=True)[0]
+            self.artists.append(self.residualLine)
+            self.residualAxes.axhline(0, color='k', linewidth=0.5)
+            self.residualAxes.set_xlabel('Bins')
+            self.residualAxes.set_ylabel('Residual')
+        self.canvas.mpl_connect('draw_event', self.onDraw)
+
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.setRange(0, TT.shape[1] - 1)
+        self.slider.setStatusTip("Column of the data")
+        self.slider.valueChanged.connect(self.showColumn)
+        self.playBtn = QPushButton('Play')
+        self.playBtn.setStatusTip("Steps through the columns")
+        self.playBtn.clicked.connect(self.togglePlay)
+        self.playTimer = QTimer(self)
+        self.playTimer.setInterval(PLAY_INTERVAL)
+        self.playTimer.timeout.connect(self.nextColumn)
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(self.playBtn)
+        hbox.addWidget(self.slider, 1)
+        vbox = QVBoxLayout()
+        vbox.addWidget(NavigationToolbar(self.canvas, self))
+        vbox.addWidget(self.canvas)
+        vbox.addLayout(hbox)
+        self.setLayout(vbox)
+
+        self.showColumn(0)
+
+    def setLimits(self):
+        """Fixes the limits of the axes to fit every column, so that they do not change while scrubbing.
+        """
+        low, high = np.nanmin(self.TT), np.nanmax(self.TT)
+        if self.bestFit is not None:
+            low, high = min(low, np.nanmin(self.bestFit)), max(high, np.nanmax(self.bestFit))
+        self.axes.set_xlim(self.xx[0], self.xx[-1])
+        self.axes.set_ylim(*padded(low, high))
+        if self.residualAxes is not None:
+            largest = np.nanmax(np.abs(self.TT[self.rows] - self.bestFit))
+            self.residualAxes.set_ylim(*padded(-largest, largest))
+
+    def showColumn(self, j):
+        """Puts column j into the lines and blits them.
+        :param j: column
+        """
+        self.column = j
+        yy = self.TT[:, j]
+        self.dataLine.set_data(self.xx, yy)
+        self.label.set_text("Column %d of %d" % (j, self.TT.shape[1]))
+        if self.residualAxes is not None:
+            fit = self.bestFit[:, j]
+            self.fitLine.set_data(self.xx[self.rows], fit)
+            self.residualLine.set_data(self.xx[self.rows], yy[self.rows] - fit)
+        if self.slider.value() != j:
+            self.slider.blockSignals(True)  # valueChanged would show the column a second time
+            self.slider.setValue(j)
+            self.slider.blockSignals(False)
+        self.blit()
+
+    def onDraw(self, event):
+        """Caches the empty axes after every full draw, e.g. on resize or zoom, and draws the lines on top of them.
+        """
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.drawLines()
+
+    def blit(self):
+        """Redraws only the lines over the cached axes.
+        """
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.drawLines()
+        self.canvas.blit(self.fig.bbox)
+
+    def drawLines(self):
+        """Draws the lines of the current column.
+        """
+        for artist in self.artists:
+            artist.axes.draw_artist(artist)
+
+    def togglePlay(self):
+        """Starts or stops stepping through the columns.
+        """
+        if self.playTimer.isActive():
+            self.playTimer.stop()
+            self.playBtn.setText('Play')
+        else:
+            self.playTimer.start()
+            self.playBtn.setText('Pause')
+
+    def hideEvent(self, event):
+        """Stops playing when the tab is closed or another tab is shown.
+        """
+        if self.playTimer.isActive():
+            self.togglePlay()
+        super(ColumnViewer, self).hideEvent(event)
+
+    def nextColumn(self):
+        """Shows the next column, going back to the first one after the last.
+        """
+        self.showColumn((self.column + 1) % self.TT.shape[1])
+
+
+def padded(low, high):
+    """
+    :return: limits a little wider than low..high
+    """
+    pad = 0.05 * (high - low) if high > low else 1.0
+    return low - pad, high + pad
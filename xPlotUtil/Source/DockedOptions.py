@@ -17,9 +17,12 @@ from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from pylab import *
-from spec2nexus.spec import SpecDataFile
 
 from xPlotUtil.Source.ReadSpecFile import ReadSpec
+from xPlotUtil.Source.ProcessingGraph import ProcessingGraph
+from xPlotUtil.Source.PVvalueFile import MatrixCache
+from xPlotUtil.Source.ScanList import ScanListView
+from xPlotUtil.Source.SpecIndex import specIndex
 
 
 # ---------------------------------------------------------------------------------------------------------------------#
@@ -31,6 +34,7 @@ class DockedOption(QDockWidget):
     def __init__ (self, parent=None):
         super(DockedOption, self).__init__(parent)
         self.fileName = None  # PVvalue file
+        self.matrixCache = MatrixCache()  # Parsed PVvalue files, reopened memory-mapped
 
         # Initializing other classes
         self.myMainWindow = parent
@@ -39,18 +43,83 @@ class DockedOption(QDockWidget):
         self.algebraExp = self.gausFit.algebraExp
         self.lorentFit = self.readSpec.lorentFit
 
-        # Keeps track of when the function has been apply
-        self.onePeakStat = False
-        self.twoPeakStat = False
         self.fileOpened = False
+        self.algebraicExpStat = False  # The algebraic expressions branch is in the graphing options tree
+        self.fitTopBranch = None
+        self.LFitTopBranch = None
+
+        self.graph = self.buildProcessingGraph()
+
+    def buildProcessingGraph(self):
+        """Creates the lazy processing graph. The sources are the raw data, the normalizer, the fit settings
+        (line shape and number of peaks), the lattice settings and the fit window (rows start, stop, or None for
+        every row). Every other node is computed when first needed
+        and recomputed only after one of its inputs changed.
+        :return: ProcessingGraph
+        """
+        graph = ProcessingGraph()
+        graph.addSource('raw')
+        graph.addSource('normalizer')
+        graph.addSource('fitSettings')
+        graph.addSource('latticeSettings')
+        graph.addSource('roi')
+        graph.addNode('normalized', self.normalizeData, ['raw', 'normalizer'])
+        graph.addNode('fitted', self.gausFit.fitData, ['normalized', 'normalizer', 'fitSettings', 'roi'])
+        graph.addNode('lattice', self.gausFit.latticeConstants, ['fitted', 'latticeSettings'])
+        graph.addNode('percentChange', self.gausFit.latticePercentChange, ['lattice'])
+        graph.addNode('svd', self.algebraExp.singularValueDecomposition, ['normalized'])
+        return graph
+
+    def normalizeData(self, raw, normalizer):
+        """Divides each row of the raw data by the normalizer, into a new array so the raw data is kept.
+        :param raw: 2D array of the PVvalue file, or None. Read-only when mapped from its sidecar.
+        :param normalizer: column array (nRow x 1), or None
+        :return: normalized data
+        """
+        if raw is None or normalizer is None:
+            return raw
+        return np.divide(raw, normalizer)
 
-        self.fitStat = False
-        self.LFitStat = False
-        self.normalizingStat = False
+    def resetProcessing(self):
+        """Forgets the normalizer, the fit and the lattice fit, keeping the raw data.
+        """
+        self.graph.set('normalizer', None)
+        self.graph.set('fitSettings', None)
+        self.graph.set('latticeSettings', None)
+        self.graph.set('roi', None)
         self.algebraicExpStat = False
+        self.fitTopBranch = None
+        self.LFitTopBranch = None
+        self.gausFit.closeFitPreview()
+
+    @property
+    def TT(self):
+        """2D array of the normalized data, rows are points and columns are bins.
+        """
+        data = self.graph.get('normalized')
+        if data is None:
+            return []
+        return data
 
+    @property
+    def normalizingStat(self):
+        return self.graph.peek('normalizer') is not None
 
-        self.TT = [] # 2D array where raw data is stored
+    @property
+    def fitStat(self):
+        return self.graph.peek('fitSettings') is not None
+
+    @property
+    def onePeakStat(self):
+        return self.fitStat and self.graph.peek('fitSettings')[1] == 1
+
+    @property
+    def twoPeakStat(self):
+        return self.fitStat and self.graph.peek('fitSettings')[1] == 2
+
+    @property
+    def LFitStat(self):
+        return self.graph.peek('latticeSettings') is not None
 
     # ----------------------------------Main Option Functions----------------------------------------------------------#
     def DockMainOptions(self):
@@ -90,6 +159,7 @@ class DockedOption(QDockWidget):
         layout.addRow(FileHLayout)
         layout.addRow(PVLayout)
         layout.setVerticalSpacing(20)
+        layout.addRow(self.scanFilter)
         layout.addRow(self.specDataList)
         layout.addRow(self.graphingOptionsTree)
         layout.addRow(BtnLayout)
@@ -144,10 +214,20 @@ class DockedOption(QDockWidget):
         self.GraphDataBtn.clicked.connect(self.plottingFits)
 
     def SpecDataValueList(self):
-        """This list displays the values/scans of the spec file.
+        """This list displays the values/scans of the spec file, with a box filtering them.
         """
-        self.specDataList = QListWidget()
-        self.specDataList.itemDoubleClicked.connect(self.openPVFile)
+        scanList = self.readSpec.scanList
+        self.specDataList = ScanListView()
+        self.specDataList.setModel(scanList)
+        self.specDataList.setUniformItemSizes(True)
+        self.specDataList.doubleClicked.connect(self.openPVFile)
+
+        self.scanFilter = QLineEdit(scanList.filterText)
+        self.scanFilter.setPlaceholderText("Filter: scan number, 10-20, command or date")
+        self.scanFilter.setStatusTip("Shows the scans matching every word")
+        self.scanFilter.setClearButtonEnabled(True)
+        self.scanFilter.textChanged.connect(scanList.setFilter)
+        scanList.filterChanged.connect(self.scanFilter.setText)
 
     # ----------------------------------Opening PVvalue file and such--------------------------------------------------#
     def openPVFile(self):
@@ -169,52 +249,49 @@ class DockedOption(QDockWidget):
 
         # Makes sure a file has been opened before changing attributes to orginal value
         if os.path.isfile(self.fileName) == True:
+            self.myMainWindow.streamingFitAction.setChecked(False)
             self.mainOptions.close()
             self.DockMainOptions()
             self.specFileInfo()
             self.myMainWindow.latticeFitAction.setEnabled(False)
             self.specDataList.setCurrentRow(self.readSpec.currentRow)
-            self.onePeakStat = False
-            self.twoPeakStat = False
-            self.normalizingStat = False
-            self.fitStat = False
-            self.LFitStat = False
-            self.algebraicExpStat = False
+            self.resetProcessing()
             self.rdOnlyScanSelected.setStatusTip(self.fileName)
             self.rdOnlyScanSelected.setText(self.fileName)
             self.fileOpened = True
-            self.gausFit.continueGraphingEachFit = True
             self.loadFile()
 
     def loadFile(self):
-        """This method is used to load the PVvalue file into an array. Displays error message, if file could
-        not be loaded into 2d array.
+        """This method is used to load the PVvalue file into an array, without its empty bins. The file is only
+        parsed the first time, later loads map its sidecar read-only, and a prefetched file is already in memory.
+        Displays error message, if file could not be loaded into 2d array.
         """
         try:
-            data = np.loadtxt(open(self.fileName))
-            nRow = data.shape[0]  # Gets the number of rows
-            nCol = data.shape[1]  # Gets the number of columns
-            x = 0
-            for f in range(nCol):
-                if (np.mean(data[:, f]) == 0):
-                    break
-                else:
-                    x += 1
-            nCol = x
-
-            self.TT = np.zeros((nRow, nCol))
-
-            for i in range(nCol):
-                self.TT[:, i] = data[:, i]
+            prefetched = self.readSpec.prefetcher.take(self.fileName)
+            if prefetched is not None:
+                self.graph.set('raw', prefetched.TT)
+            else:
+                self.graph.set('raw', self.matrixCache.load(self.fileName))
         except:
             QMessageBox.warning(self.myMainWindow, "Warning", "Please make sure the PVvalue file follows the "
                                                               "appropriate format. There should be an equal amount of "
                                                               "rows and columns.")
+            self.graph.set('raw', None)
             self.mainOptions.close()
             self.DockMainOptions()
             self.specFileInfo()
             self.fileOpened = False
 
+    def clearMatrixCache(self):
+        """Deletes the sidecars of the parsed PVvalue files. The open file keeps the matrix it has.
+        """
+        size = self.matrixCache.size()
+        self.matrixCache.clear()
+        if self.matrixCache.error is not None:
+            self.myMainWindow.myStatusBar.showMessage("Matrix cache partly cleared: " + self.matrixCache.error, 10000)
+        else:
+            self.myMainWindow.myStatusBar.showMessage("Matrix cache cleared, %.1f MB freed" % (size / 1e6), 5000)
+
     def fileInfo(self):
         """ This method returns the points (rows) and bins (columns) from the raw data file sheet.
         :return: Number of points and bins
@@ -226,12 +303,12 @@ class DockedOption(QDockWidget):
 
     def specFileInfo(self):
         """This method sets the name, status tip for the spec file, and loads the scan to the list
-        from the spec file.
+        from the spec file. The index of the spec file is reused until the file changes, and the scans are only
+        parsed when they are opened.
         """
         self.rdOnlyFileName.setText(self.readSpec.specFileName)
         self.rdOnlyFileName.setStatusTip(self.readSpec.specFileName)
-        specFile = SpecDataFile(self.readSpec.specFileName)
-        self.readSpec.loadScans(specFile.scans)
+        self.readSpec.loadScans(specIndex(self.readSpec.specFileName).scans)
 
     # ------------------------------------What Peak?-------------------------------------------------------------------#
     def WhichPeakGaussianFit(self):
@@ -244,7 +321,7 @@ class DockedOption(QDockWidget):
             if ans == 'N':
                 pass
             else:
-                self.openFile(self.fileName)
+                self.resetFit()
                 if self.FileError() == False and self.fitStat == False:
                     chosePeak = self.PeakDialog()
                     if (chosePeak == 'One'):
@@ -259,6 +336,22 @@ class DockedOption(QDockWidget):
                 elif (chosePeak == 'Two'):
                     self.gausFit.TwoPeakGaussianFit()
 
+    def resetFit(self):
+        """Forgets the fit and the lattice fit, and removes their branches from the graphing options tree. The raw
+        data and the normalizer are kept.
+        """
+        for branch in (self.fitTopBranch, self.LFitTopBranch):
+            if branch is not None:
+                index = self.graphingOptionsTree.indexOfTopLevelItem(branch)
+                if index != -1:
+                    self.graphingOptionsTree.takeTopLevelItem(index)
+        self.fitTopBranch = None
+        self.LFitTopBranch = None
+        self.graph.set('fitSettings', None)
+        self.graph.set('latticeSettings', None)
+        self.gausFit.closeFitPreview()
+        self.myMainWindow.latticeFitAction.setEnabled(False)
+
     def PeakDialog(self):
         """Method that creates a dialog, so that the user can peak the number of peaks.
         :return: Number of peaks
@@ -289,21 +382,19 @@ class DockedOption(QDockWidget):
         """
         self.mainOptions.close()
         self.DockMainOptions()
-        self.gausFit.continueGraphingEachFit = True
 
         self.myMainWindow.latticeFitAction.setEnabled(False)
 
+        self.myMainWindow.followAction.setChecked(False)
+        self.myMainWindow.streamingFitAction.setChecked(False)
         self.readSpec.specFileOpened = False
         self.readSpec.specFileName = None
+        self.readSpec.prefetcher.clear()
 
         self.fileName = None
-        self.onePeakStat = False
-        self.twoPeakStat = False
         self.fileOpened = False
-        self.fitStat = False
-        self.LFitStat = False
-        self.normalizingStat = False
-        self.algebraicExpStat = False
+        self.resetProcessing()
+        self.graph.set('raw', None)
 
         # Closes and removes the graphs created
         index = len(self.myMainWindow.canvasArray)
@@ -390,7 +481,6 @@ class DockedOption(QDockWidget):
             self.weightingBranch.setCheckState(0, Qt.Unchecked)
 
             self.algebraicExpStat = True
-            self.algebraExp.singularValueDecomposition()
             self.graphingOptionsTree.addTopLevelItem(self.algebraicExpTopBranch)
 
     def GraphingFitOptionsTree(self, fit):
@@ -402,6 +492,8 @@ class DockedOption(QDockWidget):
             name = 'Lorentzian Fit'
         elif fit == 'V':
             name = 'Voigt Fit'
+        elif fit == 'P':
+            name = 'Pseudo-Voigt Fit'
 
         self.fitTopBranch = QTreeWidgetItem()
         self.fitTopBranch.setText(0, name)
@@ -562,9 +654,7 @@ class DockedOption(QDockWidget):
 
             # Adding the top branch to the graphing options tree
             self.graphingOptionsTree.addTopLevelItem(self.LFitTopBranch)
-            self.gausFit.doLFit()
-            self.gausFit.doLFitPercentChange()
-            self.LFitStat = True
+            self.graph.set('latticeSettings', (self.readSpec.lElement, self.readSpec.lMin, self.readSpec.lMax))
 
     # ------------------------------------------Plotting Methods-------------------------------------------------------#
     def plottingFits(self):
@@ -591,7 +681,9 @@ class DockedOption(QDockWidget):
                     if self.weightingBranch.checkState(0) == 2:
                         self.algebraExp.plotWeightingExp()
                         self.weightingBranch.setCheckState(0, 0)
-                # Gaussian Fit
+                # Gaussian Fit, once it is redone if the data changed
+                if self.fitStat and not self.gausFit.fitReady():
+                    return
                 if self.onePeakStat == True:
                     self.graphingOnePeak()
                 elif self.twoPeakStat == True:
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C On-disk cache of the fit of each column, keyed by the column data and the fit settings. Headless, like FitEngine.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import numpy as np
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+CACHE_VERSION = 2  # Bumped whenever the layout of a record or the meaning of a fit changes
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.xPlotUtil', 'fitCache')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+QUERY_SIZE = 500  # Keys per SELECT, below the SQLite limit on host parameters
+
+
+class FitCache:
+    """Content-addressed cache of column fits. Each record holds the parameters and statistics of one column of a
+    FitResultStore, stored as raw float64 bytes in an SQLite table. The least recently used records are dropped
+    once the records take more than maxBytes. A connection is opened per call, so the cache can be used from any
+    thread.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, maxBytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: directory of the cache database, created when needed
+        :param maxBytes: size cap of the records
+        """
+        self.directory = directory
+        self.fileName = os.path.join(directory, 'fits.sqlite')
+        self.maxBytes = maxBytes
+        self.error = None  # Last database error, the fits carry on without the cache
+        self.hits = 0  # Columns found by the last lookup
+        self.misses = 0  # Columns missing from the last lookup
+
+    def connect(self):
+        """Opens the database, creating it the first time.
+        :return: sqlite3 connection
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        connection = sqlite3.connect(self.fileName, timeout=10)
+        connection.execute("CREATE TABLE IF NOT EXISTS fits (key TEXT PRIMARY KEY, record BLOB, size INTEGER, "
+                           "used REAL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS fitsUsed ON fits (used)")
+        return connection
+
+    def columnKeys(self, TT, normalizer, settings):
+        """Hashes every column together with the normalizer and the fit settings.
+        :param TT: 2D array, rows are points and columns are bins
+        :param normalizer: array the raw data was divided by, or None
+        :param settings: tuple describing the model and the solver
+        :return: list of hex digests, one per column
+        """
+        common = hashlib.sha1(repr((CACHE_VERSION, TT.shape[0]) + tuple(settings)).encode('utf-8'))
+        if normalizer is not None:
+            common.update(np.ascontiguousarray(normalizer, dtype=np.float64).tobytes())
+        keys = []
+        for j in range(TT.shape[1]):
+            h = common.copy()
+            h.update(np.ascontiguousarray(TT[:, j], dtype=np.float64).tobytes())
+            keys.append(h.hexdigest())
+        return keys
+
+    def lookup(self, keys):
+        """Finds the records of the given keys and marks them as used.
+        :param keys: list of column keys
+        :return: dictionary key -> record (1D float64 array)
+        """
+        found = {}
+        self.error = None
+        try:
+            with closing(self.connect()) as connection:
+                for start in range(0, len(keys), QUERY_SIZE):
+                    batch = keys[start:start + QUERY_SIZE]
+                    rows = connection.execute("SELECT key, record FROM fits WHERE key IN (%s)" %
+                                              ",".join("?" * len(batch)), batch).fetchall()
+                    for key, record in rows:
+                        found[key] = np.frombuffer(record, dtype=np.float64)
+                now = time.time()
+                connection.executemany("UPDATE fits SET used = ? WHERE key = ?", [(now, key) for key in found])
+                connection.commit()
+        except (sqlite3.Error, OSError) as e:
+            self.error = str(e)
+        self.hits = len(found)
+        self.misses = len(keys) - self.hits
+        return found
+
+    def insert(self, keys, records):
+        """Stores new records, then drops the least recently used ones above the size cap.
+        :param keys: list of column keys
+        :param records: 2D float64 array, one record per key
+        """
+        now = time.time()
+        rows = [(key, sqlite3.Binary(np.ascontiguousarray(record, dtype=np.float64).tobytes()), record.nbytes, now)
+                for key, record in zip(keys, records)]
+        try:
+            with closing(self.connect()) as connection:
+                connection.executemany("INSERT OR REPLACE INTO fits VALUES (?, ?, ?, ?)", rows)
+                self.evict(connection)
+                connection.commit()
+        except (sqlite3.Error, OSError) as e:
+            self.error = str(e)
+
+    def evict(self, connection):
+        """Deletes the least recently used records until the records fit in maxBytes.
+        :param connection: open sqlite3 connection
+        """
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM fits").fetchone()[0]
+        if total <= self.maxBytes:
+            return
+        stale = []
+        for key, size in connection.execute("SELECT key, size FROM fits ORDER BY used"):
+            if total <= self.maxBytes:
+                break
+            stale.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM fits WHERE key = ?", stale)
+
+    def clear(self):
+        """Deletes every record.
+        """
+        try:
+            with closing(self.connect()) as connection:
+                connection.execute("DELETE FROM fits")
+                connection.commit()
+                connection.execute("VACUUM")
+        except (sqlite3.Error, OSError) as e:
+            self.error = str(e)
+
+    def summary(self):
+        """
+        :return: hits and misses of the last lookup
+        """
+        line = "cache: %d hit(s), %d miss(es)" % (self.hits, self.misses)
+        if self.error is not None:
+            line += " (cache unavailable: %s)" % self.error
+        return line
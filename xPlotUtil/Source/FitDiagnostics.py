@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Heatmap and table of the per column statistics of a fit, to find the slow or bad columns of a scan.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+from PyQt5.QtCore import *
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import *
+from matplotlib.backends.backend_qt5 import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+import numpy as np
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+# Statistic of the store, heading, and whether large values are bad
+DIAGNOSTICS = [('success', 'Converged', False), ('chisqr', 'Chi-square', True), ('redchi', 'Reduced chi-square', True),
+               ('rsquared', 'R²', False), ('nfev', 'Function evaluations', True),
+               ('wallTime', 'Wall time (ms)', True), ('retries', 'Retries', True), ('flagged', 'Flagged', True)]
+FLAGGED_COLOR = QColor(255, 220, 220)
+
+
+def badness(values, largeIsBad):
+    """Ranks the columns by one statistic, so that statistics of different scales share the colours of the heatmap.
+    :param values: statistic of every column
+    :param largeIsBad: truth value of large values being bad
+    :return: array (nCol) from 0 (best) to 1 (worst), 1 where the statistic is not finite
+    """
+    values = np.where(np.isfinite(values), values, np.nan)
+    if not largeIsBad:
+        values = -values
+    finite = np.isfinite(values)
+    rank = np.ones(len(values))
+    if finite.sum() > 1 and np.ptp(values[finite]) > 0:
+        # Ties, e.g. of the boolean statistics, share the rank of the lowest of them
+        sortedValues = np.sort(values[finite])
+        rank[finite] = np.searchsorted(sortedValues, values[finite]) / float(finite.sum() - 1)
+    elif finite.any():
+        rank[finite] = 0
+    return rank
+
+
+class FitDiagnosticsView(QWidget):
+    """Tab with one heatmap row per statistic over the columns of a fit, and a sortable table of the statistics
+    below it. Clicking the heatmap selects the column in the table.
+    """
+
+    def __init__(self, store, parent=None):
+        """
+        :param store: FitResultStore of the fit
+        :param parent: parent widget
+        """
+        super(FitDiagnosticsView, self).__init__(parent)
+        self.store = store
+        values = [self.values(name) for name, heading, largeIsBad in DIAGNOSTICS]
+
+        self.fig = Figure((5.0, 2.5), dpi=100)
+        self.canvas = FigureCanvas(self.fig)
+        self.axes = axes = self.fig.add_subplot(111)
+        heat = np.array([badness(v, largeIsBad) for v, (name, heading, largeIsBad) in zip(values, DIAGNOSTICS)])
+        image = axes.imshow(heat, aspect='auto', interpolation='nearest', cmap='viridis', vmin=0, vmax=1)
+        axes.set_yticks(range(len(DIAGNOSTICS)))
+        axes.set_yticklabels([heading for name, heading, largeIsBad in DIAGNOSTICS], fontsize=8)
+        axes.set_xlabel('Column')
+        self.fig.colorbar(image, ax=axes).set_label('Worse')
+        self.fig.tight_layout()
+        self.canvas.mpl_connect('button_press_event', self.onClick)
+
+        self.table = QTableWidget(store.nCol, len(DIAGNOSTICS) + 1)
+        self.table.setHorizontalHeaderLabels(['Column'] + [heading for name, heading, largeIsBad in DIAGNOSTICS])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.verticalHeader().hide()
+        self.columnItems = []
+        flagged = store.flagged
+        for j in range(store.nCol):
+            items = [self.item(j)] + [self.item(v[j]) for v in values]
+            for k, item in enumerate(items):
+                if flagged[j]:
+                    item.setBackground(FLAGGED_COLOR)
+                self.table.setItem(j, k, item)
+            self.columnItems.append(items[0])
+        self.table.setSortingEnabled(True)
+        self.table.resizeColumnsToContents()
+
+        self.flaggedOnly = QCheckBox('Flagged columns only')
+        self.flaggedOnly.setStatusTip("Hides the columns that are not flagged")
+        self.flaggedOnly.toggled.connect(self.showFlaggedOnly)
+
+        splitter = QSplitter(Qt.Vertical)
+        graph = QWidget()
+        vbox = QVBoxLayout()
+        vbox.addWidget(NavigationToolbar(self.canvas, graph))
+        vbox.addWidget(self.canvas)
+        graph.setLayout(vbox)
+        splitter.addWidget(graph)
+        splitter.addWidget(self.table)
+        vbox = QVBoxLayout()
+        vbox.addWidget(QLabel(self.summary()))
+        vbox.addWidget(self.flaggedOnly)
+        vbox.addWidget(splitter, 1)
+        self.setLayout(vbox)
+
+    def values(self, name):
+        """
+        :param name: one of the statistics of DIAGNOSTICS
+        :return: statistic of every column, as shown in the table
+        """
+        values = self.store.stat(name)
+        if name == 'wallTime':
+            return 1000 * values
+        return values
+
+    def item(self, value):
+        """Table cell that sorts by number, showing whole numbers without decimals.
+        :param value: number
+        :return: QTableWidgetItem
+        """
+        value = float(value)
+        item = QTableWidgetItem()
+        item.setData(Qt.DisplayRole, int(value) if value.is_integer() else value)
+        return item
+
+    def summary(self):
+        """
+        :return: line with the totals of the diagnostics
+        """
+        store = self.store
+        slowest = int(np.argmax(store.wallTime))
+        return ("%d columns: %d not converged, %d retried, %d flagged; median R² %.4f; %.2f s fitting, slowest "
+                "column %d (%.1f ms, %d function evaluations)" % (
+                    store.nCol, (~store.success).sum(), (store.retries > 0).sum(), store.flagged.sum(),
+                    np.nanmedian(store.rsquared) if np.isfinite(store.rsquared).any() else np.nan,
+                    store.wallTime.sum(), slowest, 1000 * store.wallTime[slowest], store.nfev[slowest]))
+
+    def onClick(self, event):
+        """Selects the clicked column in the table.
+        """
+        if event.inaxes is not self.axes or event.xdata is None:
+            return
+        j = int(round(event.xdata))
+        if 0 <= j < self.store.nCol:
+            self.selectColumn(j)
+
+    def selectColumn(self, j):
+        """Selects and shows the row of a column in the table, wherever sorting moved it.
+        :param j: column
+        """
+        if self.table.isRowHidden(self.columnItems[j].row()):
+            self.flaggedOnly.setChecked(False)
+        self.table.selectRow(self.columnItems[j].row())
+        self.table.scrollToItem(self.columnItems[j])
+
+    def showFlaggedOnly(self, checked):
+        """Hides or shows the rows of the columns that are not flagged.
+        """
+        flagged = self.store.flagged
+        for j, item in enumerate(self.columnItems):
+            self.table.setRowHidden(item.row(), checked and not flagged[j])
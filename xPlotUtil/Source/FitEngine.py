@@ -0,0 +1,696 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Headless fitting engine. Nothing in this module may import PyQt, so that it can run inside worker processes.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from lmfit.models import LinearModel
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8, columns are pickled instead
+    shared_memory = None
+
+from xPlotUtil.Source.PeakModels import PEAK_MODELS, peakPrefixes, paramNames
+from xPlotUtil.Source.ModelKernels import modelJacobian
+from xPlotUtil.Source.PeakSeeding import seedColumns
+from xPlotUtil.Source.BatchedSolver import batchedLevenbergMarquardt, batchedStandardErrors, evaluateModel
+from xPlotUtil.Source.FitResultStore import FitResultStore, rSquared, storeSize
+from xPlotUtil.Source.ModelSelection import CANDIDATES, ModelSelection, candidateName
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+CHI_JUMP = 4.0  # A warm started fit is redone cold when its reduced chi-square grows by more than this factor
+OUTLIER_MADS = 5.0  # Robust deviations of log reduced chi-square above the median that make a column an outlier
+MIN_OUTLIER_COLUMNS = 8  # Fewer fitted columns than this are only checked for failures, not for outliers
+RETRY_WIDTHS = (0.5, 2.0)  # Factors applied to the seed widths when a flagged column is retried
+BOOTSTRAP_SAMPLES = 100  # Resampled refits per column when bootstrapping the errors
+
+
+class FitCancelled(Exception):
+    """Raised by the engine when FitEngine.cancel was called during a fit.
+    """
+    pass
+
+
+def buildModel(whichFit, peaks):
+    """Builds the composite model, one or two peaks of the given line shape plus a linear background.
+    :param whichFit: 'G' (Gaussian), 'L' (Lorentzian), 'V' (Voigt) or 'P' (pseudo-Voigt)
+    :param peaks: number of peaks
+    :return: lmfit model
+    """
+    mod = LinearModel()
+    for prefix in reversed(peakPrefixes(peaks)):
+        mod = PEAK_MODELS[whichFit](prefix=prefix) + mod
+    return mod
+
+
+def seedParams(mod, whichFit, peaks, seed):
+    """Creates the parameters of the model from a row of the seed matrix.
+    :param mod: composite model from buildModel
+    :param whichFit: char that represents the fit
+    :param peaks: number of peaks
+    :param seed: starting values ordered as PeakModels.paramNames
+    :return: lmfit parameters
+    """
+    pars = mod.make_params()
+    for name, value, vary in zip(paramNames(peaks), seed, varyingParams(whichFit, peaks)):
+        pars[name].set(value=value, vary=vary)
+    return pars
+
+
+def varyingParams(whichFit, peaks):
+    """Which parameters of PeakModels.paramNames are fitted. The two peak Voigt and pseudo-Voigt fits keep the
+    background slope fixed.
+    :param whichFit: char that represents the fit
+    :param peaks: number of peaks
+    :return: boolean array
+    """
+    vary = np.ones(len(paramNames(peaks)), dtype=bool)
+    vary[-2] = not (whichFit in ('V', 'P') and peaks == 2)
+    return vary
+
+
+def fitFailed(out, previousRedchi):
+    """Checks whether a warm started fit has to be redone from the cold seed.
+    :param out: lmfit model result
+    :param previousRedchi: reduced chi-square of the previous column
+    :return: truth value
+    """
+    if not out.success or not np.isfinite(out.redchi):
+        return True
+    return previousRedchi is not None and out.redchi > CHI_JUMP * previousRedchi
+
+
+def standardErrors(out, names):
+    """Standard errors of the parameters of an lmfit result, estimated from its covariance.
+    :param out: lmfit model result
+    :param names: parameter names
+    :return: list of errors, 0 where the covariance could not be estimated
+    """
+    errors = []
+    for name in names:
+        stderr = out.params[name].stderr
+        errors.append(stderr if stderr is not None and np.isfinite(stderr) else 0.0)
+    return errors
+
+
+def flaggedColumns(store):
+    """Columns whose fit failed or did not converge, or whose reduced chi-square is an outlier among the columns
+    of the store.
+    :param store: FitResultStore
+    :return: boolean array (nCol)
+    """
+    redchi = store.redchi
+    flagged = ~store.success | ~np.isfinite(redchi)
+    good = np.flatnonzero(~flagged & (redchi > 0))
+    if len(good) >= MIN_OUTLIER_COLUMNS:
+        logs = np.log(redchi[good])
+        median = np.median(logs)
+        spread = 1.4826 * np.median(np.abs(logs - median))
+        if spread > 0:
+            flagged[good] = logs > median + OUTLIER_MADS * spread
+    return flagged
+
+
+def alternativeSeeds(store, flagged, seeds, j):
+    """Starting values a flagged column is retried from: the best values of the nearest column on each side that is
+    not flagged, and its own seed with narrower and wider peaks. The best values are not moved by the change of the
+    seeds as in the warm starts, since the seed of the column is what may be wrong.
+    :param store: FitResultStore of the fit
+    :param flagged: boolean array from flaggedColumns
+    :param seeds: seed matrix of the fit
+    :param j: column
+    :return: list of seed rows
+    """
+    good = np.flatnonzero(~flagged)
+    candidates = [store.params[k, :, 0].copy() for k in np.concatenate([good[good < j][-1:], good[good > j][:1]])]
+    for factor in RETRY_WIDTHS:
+        seed = seeds[j].copy()
+        seed[2:3 * store.peaks:3] *= factor
+        candidates.append(seed)
+    return candidates
+
+
+def _fitChunk(TT, start, stop, whichFit, peaks, seeds, options, store, columnDone=None):
+    """Fits the columns start..stop-1 of TT and writes the results into the store. The composite model is
+    built once per chunk. With continuation, each column starts from the best values of the previous one and
+    only falls back to its own seed when that fit fails or its chi-square jumps.
+    :param seeds: starting values of the columns start..stop-1 only
+    :param options: dictionary from FitEngine.options
+    :param store: FitResultStore with the columns of TT
+    :param columnDone: function called with the index of each column once it is stored, None in the workers
+    """
+    xx = np.arange(0, TT.shape[0])
+    mod = buildModel(whichFit, peaks)
+    pars = seedParams(mod, whichFit, peaks, seeds[0])
+    names = paramNames(peaks)
+    continuation = options['continuation']
+    fitKws = None
+    if options['analyticJacobian']:
+        fitKws = {'Dfun': modelJacobian(whichFit, peaks), 'col_deriv': 1}
+
+    previous = None
+    for j in range(start, stop):
+        yy = TT[:, j]
+        nfev = 0
+        out = None
+        began = time.perf_counter()
+        try:
+            if continuation and previous is not None:
+                # Previous best values, moved by how much the seeds changed between the two columns
+                for i, name in enumerate(names):
+                    pars[name].set(value=previous.params[name].value + seeds[j - start, i] - seeds[j - start - 1, i])
+                out = mod.fit(yy, pars, x=xx, fit_kws=fitKws)
+                nfev += out.nfev
+                warm = not fitFailed(out, previous.redchi)
+            if out is None or not warm:
+                for name, value in zip(names, seeds[j - start]):
+                    pars[name].set(value=value)
+                cold = mod.fit(yy, pars, x=xx, fit_kws=fitKws)
+                nfev += cold.nfev
+                warm = out is not None and out.success and out.chisqr < cold.chisqr
+                if not warm:
+                    out = cold
+        except Exception:
+            # A column that cannot be fitted at all, e.g. one with NaN values, is stored as failed instead of
+            # stopping the fit, and is retried by FitEngine.retryFlagged
+            store.setColumn(j, seeds[j - start], np.zeros(len(names)), np.nan, np.nan, nfev, False, False, np.nan,
+                            time.perf_counter() - began, np.nan)
+            previous = None
+        else:
+            store.setColumn(j, [out.best_values[name] for name in names], standardErrors(out, names), out.chisqr,
+                            out.redchi, nfev, out.success, warm, float(rSquared(yy, out.chisqr)),
+                            time.perf_counter() - began, out.best_fit)
+            previous = out if out.success else None
+        if columnDone is not None:
+            columnDone(j)
+
+
+def _fitSharedChunk(names, shape, start, stop, whichFit, peaks, seeds, options):
+    """Worker entry point. Attaches to the shared memory blocks of the raw data and of the store created by the
+    engine and fits a chunk of columns in place, so neither the raw data nor the results are pickled.
+    """
+    nRow, nCol = shape
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    try:
+        TT = np.ndarray((nRow, nCol), dtype=np.float64, buffer=blocks[0].buf)
+        store = FitResultStore(nRow, nCol, whichFit, peaks, buffer=blocks[1].buf)
+        _fitChunk(TT, start, stop, whichFit, peaks, seeds, options, store)
+        del TT, store
+    finally:
+        for block in blocks:
+            block.close()
+
+
+def _bootstrapChunk(TT, bestFit, P, whichFit, peaks, samples, seed):
+    """Worker entry point. Estimates the standard errors of the fits of some columns by a residual bootstrap: each
+    sample adds the residuals of the column, drawn with replacement, to its fitted curve and is refitted starting
+    from the best values, so it converges in a few iterations. The samples of all the columns are refitted
+    together with the batched solver.
+    :param TT: data of the columns
+    :param bestFit: fitted curves of the columns
+    :param P: best values of the columns (nCol x nPar)
+    :param samples: resamples per column
+    :param seed: seed of the random generator
+    :return: standard deviation of each parameter over the samples (nCol x nPar)
+    """
+    nRow, nCol = TT.shape
+    rng = np.random.RandomState(seed)
+    residuals = TT - bestFit
+    draws = rng.randint(0, nRow, size=(samples, nRow, nCol))
+    Y = bestFit + np.take_along_axis(residuals[np.newaxis], draws, axis=1)  # samples x nRow x nCol
+    Y = Y.transpose(1, 0, 2).reshape(nRow, samples * nCol)
+    vary = varyingParams(whichFit, peaks)
+    PB, chisqr, nfev, success = batchedLevenbergMarquardt(whichFit, peaks, np.arange(nRow), Y,
+                                                          np.tile(P, (samples, 1)), vary)
+    PB[~success] = np.nan
+    PB = PB.reshape(samples, nCol, -1)
+    with np.errstate(invalid='ignore'):
+        errors = np.nanstd(PB, axis=0, ddof=1)
+    errors[:, ~vary] = 0.0
+    return np.where(np.isfinite(errors), errors, 0.0)
+
+
+def _fitPickledChunk(TT, start, stop, whichFit, peaks, seeds, options):
+    """Worker entry point used when shared memory is not available.
+    """
+    nRow, nCol = TT.shape
+    store = FitResultStore(nRow, nCol, whichFit, peaks)
+    _fitChunk(TT, 0, nCol, whichFit, peaks, seeds, options, store)
+    return start, stop, store.arrays()
+
+
+class FitEngine:
+    """Fits every column of a 2D array independently, fanning the columns out over a process pool.
+    """
+
+    def __init__(self, maxWorkers=None, chunkSize=None, continuation=True, analyticJacobian=True, solver='lmfit',
+                 storeFile=None, cache=None, bootstrapSamples=0):
+        """
+        :param maxWorkers: number of worker processes, defaults to the number of CPUs. 1 fits in process.
+        :param chunkSize: columns handed to a worker at a time, defaults to about four chunks per worker
+        :param continuation: warm start each column from the previous one within a chunk
+        :param analyticJacobian: pass the analytic derivatives of the model to the solver
+        :param solver: 'lmfit' fits column by column on the process pool, 'fast' fits all the columns at once
+        with BatchedSolver in this process
+        :param storeFile: file that backs the results with a memory map, for scans too wide for memory. None
+        keeps them in memory. fitCandidates adds the name of each candidate to it, e.g. fit.store.G1.
+        :param cache: FitCache that repeated fits of the same columns are read from, None always fits
+        :param bootstrapSamples: resampled refits per column used for the standard errors, 0 takes them from the
+        covariance of each fit
+        """
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.chunkSize = chunkSize
+        self.continuation = continuation
+        self.analyticJacobian = analyticJacobian
+        self.solver = solver
+        self.storeFile = storeFile
+        self.cache = cache
+        self.bootstrapSamples = bootstrapSamples
+        self.bootstrapSeed = 0
+        self.executor = None
+        self.fitLog = []  # One summary line per fit
+        self.cancelled = threading.Event()  # Set by cancel, from any thread
+
+    def getExecutor(self):
+        """Creates the process pool the first time it is needed, and reuses it afterwards. The workers are spawned,
+        not forked: the pool is created from a FitWorker thread while the prefetcher and the follower run, and a
+        forked child can deadlock on a lock one of those threads held.
+        :return: the process pool executor
+        """
+        if self.executor is None:
+            context = multiprocessing.get_context('spawn')
+            self.executor = ProcessPoolExecutor(max_workers=self.maxWorkers, mp_context=context)
+        return self.executor
+
+    def shutdown(self):
+        """Stops the worker processes.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def cancel(self):
+        """Asks the running fit to stop. The columns fitted so far are kept in the cache, and the fit raises
+        FitCancelled. Chunks already running on the process pool finish first.
+        """
+        self.cancelled.set()
+
+    def options(self):
+        """Fit settings handed to the workers.
+        :return: dictionary of settings
+        """
+        return {'continuation': self.continuation, 'analyticJacobian': self.analyticJacobian}
+
+    def chunks(self, nCol):
+        """Splits the columns into contiguous chunks.
+        :param nCol: number of columns
+        :return: list of (start, stop)
+        """
+        size = self.chunkSize or max(1, int(np.ceil(nCol / (4.0 * self.maxWorkers))))
+        return [(start, min(start + size, nCol)) for start in range(0, nCol, size)]
+
+    def fitColumns(self, TT, whichFit='G', peaks=1, normalizer=None, progress=None, seeds=None):
+        """Fits each column of TT. Columns found in the cache are read from it, and only the others are fitted.
+        :param TT: 2D array, rows are points and columns are bins
+        :param whichFit: 'G' (Gaussian), 'L' (Lorentzian), 'V' (Voigt) or 'P' (pseudo-Voigt)
+        :param peaks: number of peaks, 1 or 2
+        :param normalizer: array the raw data was divided by, or None. Part of the cache key.
+        :param progress: function called with the store and a list of columns whenever those columns are done,
+        from the thread running the fit. None reports nothing.
+        :param seeds: starting values of the columns (nCol x nPar) instead of those of PeakSeeding.seedColumns,
+        e.g. the fit of the same columns before more rows were added. Such fits bypass the cache.
+        :return: FitResultStore with the results of every column
+        """
+        self.cancelled.clear()
+        return self.finishFit(self.startFit(TT, whichFit, peaks, normalizer, progress, seeds))
+
+    def fitCandidates(self, TT, candidates=CANDIDATES, normalizer=None, criterion='bic', progress=None):
+        """Fits every column with each candidate model and picks the best model of each column. The chunks of all
+        the candidates are queued on the process pool together, so they run concurrently.
+        :param TT: 2D array, rows are points and columns are bins
+        :param candidates: list of (whichFit, peaks)
+        :param normalizer: array the raw data was divided by, or None
+        :param criterion: 'aic' or 'bic'
+        :param progress: function called with the store of a candidate and a list of its columns, see fitColumns
+        :return: ModelSelection
+        """
+        self.cancelled.clear()
+        jobs = []
+        stores = []
+        try:
+            for whichFit, peaks in candidates:
+                jobs.append(self.startFit(TT, whichFit, peaks, normalizer, progress,
+                                          storeName=candidateName(whichFit, peaks)))
+            for job in jobs:
+                stores.append(self.finishFit(job))
+        except:
+            for job in jobs[len(stores):]:
+                self.abandonFit(job)
+            raise
+        nVary = [varyingParams(whichFit, peaks).sum() for whichFit, peaks in candidates]
+        selection = ModelSelection(candidates, stores, nVary, criterion)
+        self.fitLog.append(selection.summary())
+        return selection
+
+    def startFit(self, TT, whichFit, peaks, normalizer=None, progress=None, seeds=None, storeName=None):
+        """Reads the cached columns and starts fitting the others. Process pool fits are only submitted, and are
+        collected by finishFit.
+        :param storeName: suffix of the store file, so that fits running together each have their own file
+        :return: fit job, a dictionary handed to finishFit
+        """
+        TT = np.asarray(TT, dtype=np.float64)
+        nRow, nCol = TT.shape
+        fileName = self.storeFile
+        if fileName is not None and storeName is not None:
+            fileName = fileName + '.' + storeName
+        store = FitResultStore(nRow, nCol, whichFit, peaks, fileName=fileName)
+        job = {'store': store, 'target': store, 'missing': list(range(nCol)), 'keys': None, 'cacheSummary': None,
+               'progress': progress, 'done': [], 'TT': TT, 'seeds': seeds}
+
+        if self.cache is not None and seeds is None:
+            keys = self.cache.columnKeys(TT, normalizer, self.settings(whichFit, peaks))
+            found = self.cache.lookup(keys)
+            cached = [j for j, key in enumerate(keys) if key in found]
+            if cached:
+                store.setRecords(cached, np.array([found[keys[j]] for j in cached]))
+                store.bestFit[:, cached] = evaluateModel(whichFit, peaks, np.arange(nRow).reshape(-1, 1),
+                                                         store.params[cached, :, 0])
+            job['keys'] = keys
+            job['missing'] = [j for j, key in enumerate(keys) if key not in found]
+            job['cacheSummary'] = self.cache.summary()
+            if cached and progress is not None:
+                progress(store, cached)
+
+        missing = job['missing']
+        if not missing:
+            return job
+        if len(missing) < nCol:
+            TT = TT[:, missing]
+            job['target'] = FitResultStore(nRow, len(missing), whichFit, peaks)
+            job['TT'] = TT
+        try:
+            self.startColumns(TT, whichFit, peaks, job)
+        except FitCancelled:
+            if not self.bootstrapSamples:  # The columns done so far have no bootstrap errors yet
+                self.cacheColumns(job)
+            raise
+        return job
+
+    def startColumns(self, TT, whichFit, peaks, job):
+        """Fits every column of TT into job['target'] with the selected solver, or submits the chunks to the process
+        pool. The starting values of all the columns are computed up front by PeakSeeding.seedColumns, unless the
+        job was given seeds.
+        """
+        nRow, nCol = TT.shape
+        seeds = job['seeds'] if job['seeds'] is not None else seedColumns(TT, whichFit, peaks)
+        chunks = self.chunks(nCol)
+        target = job['target']
+        job['seeds'] = seeds
+
+        if self.solver == 'fast':
+            self.fitBatchedColumns(TT, whichFit, peaks, seeds, target)
+            self.reportColumns(job, range(nCol))
+        elif self.maxWorkers == 1 or len(chunks) == 1:
+            _fitChunk(TT, 0, nCol, whichFit, peaks, seeds, self.options(), target,
+                      lambda j: self.reportColumns(job, [j]))
+        elif shared_memory is None:
+            self.submitPickledColumns(TT, chunks, whichFit, peaks, seeds, job)
+        else:
+            self.submitSharedColumns(TT, chunks, whichFit, peaks, seeds, job)
+
+    def finishFit(self, job):
+        """Waits for the submitted chunks of a fit job, gathers the results, and stores the new columns in the
+        cache.
+        :param job: dictionary from startFit
+        :return: FitResultStore with the results of every column
+        """
+        store = job['store']
+        try:
+            if 'blocks' in job:
+                self.collectSharedColumns(job)
+            elif 'futures' in job:
+                self.collectPickledColumns(job)
+        except FitCancelled:
+            if not self.bootstrapSamples:  # The columns done so far have no bootstrap errors yet
+                self.cacheColumns(job)
+            raise
+        retried, flagged = self.retryFlagged(job)
+        if self.bootstrapSamples and job['missing']:
+            target = job['target']
+            target.params[:, :, 1] = self.bootstrapErrors(job['TT'], target)
+            store.params[job['missing'], :, 1] = target.params[:, :, 1]
+        store.flush()
+
+        line = self.nfevSummary(store, job['missing'])
+        if retried:
+            line += "; %d flagged column(s) retried, %d still flagged" % (retried, flagged)
+        if self.bootstrapSamples:
+            line += "; errors from %d bootstrap samples" % self.bootstrapSamples
+        self.cacheColumns(job)
+        if job['keys'] is not None:
+            line += "; " + job['cacheSummary']
+        self.fitLog.append(line)
+        return store
+
+    def retryFlagged(self, job):
+        """Refits the columns of a job that failed or are outliers from the seeds of alternativeSeeds, with the
+        same solver, and keeps the fit with the lowest chi-square of each. The columns that are flagged after that
+        are marked in the store.
+        :param job: dictionary from startFit
+        :return: number of columns retried and number still flagged
+        """
+        target = job['target']
+        if not job['missing']:
+            return 0, 0
+        flagged = flaggedColumns(target)
+        columns = np.flatnonzero(flagged)
+        if len(columns) > 0:
+            candidates = [(j, seed) for j in columns for seed in alternativeSeeds(target, flagged, job['seeds'], j)]
+            TT = job['TT'][:, [j for j, seed in candidates]]
+            seeds = np.array([seed for j, seed in candidates])
+            retry = FitResultStore(target.nRow, len(candidates), target.whichFit, target.peaks)
+            if self.solver == 'fast':
+                self.fitBatchedColumns(TT, target.whichFit, target.peaks, seeds, retry)
+            else:
+                options = dict(self.options(), continuation=False)
+                _fitChunk(TT, 0, len(candidates), target.whichFit, target.peaks, seeds, options, retry)
+
+            nfev = target.nfev.copy()
+            wallTime = target.wallTime.copy()
+            for i, (j, seed) in enumerate(candidates):
+                nfev[j] += retry.nfev[i]
+                wallTime[j] += retry.wallTime[i]
+                if retry.success[i] and not retry.chisqr[i] >= target.chisqr[j]:  # Also replaces NaN chi-squares
+                    target.setRecords([j], retry.records([i]))
+                    target.bestFit[:, j] = retry.bestFit[:, i]
+            target.nfev[columns] = nfev[columns]
+            target.wallTime[columns] = wallTime[columns]
+            target.retries[columns] = np.bincount([j for j, seed in candidates], minlength=target.nCol)[columns]
+        target.stat('flagged')[:] = flaggedColumns(target)
+
+        store = job['store']
+        if target is not store:
+            store.setRecords(job['missing'], target.records(range(target.nCol)))
+            store.bestFit[:, job['missing']] = target.bestFit
+        return len(columns), int(target.flagged.sum())
+
+    def reportColumns(self, job, columns):
+        """Called as columns of the target store of a job are done. Copies them into the store of the job when
+        only the columns missing from the cache were fitted, hands them to the progress function, and stops the
+        fit if it was cancelled.
+        :param job: dictionary from startFit
+        :param columns: columns of the target store
+        """
+        store = job['store']
+        target = job['target']
+        columns = list(columns)
+        storeColumns = [job['missing'][i] for i in columns]
+        if target is not store:
+            store.setRecords(storeColumns, target.records(columns))
+            store.bestFit[:, storeColumns] = target.bestFit[:, columns]
+        job['done'].extend(columns)
+        if job['progress'] is not None:
+            job['progress'](store, storeColumns)
+        if self.cancelled.is_set():
+            raise FitCancelled("Fit cancelled after %d of %d columns" % (len(job['done']), target.nCol))
+
+    def cacheColumns(self, job):
+        """Stores the columns of a job fitted so far in the cache.
+        :param job: dictionary from startFit
+        """
+        if job['keys'] is None or not job['done']:
+            return
+        columns = [job['missing'][i] for i in job['done']]
+        self.cache.insert([job['keys'][j] for j in columns], job['store'].records(columns))
+
+    def abandonFit(self, job):
+        """Drops a job that will not be finished: cancels its chunks that have not started, waits for the running
+        ones and frees its shared memory.
+        :param job: dictionary from startFit
+        """
+        if 'blocks' in job:
+            self.waitForChunks(job)
+            self.releaseBlocks(job)
+        for future in job.get('futures', []):
+            future.cancel()
+
+    def bootstrapErrors(self, TT, store):
+        """Standard errors of every parameter from bootstrapSamples resampled refits of each column, see
+        _bootstrapChunk. The chunks run on the process pool.
+        :param TT: data that was fitted
+        :param store: FitResultStore of the fit
+        :return: array (nCol x nPar)
+        """
+        nCol = TT.shape[1]
+        P = store.params[:, :, 0]
+        chunks = self.chunks(nCol)
+        args = (store.whichFit, store.peaks, self.bootstrapSamples)
+        if self.maxWorkers == 1 or len(chunks) == 1:
+            return np.concatenate([_bootstrapChunk(TT[:, start:stop], store.bestFit[:, start:stop], P[start:stop],
+                                                   *(args + (self.bootstrapSeed + start,)))
+                                   for (start, stop) in chunks])
+        executor = self.getExecutor()
+        futures = [executor.submit(_bootstrapChunk, TT[:, start:stop], store.bestFit[:, start:stop], P[start:stop],
+                                   *(args + (self.bootstrapSeed + start,))) for (start, stop) in chunks]
+        return np.concatenate([future.result() for future in futures])
+
+    def settings(self, whichFit, peaks):
+        """Everything besides the data that changes the result of a fit, used in the cache keys.
+        :return: tuple of settings
+        """
+        settings = (whichFit, peaks, self.solver, self.continuation, self.analyticJacobian)
+        if self.bootstrapSamples:
+            settings += (('bootstrap', self.bootstrapSamples, self.bootstrapSeed),)
+        return settings
+
+    def nfevSummary(self, store, columns=None):
+        """Summarizes the function evaluations of a fit, comparing warm and cold started columns.
+        :param store: FitResultStore of the fit
+        :param columns: columns that were actually fitted, defaults to all of them
+        :return: summary line
+        """
+        if columns is None:
+            columns = np.arange(store.nCol)
+        nfev = store.nfev[columns]
+        warmStarted = store.warmStarted[columns]
+        line = "%s fit, %d peak(s), %s solver: %d columns, %d function evaluations" % (
+            store.fitName(), store.peaks, self.solver, len(nfev), nfev.sum())
+        warm = nfev[warmStarted]
+        cold = nfev[~warmStarted]
+        if len(warm) > 0 and len(cold) > 0:
+            saved = 100.0 * (1 - warm.mean() / cold.mean())
+            line += "; %d warm started (%.1f nfev/column) vs %d cold (%.1f nfev/column), %.0f%% saved" % (
+                len(warm), warm.mean(), len(cold), cold.mean(), saved)
+        return line
+
+    def fitBatchedColumns(self, TT, whichFit, peaks, seeds, store):
+        """Fits all the columns at once with the batched Levenberg-Marquardt solver.
+        """
+        nRow, nCol = TT.shape
+        xx = np.arange(0, nRow)
+        vary = varyingParams(whichFit, peaks)
+        began = time.perf_counter()
+        P, chisqr, nfev, success = batchedLevenbergMarquardt(whichFit, peaks, xx, TT, seeds, vary)
+        store.params[:, :, 0] = P
+        store.params[:, :, 1] = batchedStandardErrors(whichFit, peaks, xx, P, chisqr, vary)
+        store.chisqr[:] = chisqr
+        store.redchi[:] = chisqr / max(nRow - vary.sum(), 1)
+        store.nfev[:] = nfev
+        store.stat('success')[:] = success
+        store.rsquared[:] = rSquared(TT, chisqr)
+        store.bestFit[:] = evaluateModel(whichFit, peaks, xx.reshape(-1, 1), P)
+        # The columns are solved together, so the time is shared out by their function evaluations
+        store.wallTime[:] = (time.perf_counter() - began) * nfev / max(nfev.sum(), 1)
+
+    def submitSharedColumns(self, TT, chunks, whichFit, peaks, seeds, job):
+        """Copies TT once into shared memory and submits the chunks. The workers write their results into a store
+        that lives in shared memory.
+        """
+        nRow, nCol = TT.shape
+        sizes = [TT.size, storeSize(nRow, nCol, peaks)]
+        blocks = [shared_memory.SharedMemory(create=True, size=max(size * 8, 1)) for size in sizes]
+        job['blocks'] = blocks
+        try:
+            sharedTT = np.ndarray(TT.shape, dtype=np.float64, buffer=blocks[0].buf)
+            sharedTT[:] = TT
+            del sharedTT
+            names = [block.name for block in blocks]
+            executor = self.getExecutor()
+            job['futures'] = {executor.submit(_fitSharedChunk, names, TT.shape, start, stop, whichFit, peaks,
+                                              seeds[start:stop], self.options()): (start, stop)
+                              for (start, stop) in chunks}
+        except:
+            self.releaseBlocks(job)
+            raise
+
+    def collectSharedColumns(self, job):
+        """Copies each chunk of a job from the shared store into its target as soon as it is done.
+        """
+        target = job['target']
+        sharedStore = FitResultStore(target.nRow, target.nCol, target.whichFit, target.peaks,
+                                     buffer=job['blocks'][1].buf)
+        try:
+            for future in as_completed(job['futures']):
+                start, stop = job['futures'][future]
+                future.result()
+                target.params[start:stop] = sharedStore.params[start:stop]
+                target.stats[start:stop] = sharedStore.stats[start:stop]
+                target.bestFit[:, start:stop] = sharedStore.bestFit[:, start:stop]
+                self.reportColumns(job, range(start, stop))
+        finally:
+            del sharedStore
+            self.waitForChunks(job)
+            self.releaseBlocks(job)
+
+    def waitForChunks(self, job):
+        """Cancels the chunks of a job that have not started and waits for the running ones, which still write
+        into the shared memory.
+        """
+        for future in job['futures']:
+            future.cancel()
+        for future in job['futures']:
+            if not future.cancelled():
+                future.exception()
+
+    def releaseBlocks(self, job):
+        """Frees the shared memory of a job.
+        """
+        for block in job.pop('blocks'):
+            block.close()
+            block.unlink()
+
+    def submitPickledColumns(self, TT, chunks, whichFit, peaks, seeds, job):
+        """Fallback for interpreters without multiprocessing.shared_memory.
+        """
+        executor = self.getExecutor()
+        job['futures'] = {executor.submit(_fitPickledChunk, TT[:, start:stop], start, stop, whichFit, peaks,
+                                          seeds[start:stop], self.options()): (start, stop) for (start, stop) in chunks}
+
+    def collectPickledColumns(self, job):
+        """Copies the pickled results of each chunk into the target store of a job.
+        """
+        target = job['target']
+        try:
+            for future in as_completed(job['futures']):
+                start, stop, (params, stats, bestFit) = future.result()
+                target.params[start:stop] = params
+                target.stats[start:stop] = stats
+                target.bestFit[:, start:stop] = bestFit
+                self.reportColumns(job, range(start, stop))
+        finally:
+            for future in job['futures']:
+                future.cancel()
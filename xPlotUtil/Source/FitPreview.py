@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Paged grid of small data + fit graphs, one per column, in a single figure.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+from PyQt5.QtWidgets import *
+from matplotlib.backends.backend_qt5 import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+import numpy as np
+
+from xPlotUtil.Source.FitResultStore import FIT_NAMES
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+GRID_ROWS = 5
+GRID_COLUMNS = 10
+
+
+class FitPreviewGrid(QDialog):
+    """Non-modal window showing the data and the fit of a page of columns at a time. The axes and lines are created
+    once; changing page only swaps the line data and blits them onto the cached empty grid. Clicking a graph
+    enlarges it.
+    """
+
+    def __init__(self, parent, xx, TT, bestFit, whichFit, rows=GRID_ROWS, columns=GRID_COLUMNS):
+        """
+        :param parent: main window
+        :param xx: bins
+        :param TT: 2D array of the fitted data, rows are points and columns are bins
+        :param bestFit: 2D array of the fitted curves, same shape as TT
+        :param whichFit: char that represents the fit
+        :param rows: rows of graphs on a page
+        :param columns: columns of graphs on a page
+        """
+        super(FitPreviewGrid, self).__init__(parent)
+        self.xx = xx
+        self.TT = TT
+        self.bestFit = bestFit
+        self.whichFit = whichFit
+        self.pageSize = rows * columns
+        self.pages = max(1, int(np.ceil(TT.shape[1] / float(self.pageSize))))
+        self.page = 0
+        self.background = None  # Grid without the lines, cached by onDraw
+        self.fullPageDrawn = False  # The cached grid shows every graph
+        self.enlarged = None  # Dialog of the enlarged graph, created on the first click
+
+        self.setWindowTitle(FIT_NAMES[whichFit] + " Fit of Each Column")
+        self.resize(1100, 650)
+        self.fig = Figure((11.0, 5.5), dpi=100)
+        self.canvas = FigureCanvas(self.fig)
+        self.fig.subplots_adjust(left=0.01, right=0.99, bottom=0.01, top=0.99, wspace=0.05, hspace=0.05)
+
+        self.axes = []
+        self.dataLines = []
+        self.fitLines = []
+        self.labels = []
+        for i in range(self.pageSize):
+            axes = self.fig.add_subplot(rows, columns, i + 1)
+            axes.set_xticks([])
+            axes.set_yticks([])
+            axes.set_xlim(xx[0], xx[-1])
+            self.dataLines.append(axes.plot([], [], 'b+', markersize=2, animated=True)[0])
+            self.fitLines.append(axes.plot([], [], 'r-', linewidth=1, animated=True)[0])
+            self.labels.append(axes.text(0.03, 0.97, '', transform=axes.transAxes, fontsize=7, va='top',
+                                         animated=True))
+            self.axes.append(axes)
+
+        self.canvas.mpl_connect('draw_event', self.onDraw)
+        self.canvas.mpl_connect('button_press_event', self.onClick)
+
+        self.previousBtn = QPushButton('Previous')
+        self.previousBtn.setStatusTip("Graphs the previous page of fits")
+        self.previousBtn.clicked.connect(lambda: self.showPage(self.page - 1))
+        self.nextBtn = QPushButton('Next')
+        self.nextBtn.setStatusTip("Graphs the next page of fits")
+        self.nextBtn.clicked.connect(lambda: self.showPage(self.page + 1))
+        self.pageLabel = QLabel()
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(self.previousBtn)
+        hbox.addStretch(1)
+        hbox.addWidget(self.pageLabel)
+        hbox.addStretch(1)
+        hbox.addWidget(self.nextBtn)
+        vbox = QVBoxLayout()
+        vbox.addLayout(hbox)
+        vbox.addWidget(self.canvas)
+        self.setLayout(vbox)
+
+        self.showPage(0)
+
+    def pageColumns(self, page):
+        """
+        :param page: page number
+        :return: range of the columns graphed on the page
+        """
+        start = page * self.pageSize
+        return range(start, min(start + self.pageSize, self.TT.shape[1]))
+
+    def showPage(self, page):
+        """Puts the columns of a page into the lines, scales each graph to its column and blits the page.
+        :param page: page number
+        """
+        self.page = min(max(page, 0), self.pages - 1)
+        columns = self.pageColumns(self.page)
+        data = self.TT[:, columns]
+        fit = self.bestFit[:, columns]
+        values = np.concatenate([data, fit])
+        finite = np.isfinite(values)
+        low = np.where(finite, values, np.inf).min(axis=0)
+        high = np.where(finite, values, -np.inf).max(axis=0)
+        empty = ~finite.any(axis=0)  # Columns whose fit failed on data without any values
+        low[empty], high[empty] = 0.0, 1.0
+        pad = np.where(high > low, 0.05 * (high - low), 1.0)
+
+        for i, axes in enumerate(self.axes):
+            if i < len(columns):
+                self.dataLines[i].set_data(self.xx, data[:, i])
+                self.fitLines[i].set_data(self.xx, fit[:, i])
+                self.labels[i].set_text(str(columns[i]))
+                axes.set_ylim(low[i] - pad[i], high[i] + pad[i])
+            else:
+                self.dataLines[i].set_data([], [])
+                self.fitLines[i].set_data([], [])
+                self.labels[i].set_text('')
+            axes.set_visible(i < len(columns))
+
+        self.pageLabel.setText("Columns %d-%d of %d (page %d/%d)" % (columns[0], columns[-1], self.TT.shape[1],
+                                                                    self.page + 1, self.pages))
+        self.previousBtn.setEnabled(self.page > 0)
+        self.nextBtn.setEnabled(self.page < self.pages - 1)
+        self.blit()
+
+    def onDraw(self, event):
+        """Caches the empty grid after every full draw, e.g. on resize, and draws the lines on top of it.
+        """
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.drawLines()
+
+    def blit(self):
+        """Redraws only the lines over the cached grid. The last page may hide some graphs, which changes the grid,
+        so pages that are not full, and the page after one, are drawn in full.
+        """
+        full = len(self.pageColumns(self.page)) == self.pageSize
+        if self.background is None or not (full and self.fullPageDrawn):
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self.drawLines()
+            self.canvas.blit(self.fig.bbox)
+        self.fullPageDrawn = full
+
+    def drawLines(self):
+        """Draws the lines and labels of the visible graphs.
+        """
+        for dataLine, fitLine, label in zip(self.dataLines, self.fitLines, self.labels):
+            if dataLine.axes.get_visible():
+                dataLine.axes.draw_artist(dataLine)
+                fitLine.axes.draw_artist(fitLine)
+                label.axes.draw_artist(label)
+
+    def onClick(self, event):
+        """Enlarges the graph that was clicked.
+        """
+        if event.inaxes is None:
+            return
+        i = self.axes.index(event.inaxes)
+        columns = self.pageColumns(self.page)
+        if i < len(columns):
+            self.enlarge(columns[i])
+
+    def enlarge(self, j):
+        """Shows the data, fit and residual of one column in a window of its own, reused by the next click.
+        :param j: column
+        """
+        if self.enlarged is None:
+            self.enlarged = QDialog(self)
+            self.enlarged.resize(600, 600)
+            fig = Figure((5.0, 5.0), dpi=100)
+            canvas = FigureCanvas(fig)
+            axes = fig.add_subplot(211)
+            residualAxes = fig.add_subplot(212, sharex=axes)
+            lines = [axes.plot([], [], 'b+:', label='data')[0], axes.plot([], [], 'ro:', label='fit')[0],
+                     residualAxes.plot([], [], 'g.-')[0]]
+            axes.legend()
+            axes.set_ylabel('Intensity')
+            residualAxes.set_xlabel('Bins')
+            residualAxes.set_ylabel('Residual')
+            vbox = QVBoxLayout()
+            vbox.addWidget(NavigationToolbar(canvas, self.enlarged))
+            vbox.addWidget(canvas)
+            self.enlarged.setLayout(vbox)
+            self.enlargedGraph = (canvas, axes, residualAxes, lines)
+
+        canvas, axes, residualAxes, lines = self.enlargedGraph
+        yy = self.TT[:, j]
+        fit = self.bestFit[:, j]
+        for line, y in zip(lines, [yy, fit, yy - fit]):
+            line.set_data(self.xx, y)
+        for ax in (axes, residualAxes):
+            ax.relim()
+            ax.autoscale_view()
+        axes.set_title(FIT_NAMES[self.whichFit] + " Fit, column " + str(j))
+        canvas.draw_idle()
+        self.enlarged.setWindowTitle("Column " + str(j))
+        self.enlarged.show()
+        self.enlarged.raise_()
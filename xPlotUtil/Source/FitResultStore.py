@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Preallocated arrays holding the results of a fit of every column. Headless, like FitEngine.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import numpy as np
+
+from xPlotUtil.Source.PeakModels import PEAK_PARAMS, paramNames
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+STATS = ('chisqr', 'redchi', 'nfev', 'success', 'warmStarted', 'rsquared', 'wallTime', 'retries', 'flagged')
+FIT_NAMES = {'G': 'Gaussian', 'L': 'Lorentzian', 'V': 'Voigt', 'P': 'Pseudo-Voigt'}
+
+
+def rSquared(TT, chisqr):
+    """Coefficient of determination of the fits of some columns.
+    :param TT: data of the columns (nRow x nCol)
+    :param chisqr: chi-square of the fit of each column
+    :return: array (nCol), NaN for flat columns
+    """
+    total = np.sum((TT - np.mean(TT, axis=0)) ** 2, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, 1 - chisqr / total, np.nan)
+
+
+def storeShapes(nRow, nCol, peaks):
+    """Shapes of the arrays of a store: parameters (value and standard error of each parameter), per column
+    statistics and fitted curves.
+    :param nRow: number of points
+    :param nCol: number of bins
+    :param peaks: number of peaks
+    :return: list of shapes
+    """
+    return [(nCol, len(paramNames(peaks)), 2), (nCol, len(STATS)), (nRow, nCol)]
+
+
+def storeSize(nRow, nCol, peaks):
+    """
+    :return: number of float64 values held by a store
+    """
+    return sum(int(np.prod(shape)) for shape in storeShapes(nRow, nCol, peaks))
+
+
+class FitResultStore:
+    """Results of fitting every column of the raw data. All arrays are allocated once, either in memory or in a
+    single memory-mapped file, and the accessors return views into them.
+    """
+
+    def __init__(self, nRow, nCol, whichFit, peaks, fileName=None, buffer=None, rowOffset=0):
+        """
+        :param nRow: number of points
+        :param nCol: number of bins
+        :param whichFit: 'G' (Gaussian), 'L' (Lorentzian), 'V' (Voigt) or 'P' (pseudo-Voigt)
+        :param peaks: number of peaks
+        :param fileName: file backing the arrays, None keeps them in memory
+        :param buffer: existing buffer of storeSize float64 values to wrap, e.g. shared memory of a worker
+        :param rowOffset: first row of the raw data that was fitted, when the fit was restricted to a window. The
+        centers and fitted curves are relative to it.
+        """
+        self.nRow = nRow
+        self.rowOffset = rowOffset
+        self.nCol = nCol
+        self.whichFit = whichFit
+        self.peaks = peaks
+        self.names = paramNames(peaks)
+        self.fileName = fileName
+
+        shapes = storeShapes(nRow, nCol, peaks)
+        sizes = [int(np.prod(shape)) for shape in shapes]
+        if buffer is not None:
+            buffer = np.ndarray((sum(sizes),), dtype=np.float64, buffer=buffer)
+        elif fileName is None:
+            buffer = np.zeros(sum(sizes))
+        else:
+            buffer = np.memmap(fileName, dtype=np.float64, mode='w+', shape=(max(sum(sizes), 1),))
+        self.buffer = buffer
+
+        arrays = []
+        offset = 0
+        for shape, size in zip(shapes, sizes):
+            arrays.append(buffer[offset:offset + size].reshape(shape))
+            offset += size
+        self.params, self.stats, self.bestFit = arrays
+
+    def arrays(self):
+        """Arrays in the order of storeShapes, as written by the fit workers.
+        :return: list of arrays
+        """
+        return [self.params, self.stats, self.bestFit]
+
+    def fitName(self):
+        """
+        :return: name of the line shape
+        """
+        return FIT_NAMES[self.whichFit]
+
+    def index(self, name):
+        """
+        :param name: parameter name from PeakModels.paramNames
+        :return: position of the parameter
+        """
+        return self.names.index(name)
+
+    def value(self, name):
+        """Best value of a parameter in every column.
+        :param name: parameter name from PeakModels.paramNames, e.g. 'center' or 'p2_sigma'
+        :return: view (nCol)
+        """
+        return self.params[:, self.index(name), 0]
+
+    def position(self, name):
+        """Center of a peak in every column, as a row of the whole raw data.
+        :param name: center parameter name, e.g. 'center' or 'p1_center'
+        :return: array (nCol)
+        """
+        return self.value(name) + self.rowOffset
+
+    def rows(self):
+        """
+        :return: slice of the rows of the raw data that were fitted
+        """
+        return slice(self.rowOffset, self.rowOffset + self.nRow)
+
+    def stderr(self, name):
+        """Standard error of a parameter in every column, from the covariance of the fit. Zero where it could
+        not be estimated.
+        :param name: parameter name from PeakModels.paramNames
+        :return: view (nCol)
+        """
+        return self.params[:, self.index(name), 1]
+
+    def stat(self, name):
+        """
+        :param name: one of STATS
+        :return: view (nCol)
+        """
+        return self.stats[:, STATS.index(name)]
+
+    @property
+    def chisqr(self):
+        return self.stat('chisqr')
+
+    @property
+    def redchi(self):
+        return self.stat('redchi')
+
+    @property
+    def nfev(self):
+        return self.stat('nfev')
+
+    @property
+    def success(self):
+        return self.stat('success') != 0
+
+    @property
+    def warmStarted(self):
+        return self.stat('warmStarted') != 0
+
+    @property
+    def rsquared(self):
+        return self.stat('rsquared')
+
+    @property
+    def wallTime(self):
+        return self.stat('wallTime')
+
+    @property
+    def retries(self):
+        return self.stat('retries')
+
+    @property
+    def flagged(self):
+        return self.stat('flagged') != 0
+
+    def peakData(self):
+        """Value and error of the peak parameters of every column, laid out as amplitude, error, center, error,
+        sigma, error for each peak.
+        :return: view (nCol x 6 per peak)
+        """
+        return self.params[:, :len(PEAK_PARAMS) * self.peaks, :].reshape(self.nCol, -1)
+
+    def setColumn(self, j, values, stderr, chisqr, redchi, nfev, success, warmStarted, rsquared, wallTime, bestFit):
+        """Writes the result of the fit of one column. The column is not retried or flagged yet.
+        :param j: column
+        :param values: best values ordered as PeakModels.paramNames
+        :param stderr: standard errors ordered as PeakModels.paramNames
+        :param wallTime: seconds spent fitting the column
+        """
+        self.params[j, :, 0] = values
+        self.params[j, :, 1] = stderr
+        self.stats[j, :] = (chisqr, redchi, nfev, success, warmStarted, rsquared, wallTime, 0, 0)
+        self.bestFit[:, j] = bestFit
+
+    def records(self, columns):
+        """Parameters and statistics of some columns flattened into one row per column, as kept by FitCache.
+        :param columns: column indices
+        :return: 2D array (len(columns) x record length)
+        """
+        return np.hstack([self.params[columns].reshape(len(columns), -1), self.stats[columns]])
+
+    def setRecords(self, columns, records):
+        """Inverse of records. The fitted curves of those columns are not touched.
+        :param columns: column indices
+        :param records: 2D array from records
+        """
+        size = self.params[0].size
+        self.params[columns] = records[:, :size].reshape((len(columns),) + self.params.shape[1:])
+        self.stats[columns] = records[:, size:]
+
+    def flush(self):
+        """Writes a memory-mapped store to its file.
+        """
+        if self.fileName is not None:
+            self.buffer.flush()
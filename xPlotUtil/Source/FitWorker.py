@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Runs the fit engine on a thread of its own, so that the window stays responsive while fitting.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+from PyQt5.QtCore import *
+
+from xPlotUtil.Source.FitEngine import FitCancelled
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+
+class FitWorker(QThread):
+    """Thread running one fit. The columns are reported as they are done, and the signals are delivered to the
+    slots in the main thread.
+    """
+    columnsFitted = pyqtSignal(object, object)  # FitResultStore, list of columns done
+    fitFinished = pyqtSignal(object)  # Result of the fit function
+    fitFailed = pyqtSignal(str)
+    fitCancelled = pyqtSignal(str)
+
+    def __init__(self, fit, parent=None):
+        """
+        :param fit: function called with the progress function of the fit engine, returns the result of the fit
+        :param parent: parent object
+        """
+        super(FitWorker, self).__init__(parent)
+        self.fit = fit
+
+    def run(self):
+        try:
+            result = self.fit(self.progress)
+        except FitCancelled as e:
+            self.fitCancelled.emit(str(e))
+            return
+        except Exception as e:
+            self.fitFailed.emit(str(e))
+            return
+        self.fitFinished.emit(result)
+
+    def progress(self, store, columns):
+        """Progress function handed to the fit engine, called from this thread.
+        :param store: FitResultStore being filled
+        :param columns: columns that are done
+        """
+        self.columnsFitted.emit(store, list(columns))
@@ -14,240 +14,475 @@ from PyQt5.QtWidgets import *
 from matplotlib.backends.backend_qt5 import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 
-from lmfit.models import LorentzianModel, GaussianModel, LinearModel, VoigtModel
-
 from pylab import *
 import numpy as np
 
 
 from xPlotUtil.Source.AlgebraicExpressions import AlgebraicExpress
+from xPlotUtil.Source.FitEngine import BOOTSTRAP_SAMPLES, FitEngine
+from xPlotUtil.Source.FitCache import FitCache
+from xPlotUtil.Source.FitPreview import FitPreviewGrid
+from xPlotUtil.Source.FitResultStore import FIT_NAMES
+from xPlotUtil.Source.FitWorker import FitWorker
+from xPlotUtil.Source.ModelSelection import CANDIDATES
+from xPlotUtil.Source.PeakModels import PEAK_PARAMS, peakPrefixes
+from xPlotUtil.Source.PeakSeeding import MIN_WINDOW_ROWS, seedWindow
+from xPlotUtil.Source.PVvalueFile import voltageAxis
+from xPlotUtil.Source.StreamingFit import StreamingFit
 
 
 # ---------------------------------------------------------------------------------------------------------------------#
 
+class FitPending(Exception):
+    """Raised when the fit is asked for while it is being redone on the fit worker.
+    """
+    pass
+
+
 class GaussianFitting:
     """Contains Gaussian fit and lattice fit.
     """
 
     def __init__ (self, parent=None):
-        self.TwoPkGausFitData = []
-        self.OnePkFitData = []
-        self.LPosPrcChangeData = []
-        self.LPos1PrcChangeData = []
-        self.LPos2PrcChangeData = []
         self.readSpec = parent
         self.dockedOpt = self.readSpec.dockedOpt
         self.myMainWindow = self.dockedOpt.myMainWindow
         self.algebraExp = AlgebraicExpress(parent=self)
         self.lorentFit = self.algebraExp.lorentFit
-        self.continueGraphingEachFit = True  # Boolean to stop Each fit graphing
+        self.fitPreview = None  # FitPreviewGrid of the current fit
+        self.fitEngine = FitEngine(cache=FitCache())
+        self.modelSelection = None  # ModelSelection of the last auto fit
+        self.fitWorker = None  # FitWorker of the running or last fit
+        self.fitInput = None  # Normalized data and fit window handed to the fit worker
+        self.liveGraphs = None  # Canvas and lines of the fit progress tab
+        self.streamingFit = StreamingFit(self)
 
     # --------------------------------Gaussian Fit---------------------------------------------------------------------#
     def OnePeakGaussianFit(self):
-        """Calls on the gaussian fit function for one peak and saves fitted data in array.
+        """Starts the gaussian fit for one peak. The graphing options are added once the fit is done.
         """
-        error = self.onePeakGaussianFit()
+        self.onePeakGaussianFit()
 
-        if error is False:
-            self.dockedOpt.onePeakStat = True
-            self.dockedOpt.fitStat = True
-            self.dockedOpt.GraphingFitOptionsTree("G")
+    def onePeakGaussianFit(self):
+        """Gaussian Fit for one Peak. The fit of every column is done by the fit engine, on the fit worker.
+        :return: truth value of fit error
+        """
+        return self.fitColumns('G', 1)
 
+    def TwoPeakGaussianFit(self):
+        """Starts the gaussian fit for two peaks.
+        """
+        self.twoPeakGaussianFit()
 
-    def onePeakGaussianFit(self):
-        """Gaussian Fit for one Peak.
-        :param xx: x-value
-        :param yy: y-values
-        :return: fitted data and error
+    def twoPeakGaussianFit(self):
+        """Gaussian Fit for two Peaks. The fit of every column is done by the fit engine, on the fit worker.
+        :return: truth value of fit error
         """
-        try:
-            nRow, nCol = self.dockedOpt.fileInfo()
+        return self.fitColumns('G', 2)
 
-            self.binFitData = zeros((nRow, 0))
-            self.OnePkFitData = zeros((nCol, 6))  # Creates the empty 2D List
-            QMessageBox.warning(self.myMainWindow, "Hi", "Hola")
-            for j in range(nCol):
-                yy = self.dockedOpt.TT[:, j]
-                xx = arange(0, len(yy))
+    def AutoFit(self):
+        """Fits every candidate model, then graphs the model that won the most columns.
+        """
+        if self.dockedOpt.fitStat == True:
+            ans = self.dockedOpt.msgApp("New Fit", "Would you like to refit the data? \n\nThis will delete the data"
+                                                   " from the previous fit.")
+            if ans == 'N':
+                return
+            self.dockedOpt.resetFit()
+        if self.dockedOpt.FileError() == False:
+            self.autoFit()
+
+    def autoFit(self):
+        """Fits the data with every candidate line shape and number of peaks, concurrently on the fit engine's
+        process pool, and picks the best model of each column by BIC. The fit of the model that won the most columns
+        becomes the current fit.
+        :return: truth value of fit error
+        """
+        TT = self.dockedOpt.TT
+        normalizer = self.dockedOpt.graph.get('normalizer')
+        roi = self.dockedOpt.graph.get('roi')
+        window = self.fitWindow(TT, roi)
 
-                x1 = xx[0]
-                x2 = xx[-1]
-                y1 = yy[0]
-                y2 = yy[-1]
-                m = (y2 - y1) / (x2 - x1)
-                b = y2 - m * x2
+        def fit(progress):
+            selection = self.fitEngine.fitCandidates(window, normalizer=normalizer, progress=progress)
+            store = selection.stores[selection.candidates.index(selection.best())]
+            return selection, self.windowStore(store, roi)
 
-                mod = GaussianModel()
-                pars = mod.guess(yy, x=xx)
-                mod = mod + LinearModel()
-                pars.add('intercept', value=b, vary=True)
-                pars.add('slope', value=m, vary=True)
-                out = mod.fit(yy, pars, x=xx)
+        return self.startFitWorker(fit, TT, roi, "Auto fit", TT.shape[1] * len(CANDIDATES), self.autoFitFinished)
 
+    def autoFitFinished(self, result):
+        """Makes the fit of the model chosen by the auto fit the current fit.
+        :param result: ModelSelection and FitResultStore of the best model
+        """
+        self.modelSelection, store = result
+        if self.fitDone(self.modelSelection.best(), store):
+            self.myMainWindow.myStatusBar.showMessage(self.modelSelection.summary(), 10000)
+
+    def fitColumns(self, whichFit, peaks):
+        """Starts fitting every column on the fit worker. The parameters are graphed as the columns come in, and
+        the fit becomes the 'fitted' node of the processing graph once every column is done.
+        :param whichFit: char that represents the fit
+        :param peaks: number of peaks
+        :return: truth value of fit error
+        """
+        TT = self.dockedOpt.TT
+        normalizer = self.dockedOpt.graph.get('normalizer')
+        roi = self.dockedOpt.graph.get('roi')
+        error = self.startFitWorker(self.columnFit(TT, whichFit, peaks, normalizer, roi), TT, roi,
+                                    FIT_NAMES[whichFit] + " fit", TT.shape[1],
+                                    lambda store: self.fitDone((whichFit, peaks), store))
+        if error is False:
+            self.liveFitGraphs(whichFit, peaks)
+        return error
 
-                self.OnePkFitData[j, :] = (out.best_values['amplitude'], 0, out.best_values['center'], 0,
-                                                   out.best_values['sigma'], 0)
+    def columnFit(self, TT, whichFit, peaks, normalizer, roi):
+        """
+        :param TT: normalized data
+        :param whichFit: char that represents the fit
+        :param peaks: number of peaks
+        :param normalizer: normalizer the data was divided by, part of the fit cache key
+        :param roi: rows (start, stop) the fit is restricted to, or None
+        :return: function fitting every column of the fit window, to be run on the fit worker
+        """
+        window = self.fitWindow(TT, roi)
 
-                # Saves fitted data of each fit
-                fitData = out.best_fit
-                binFit = np.reshape(fitData, (len(fitData), 1))
-                self.binFitData = np.concatenate((self.binFitData, binFit), axis=1)
+        def fit(progress):
+            return self.windowStore(self.fitEngine.fitColumns(window, whichFit, peaks, normalizer, progress), roi)
 
-                if self.continueGraphingEachFit == True:
-                    self.graphEachFitRawData(xx, yy, out.best_fit, 'G')
+        return fit
 
+    def refreshFit(self):
+        """Redoes the current fit on the fit worker once the data, normalizer or fit window it was made for
+        changed. Nothing is started while a fit is running: a fit of the old data is dropped when it finishes, and
+        the current fit is redone then.
+        """
+        graph = self.dockedOpt.graph
+        fitSettings = graph.peek('fitSettings')
+        if fitSettings is None or graph.isValid('fitted') or self.fitRunning():
+            return
+        TT = graph.get('normalized')
+        if TT is None:
+            return
+        whichFit, peaks = fitSettings
+        roi = graph.peek('roi')
+        self.startFitWorker(self.columnFit(TT, whichFit, peaks, graph.peek('normalizer'), roi), TT, roi,
+                            "Refitting (" + FIT_NAMES[whichFit] + ")", TT.shape[1],
+                            lambda store: self.fitDone(fitSettings, store, refit=True))
+
+    def fitReady(self):
+        """Checks that the current fit is up to date before it is graphed or exported. A fit whose data changed is
+        redone on the fit worker, and the status bar says so.
+        :return: truth value of the fit being up to date, or of there being no fit
+        """
+        graph = self.dockedOpt.graph
+        if graph.peek('fitSettings') is None or graph.isValid('fitted'):
+            return True
+        self.refreshFit()
+        self.myMainWindow.myStatusBar.showMessage("The fit is being redone on the changed data, try again once it "
+                                                  "is done", 10000)
+        return False
+
+    def fitRunning(self):
+        """
+        :return: truth value of the fit worker running a fit
+        """
+        return self.fitWorker is not None and self.fitWorker.isRunning()
+
+    def startFitWorker(self, fit, TT, roi, txt, total, finished):
+        """Runs a fit on the fit worker, with a progress bar that can cancel it.
+        :param fit: function called on the worker with the progress function of the fit engine
+        :param TT: normalized data being fitted
+        :param roi: fit window being used
+        :param txt: progress bar label
+        :param total: number of columns the progress function will report
+        :param finished: function called with the result of the fit
+        :return: truth value of error
+        """
+        if self.fitRunning():
+            QMessageBox.warning(self.myMainWindow, "Error", "A fit is already running.")
+            return True
+        self.fitInput = (TT, roi)
+        self.liveGraphs = None
+        self.fitWorker = FitWorker(fit, parent=self.myMainWindow)
+        self.fitWorker.columnsFitted.connect(self.columnsFitted)
+        self.fitWorker.fitFinished.connect(finished)
+        self.fitWorker.fitFailed.connect(self.fitFailed)
+        self.fitWorker.fitCancelled.connect(self.fitCancelled)
+        self.myMainWindow.startProgress(txt, total, self.fitEngine.cancel)
+        self.fitWorker.start()
+        return False
+
+    def fitDone(self, fitSettings, store, refit=False):
+        """Makes a finished fit the 'fitted' node of the processing graph, unless the data changed while it ran,
+        then graphs each fit and adds the graphing options. A dropped fit has the current fit redone, if there is
+        one.
+        :param fitSettings: line shape and number of peaks
+        :param store: FitResultStore of the fit
+        :param refit: truth value of the fit redoing the current fit from refreshFit, whose graphing options are
+        already there
+        :return: truth value of the fit being kept
+        """
+        self.myMainWindow.hideProgress()
+        graph = self.dockedOpt.graph
+        TT, roi = self.fitInput
+        if refit and graph.peek('fitSettings') != fitSettings:
+            return False  # The fit was reset while it was redone
+        if graph.peek('normalized') is not TT or graph.peek('roi') != roi:
+            self.myMainWindow.myStatusBar.showMessage("The data changed while fitting, the fit was dropped", 10000)
+            self.refreshFit()
             return False
-        except:
-            QMessageBox.warning(self.myMainWindow, "Error", "Please make sure the guesses are realistic when fitting.")
+        graph.set('fitSettings', fitSettings)
+        graph.put('fitted', store)
+        self.myMainWindow.myStatusBar.showMessage(self.fitEngine.fitLog[-1], 10000)
+        if refit:
             return True
+        self.graphEachFit(fitSettings[0])
+        self.dockedOpt.GraphingFitOptionsTree(fitSettings[0])
+        return True
 
-    def TwoPeakGaussianFit(self):
-        try:
-            error = self.twoPeakGaussianFit()
+    def fitFailed(self, error):
+        """
+        :param error: message of the exception raised by the fit
+        """
+        self.myMainWindow.hideProgress()
+        QMessageBox.warning(self.myMainWindow, "Error", "Please make sure the guesses are realistic when fitting."
+                                                        "\n\nException: " + error)
 
-            if error == False:
-                self.dockedOpt.twoPeakStat = True
-                self.dockedOpt.fitStat = True
-                self.dockedOpt.GraphingFitOptionsTree("G")
-        except Exception as ex:
-            QMessageBox.warning(self.myMainWindow, "Error", "Please make sure the guesses are realistic when fitting."
-                                                            "\n\nException: " + str(ex))
+    def fitCancelled(self, message):
+        """
+        :param message: how far the fit got
+        """
+        self.myMainWindow.hideProgress()
+        self.myMainWindow.myStatusBar.showMessage(message + "; the fitted columns are kept in the fit cache", 10000)
 
-    def twoPeakGaussianFit(self):
-        try:
-            nRow, nCol = self.dockedOpt.fileInfo()
-
-            self.binFitData = zeros((nRow, 0))
-            self.TwoPkGausFitData = zeros((nCol, 12))  # Creates the empty 2D List
-            for j in range(nCol):
-                yy1 = []
-                yy2 = []
-                yy = self.dockedOpt.TT[:, j]
-                i = 0
-                for y in yy:
-                    if i < len(yy) / 2:
-                        yy1.append(y)
-                    else:
-                        yy2.append(y)
-                    i += 1
-
-                xx = arange(0, len(yy))
-                xx1 = arange(0, len(yy) / 2)
-                xx2 = arange(len(yy) / 2, len(yy))
-                x1 = xx[0]
-                x2 = xx[-1]
-                y1 = yy[0]
-                y2 = yy[-1]
-                m = (y2 - y1) / (x2 - x1)
-                b = y2 - m * x2
-
-                mod1 = GaussianModel(prefix='p1_')
-
-                mod2 = GaussianModel(prefix='p2_')
-
-                pars1 = mod1.guess(yy1, x=xx1)
-                pars2 = mod2.guess(yy2, x=xx2)
-
-                mod = mod1 + mod2 + LinearModel()
-                pars = pars1 + pars2
-
-                pars.add('intercept', value=b, vary=True)
-                pars.add('slope', value=m, vary=True)
-                out = mod.fit(yy, pars, x=xx, slope=m)
-                QMessageBox.warning(self.myMainWindow, "Hi", "About to start fitting")
-
-                self.TwoPkGausFitData[j, :] = (out.best_values['p1_amplitude'], 0, out.best_values['p1_center'],
-                                                       0, out.best_values['p1_sigma'], 0,
-                                                       out.best_values['p2_amplitude'], 0, out.best_values['p2_center'],
-                                                       0, out.best_values['p2_sigma'], 0)
-
-                # Saves fitted data of each fit
-                fitData = out.best_fit
-                binFit = np.reshape(fitData, (len(fitData), 1))
-                self.binFitData = np.concatenate((self.binFitData, binFit), axis=1)
-
-                if self.continueGraphingEachFit == True:
-                    self.graphEachFitRawData(xx, yy, out.best_fit, 'G')
+    def columnsFitted(self, store, columns):
+        """Advances the progress bar and adds the new columns to the live graphs.
+        :param store: FitResultStore being filled
+        :param columns: columns that are done
+        """
+        self.myMainWindow.advanceProgress(len(columns))
+        if self.liveGraphs is not None:
+            self.updateLiveFitGraphs(store, columns)
+
+    def liveFitGraphs(self, whichFit, peaks):
+        """Tab with the amplitude, position and width of each peak against the voltage, filled in as the columns
+        are fitted.
+        :param whichFit: char that represents the fit
+        :param peaks: number of peaks
+        """
+        x = np.asarray(self.getVoltage(), dtype=float)
+        fig = Figure((5.0, 4.0), dpi=100)
+        canvas = FigureCanvas(fig)
+        lines = []
+        for i, (param, yLabel) in enumerate(zip(PEAK_PARAMS, ['Intensity', 'Position', 'Width'])):
+            axes = fig.add_subplot(3, 1, i + 1)
+            for prefix in peakPrefixes(peaks):
+                lines.append((prefix + param, axes.plot(x, np.full(len(x), np.nan), 'o', markersize=3)[0]))
+            axes.set_ylabel(yLabel)
+        axes.set_xlabel('Voltage')
+        name = FIT_NAMES[whichFit] + ' Fit Progress (Scan#: ' + self.readSpec.scan + ')'
+        fig.suptitle(name)
 
-            return False
-        except Exception as ex:
-            QMessageBox.warning(self.myMainWindow, "Error", "Please make sure the guesses are realistic when fitting."
-                                                            "\n\nException: " + str(ex))
-            return True
+        tab = QWidget()
+        tab.setStatusTip(name)
+        vbox = QVBoxLayout()
+        vbox.addWidget(NavigationToolbar(canvas, tab))
+        vbox.addWidget(canvas)
+        tab.setLayout(vbox)
+        self.myMainWindow.savingCanvasTabs(tab, name, canvas, fig)
+        roi = self.fitInput[1]
+        self.liveGraphs = {'canvas': canvas, 'lines': lines, 'done': np.zeros(len(x), dtype=bool),
+                           'rowOffset': 0 if roi is None else roi[0]}
+
+    def updateLiveFitGraphs(self, store, columns):
+        """Shows the parameters of the columns fitted so far.
+        :param store: FitResultStore being filled
+        :param columns: columns that are done
+        """
+        done = self.liveGraphs['done']
+        done[columns] = True
+        for name, line in self.liveGraphs['lines']:
+            values = store.value(name)
+            if name.endswith('center'):
+                values = values + self.liveGraphs['rowOffset']
+            line.set_ydata(np.where(done, values, np.nan))
+            line.axes.relim()
+            line.axes.autoscale_view()
+        self.liveGraphs['canvas'].draw_idle()
+
+    def fitData(self, TT, normalizer, fitSettings, roi):
+        """Compute function of the 'fitted' node of the processing graph, which is out of date after the
+        normalizer or the fit window changed. Fits are not run in this thread, nor beside a running fit worker
+        sharing the fit engine: the fit is redone on the fit worker by refreshFit, and fitDone puts it in the node.
+        Until then the node stays out of date, and asking for it raises FitPending.
+        :param TT: normalized data
+        :param normalizer: normalizer the data was divided by
+        :param fitSettings: line shape and number of peaks, or None before any fit
+        :param roi: rows (start, stop) the fit is restricted to, or None
+        :return: None before any fit
+        """
+        if fitSettings is None:
+            return None
+        self.refreshFit()
+        raise FitPending("The fit is being redone on the changed data, try again once it is done.")
 
-    def graphEachFitRawData(self, xx, yy, fitData, whichFit):
-        """This method graphs the raw data and the fitted data for each column.
-        :param xx: bins
-        :param yy: raw data column
-        :param popt: from the gaussian fit
-        :param whichPeak: number of peaks
+    def fitWindow(self, TT, roi):
         """
-        try:
-            self.mainGraph = QDialog(self.myMainWindow)
-            self.mainGraph.resize(600, 600)
-            dpi = 100
-            fig = Figure((3.0, 3.0), dpi=dpi)
-            canvas = FigureCanvas(fig)
-            canvas.setParent(self.mainGraph)
-            axes = fig.add_subplot(111)
-
-            axes.plot(xx, yy, 'b+:', label='data')
-            if whichFit == 'G':
-                axes.plot(xx, fitData, 'ro:', label='fit')
-                axes.set_title('Gaussian Fit')
-            elif whichFit == 'L':
-                axes.plot(xx, fitData, 'ro:', label='fit')
-                axes.set_title("Lorentzian Fit")
-            elif whichFit == 'V':
-                axes.plot(xx, fitData, 'ro:', label='fit')
-                axes.set_title("Voigt Fit")
-
-            axes.legend()
-            axes.set_xlabel('Bins')
-            axes.set_ylabel('Intensity')
-            canvas.draw()
-
-            vbox = QVBoxLayout()
-            hbox = QHBoxLayout()
-            self.skipEachFitGraphButton()
-            self.nextFitGraphButton()
-            hbox.addWidget(self.skipEachFitGraphBtn)
-            hbox.addStretch(1)
-            hbox.addWidget(self.nextFitGraphBtn)
-            graphNavigationBar = NavigationToolbar(canvas, self.mainGraph)
-            vbox.addLayout(hbox)
-            vbox.addWidget(graphNavigationBar)
-            vbox.addWidget(canvas)
-            self.mainGraph.setLayout(vbox)
-            self.mainGraph.exec_()
-        except Exception as e:
-            QMessageBox.warning(self.myMainWindow, "Error", "Please make sure the guesses are realistic when fitting. \n\n" + str(e))
+        :param TT: normalized data
+        :param roi: rows (start, stop) the fit is restricted to, or None
+        :return: view of the rows of TT that are fitted
+        """
+        if roi is None:
+            return TT
+        return TT[roi[0]:roi[1], :]
+
+    def windowStore(self, store, roi):
+        """Records the first row of the fit window in a store fitted on it.
+        :param store: FitResultStore
+        :param roi: rows (start, stop) the fit is restricted to, or None
+        :return: the store
+        """
+        if roi is not None:
+            store.rowOffset = roi[0]
+        return store
 
-    def skipEachFitGraphButton(self):
-        """Button that allows the user to skip each fit graph.
+    def FitWindowDialog(self):
+        """Dialog that restricts the fits to a window of L. The window can be typed in, found around the seeded
+        peaks, or cleared to fit every row.
+        """
+        if self.dockedOpt.FileError() != False:
+            return
+        nRow = self.dockedOpt.TT.shape[0]
+        lMin, lMax = self.readSpec.lMin, self.readSpec.lMax
+        if lMax == lMin:
+            lMin, lMax = 0.0, float(nRow)  # No L range known, the window is in rows
+        roi = self.dockedOpt.graph.peek('roi') or (0, nRow)
+
+        dialog = QDialog(self.myMainWindow)
+        dialog.setWindowTitle("Fit Window")
+        startSpin = QDoubleSpinBox()
+        stopSpin = QDoubleSpinBox()
+        for spin, row in [(startSpin, roi[0]), (stopSpin, roi[1])]:
+            spin.setDecimals(4)
+            spin.setRange(min(lMin, lMax), max(lMin, lMax))
+            spin.setSingleStep(abs(lMax - lMin) / nRow)
+            spin.setValue(lMin + row * (lMax - lMin) / nRow)
+
+        def autoWindow():
+            peaks = 2 if self.dockedOpt.twoPeakStat else 1
+            start, stop = seedWindow(self.dockedOpt.TT, peaks)
+            startSpin.setValue(lMin + start * (lMax - lMin) / nRow)
+            stopSpin.setValue(lMin + stop * (lMax - lMin) / nRow)
+
+        def fullRange():
+            startSpin.setValue(lMin)
+            stopSpin.setValue(lMax)
+
+        autoBtn = QPushButton('Auto')
+        autoBtn.setStatusTip("Window around the seeded peaks of every column")
+        autoBtn.clicked.connect(autoWindow)
+        fullBtn = QPushButton('Full Range')
+        fullBtn.clicked.connect(fullRange)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+
+        form = QFormLayout()
+        form.addRow("Start (L):", startSpin)
+        form.addRow("End (L):", stopSpin)
+        hbox = QHBoxLayout()
+        hbox.addWidget(autoBtn)
+        hbox.addWidget(fullBtn)
+        vbox = QVBoxLayout()
+        vbox.addLayout(form)
+        vbox.addLayout(hbox)
+        vbox.addWidget(buttons)
+        dialog.setLayout(vbox)
+
+        if dialog.exec_() == QDialog.Accepted:
+            rows = [int(round((spin.value() - lMin) / (lMax - lMin) * nRow)) for spin in (startSpin, stopSpin)]
+            self.setFitWindow(min(rows), max(rows))
+
+    def setFitWindow(self, start, stop):
+        """Restricts the fits to the rows start..stop-1. The current fit, if any, is redone on the window on the
+        fit worker.
+        :param start: first row
+        :param stop: row after the last one
+        :return: truth value of error
+        """
+        nRow = self.dockedOpt.TT.shape[0]
+        start, stop = max(start, 0), min(stop, nRow)
+        if stop - start < MIN_WINDOW_ROWS:
+            QMessageBox.warning(self.myMainWindow, "Error", "The fit window needs at least %d points." %
+                                MIN_WINDOW_ROWS)
+            return True
+        roi = None if (start, stop) == (0, nRow) else (start, stop)
+        if roi != self.dockedOpt.graph.peek('roi'):
+            self.closeFitPreview()
+            self.dockedOpt.graph.set('roi', roi)
+            self.refreshFit()
+        self.myMainWindow.myStatusBar.showMessage("Fit window: rows %d-%d of %d" % (start, stop - 1, nRow), 5000)
+        return False
+
+    @property
+    def fitStore(self):
+        """FitResultStore of the current fit. Raises FitPending while it is redone because the data changed, see
+        fitReady.
         """
-        self.skipEachFitGraphBtn = QPushButton('Skip')
-        self.skipEachFitGraphBtn.setStatusTip("Skip the graphing of each fit")
-        self.skipEachFitGraphBtn.clicked.connect(self.skipEachFit)
+        return self.dockedOpt.graph.get('fitted')
 
-    def nextFitGraphButton(self):
-        """Button that shows the next fit graph.
+    def setFastSolver(self, checked):
+        """Switches the fit engine between the lmfit solver and the batched solver.
+        :param checked: truth value of the Fast Solver action
         """
-        self.nextFitGraphBtn = QPushButton('Next')
-        self.nextFitGraphBtn.clicked.connect(self.nextFitGraph)
-        self.nextFitGraphBtn.setStatusTip("Graphs the next fit and the original data")
+        self.fitEngine.solver = 'fast' if checked else 'lmfit'
 
-    def nextFitGraph(self):
-        """Closes the current fit graph to show the next.
+    def setBootstrapErrors(self, checked):
+        """Switches the standard errors of the next fits between the covariance of each fit and a bootstrap of
+        resampled refits on the process pool.
+        :param checked: truth value of the Bootstrap Errors action
         """
-        self.mainGraph.close()
+        self.fitEngine.bootstrapSamples = BOOTSTRAP_SAMPLES if checked else 0
 
-    def skipEachFit(self):
-        """Closes the current fit graph and sets continueGraphingEachFit to false
-         so that other graphs are not showed.
-         """
-        self.continueGraphingEachFit = False
-        self.mainGraph.close()
+    def setStreaming(self, checked):
+        """Starts or stops fitting the open PVvalue file while its scan is running, with the line shape and peaks
+        of the current fit, or a Gaussian fit of the chosen number of peaks.
+        :param checked: truth value of the Streaming Fit action
+        """
+        if not checked:
+            self.streamingFit.stop()
+            return
+        fitSettings = self.dockedOpt.graph.peek('fitSettings')
+        if fitSettings is None and self.dockedOpt.FileError() == False:
+            chosePeak = self.dockedOpt.PeakDialog()
+            if chosePeak is not None:
+                fitSettings = ('G', 1 if chosePeak == 'One' else 2)
+        if fitSettings is None or self.streamingFit.start(fitSettings):
+            self.myMainWindow.streamingFitAction.setChecked(False)
+
+    def clearFitCache(self):
+        """Deletes every fit kept in the fit cache.
+        """
+        self.fitEngine.cache.clear()
+        self.myMainWindow.myStatusBar.showMessage("Fit cache cleared", 5000)
+
+    def graphEachFit(self, whichFit):
+        """Opens the paged grid of the raw data and the fitted data of each column.
+        :param whichFit: char that represents the fit
+        """
+        self.closeFitPreview()
+        rows = self.fitStore.rows()
+        self.fitPreview = FitPreviewGrid(self.myMainWindow, arange(rows.start, rows.stop), self.dockedOpt.TT[rows],
+                                         self.fitStore.bestFit, whichFit)
+        self.fitPreview.show()
+
+    def closeFitPreview(self):
+        """Closes the grid of each fit, whose data is about to change.
+        """
+        if self.fitPreview is not None:
+            self.fitPreview.close()
+            self.fitPreview.deleteLater()
+            self.fitPreview = None
 
     def GraphUtilGaussianFitGraphs(self, name, x, y, error, xLabel, yLabel, whichGraph):
         """Generic plotting method that plots depending on which graph is being plotted.
@@ -295,8 +530,8 @@ class GaussianFitting:
         """This method graphs the Amplitude for one peak.
         """
         x = self.getVoltage()
-        y = self.OnePkFitData[:, 0]
-        error = self.OnePkFitData[:, 1]
+        y = self.fitStore.value('amplitude')
+        error = self.fitStore.stderr('amplitude')
         xLabel = 'Voltage'
         yLabel = 'Intensity'
         name = 'Amplitude (Scan#: ' + self.readSpec.scan + ')'
@@ -307,8 +542,8 @@ class GaussianFitting:
         """This method graphs the peak position for one peak.
         """
         x = self.getVoltage()
-        y = self.OnePkFitData[:, 2]
-        error = self.OnePkFitData[:, 3]
+        y = self.fitStore.position('center')
+        error = self.fitStore.stderr('center')
         xLabel = 'Voltage'
         yLabel = 'Position'
         name = 'Position (Scan#: ' + self.readSpec.scan + ')'
@@ -319,8 +554,8 @@ class GaussianFitting:
         """This method graphs the Peak width for one peak.
         """
         x = self.getVoltage()
-        y = self.OnePkFitData[:, 4]
-        error = self.OnePkFitData[:, 5]
+        y = self.fitStore.value('sigma')
+        error = self.fitStore.stderr('sigma')
         xLabel = 'Voltage'
         yLabel = 'Width'
         name = 'Width (Scan#: ' + self.readSpec.scan + ')'
@@ -331,12 +566,12 @@ class GaussianFitting:
         """This method graphs the amplitude x width for one peak.
         """
         x = self.getVoltage()
-        yA = self.OnePkFitData[:, 0]
-        yW = self.OnePkFitData[:, 4]
-        a_err = self.OnePkFitData[:, 1]
-        w_err = self.OnePkFitData[:, 5]
+        yA = self.fitStore.value('amplitude')
+        yW = self.fitStore.value('sigma')
+        a_err = self.fitStore.stderr('amplitude')
+        w_err = self.fitStore.stderr('sigma')
         y = yA * yW
-        error = ((y * a_err) + (y * w_err)) / y
+        error = np.abs(y) * np.sqrt((a_err / yA) ** 2 + (w_err / yW) ** 2)  # Relative errors in quadrature
 
         xLabel = 'Voltage'
         yLabel = 'A x W'
@@ -348,8 +583,8 @@ class GaussianFitting:
         """This method graphs the peak one amplitude for two peak.
         """
         x = self.getVoltage()
-        y = self.TwoPkGausFitData[:, 0]
-        error = self.TwoPkGausFitData[:, 1]
+        y = self.fitStore.value('p1_amplitude')
+        error = self.fitStore.stderr('p1_amplitude')
         xLabel = 'Voltage'
         yLabel = 'Intensity'
         name = 'Peak #1 Amplitude (Scan#: ' + self.readSpec.scan + ')'
@@ -360,8 +595,8 @@ class GaussianFitting:
         """This method graphs the peak one position for two peak.
         """
         x = self.getVoltage()
-        y = self.TwoPkGausFitData[:, 2]
-        error = self.TwoPkGausFitData[:, 3]
+        y = self.fitStore.position('p1_center')
+        error = self.fitStore.stderr('p1_center')
         xLabel = 'Voltage'
         yLabel = 'Position'
         name = 'Peak #1 Position (Scan#: ' + self.readSpec.scan + ')'
@@ -372,8 +607,8 @@ class GaussianFitting:
         """This method graphs the peak one width for two peak.
         """
         x = self.getVoltage()
-        y = self.TwoPkGausFitData[:, 4]
-        error = self.TwoPkGausFitData[:, 5]
+        y = self.fitStore.value('p1_sigma')
+        error = self.fitStore.stderr('p1_sigma')
         xLabel = 'Voltage'
         yLabel = 'Width'
         name = 'Peak #1 Width (Scan#: ' + self.readSpec.scan + ')'
@@ -384,12 +619,12 @@ class GaussianFitting:
         """This method graphs the peak one amplitude x width for two peak.
         """
         x = self.getVoltage()
-        yA = self.TwoPkGausFitData[:, 0]
-        yW = self.TwoPkGausFitData[:, 4]
-        a_err = self.TwoPkGausFitData[:, 1]
-        w_err = self.TwoPkGausFitData[:, 5]
+        yA = self.fitStore.value('p1_amplitude')
+        yW = self.fitStore.value('p1_sigma')
+        a_err = self.fitStore.stderr('p1_amplitude')
+        w_err = self.fitStore.stderr('p1_sigma')
         y = yA * yW
-        error = ((y * a_err) + (y * w_err))/y
+        error = np.abs(y) * np.sqrt((a_err / yA) ** 2 + (w_err / yW) ** 2)  # Relative errors in quadrature
 
         xLabel = 'Voltage'
         yLabel = 'A x W'
@@ -401,8 +636,8 @@ class GaussianFitting:
         """This method graphs the peak two Amplitude for two peak.
         """
         x = self.getVoltage()
-        y = self.TwoPkGausFitData[:, 6]
-        error = self.TwoPkGausFitData[:, 7]
+        y = self.fitStore.value('p2_amplitude')
+        error = self.fitStore.stderr('p2_amplitude')
         xLabel = 'Voltage'
         yLabel = 'Intensity'
         name = 'Peak #2 Amplitude (Scan#: ' + self.readSpec.scan + ')'
@@ -414,8 +649,8 @@ class GaussianFitting:
         """This method graphs the peak two position for two peak.
         """
         x = self.getVoltage()
-        y = self.TwoPkGausFitData[:, 8]
-        error = self.TwoPkGausFitData[:, 9]
+        y = self.fitStore.position('p2_center')
+        error = self.fitStore.stderr('p2_center')
         xLabel = 'Voltage'
         yLabel = 'Position'
         name = 'Peak #2 Position (Scan#: ' + self.readSpec.scan + ')'
@@ -426,8 +661,8 @@ class GaussianFitting:
         """This method graphs the peak two width for two peak.
         """
         x = self.getVoltage()
-        y = self.TwoPkGausFitData[:, 10]
-        error = self.TwoPkGausFitData[:, 11]
+        y = self.fitStore.value('p2_sigma')
+        error = self.fitStore.stderr('p2_sigma')
         xLabel = 'Voltage'
         yLabel = 'Width'
         name = 'Peak #2 Width (Scan#: ' + self.readSpec.scan + ')'
@@ -438,12 +673,12 @@ class GaussianFitting:
         """This method graphs the peak two amplitude x width for the two peak.
         """
         x = self.getVoltage()
-        yA = self.TwoPkGausFitData[:, 6]
-        yW = self.TwoPkGausFitData[:, 10]
-        a_err = self.TwoPkGausFitData[:, 7]
-        w_err = self.TwoPkGausFitData[:, 11]
+        yA = self.fitStore.value('p2_amplitude')
+        yW = self.fitStore.value('p2_sigma')
+        a_err = self.fitStore.stderr('p2_amplitude')
+        w_err = self.fitStore.stderr('p2_sigma')
         y = yA * yW
-        error = ((y * a_err) + (y * w_err)) / y
+        error = np.abs(y) * np.sqrt((a_err / yA) ** 2 + (w_err / yW) ** 2)  # Relative errors in quadrature
 
         xLabel = 'Voltage'
         yLabel = 'A x W'
@@ -452,93 +687,75 @@ class GaussianFitting:
         self.GraphUtilGaussianFitGraphs(name, x, y, error, xLabel, yLabel, 'G')
 
     def getVoltage(self):
-        """This method gets the voltage of the bins.
+        """This method gets the voltage of the bins, from the header of the PVvalue file. The header is only read
+        the first time, every graph of the file then shares the same read-only axis.
         :return: the voltage
         """
         try:
-            x = [] # X array initialized
-            PVInfo = {}
-
-            # Gets the amplitude
-            inF = open(self.dockedOpt.fileName, 'r')
-            lines = inF.readlines()
-            header = ''
-            for (iL, line) in enumerate(lines):
-                if line.startswith('#'):
-                    header = line
-                    break
-            inF.close()
-            headerParts = header.split('(')
-            titles = headerParts[1].split(',')
-            values = headerParts[2].split(',')
-
-            for i in range(len(titles)):
-                if i == (len(titles) - 1):
-                    lastT = titles[i].split(')')
-                    lastV = values[i].split(')')
-                    PVInfo.update({str(lastT[0].strip()): float(lastV[0])})
-                else:
-                    PVInfo.update({str(titles[i].strip()): float(values[i])})
-            bins = PVInfo['N_bins']
-            amp = PVInfo['amplitude']
-
-            print ("Amplitude: ", amp)
-
-            print ("Bins: ",  bins)
-
-            # Uses the data to find the x axis
-            ampStart = 0
-            rate = (amp/2)/(bins/4)
-
-        
-            for j in range(int(bins/4)):
-                ampStart = ampStart + rate
-                x.append(ampStart)
-
-            for j in range(int(bins/2)):
-                ampStart = ampStart - rate
-                x.append(ampStart)
-
-            for j in range(int(bins / 4)):
-                ampStart = ampStart + rate
-                x.append(ampStart)
-
-            return x
+            return voltageAxis(self.dockedOpt.fileName)
         except Exception as e:
             QMessageBox.warning(self.myMainWindow, "Error", "Unable to detect voltage. Please make sure the PVvalue "
                                                             "contains the voltage in the comments.\n\n"
                                                             "Exception: " + str(e))
     # -----------------------------------------Lattice Fit-------------------------------------------------------------#
-    def PositionLFit(self, pos, rows):
+    def PositionLFit(self, pos, rows, latticeSettings, rowOffset=0):
         """This method calculates the lattice based on the passed paramaters.
-        :param pos: position of the peak
+        :param pos: position of the peak, scalar or array
         :param rows: number of total points
+        :param latticeSettings: lattice element, minimum and maximum L of the scan
+        :param rowOffset: first row of the fit window the position is relative to
         """
-        l = (1/(((pos/rows)*(self.readSpec.lMax-self.readSpec.lMin)+self.readSpec.lMin)/2))*self.readSpec.lElement
+        lElement, lMin, lMax = latticeSettings
+        pos = pos + rowOffset
+        l = (1/(((pos/rows)*(lMax-lMin)+lMin)/2))*lElement
         return l
 
-    def doLFit(self):
-        """This function stores the lattice in arrays depending on the peak.
+    def latticeConstants(self, fitStore, latticeSettings):
+        """Computes the 'lattice' node of the processing graph, the lattice constant of each peak in every column.
+        :param fitStore: FitResultStore of the fit
+        :param latticeSettings: lattice element, minimum and maximum L of the scan, or None before the lattice fit
+        :return: list with one array per peak
         """
-        try:
-            nRow, nCol = self.dockedOpt.fileInfo()
-
-            if  self.dockedOpt.onePeakStat == True :
-                self.LPosData = []  # L Constant for One Peak
-                for i in range(nCol):
-                    self.LPosData.append(self.PositionLFit(self.OnePkFitData[i, 2], nRow))
-
-            elif self.dockedOpt.twoPeakStat == True:
-                self.LPos1Data = []  # L Constant for Two Peak [#1]
-                self.LPos2Data = []  # L Constant for Two Peak [#2]
-                # Position 1
-                for i in range(nCol):
-                  self.LPos1Data.append(self.PositionLFit(self.TwoPkGausFitData[i, 4], nCol))
-                # Position 2
-                for i in range(nCol):
-                  self.LPos2Data.append(self.PositionLFit(self.TwoPkGausFitData[i, 6], nCol))
-        except:
-            QMessageBox.warning(self.myMainWindow, "Error", "Please make sure the gaussian fit was done correctly.")
+        if fitStore is None or latticeSettings is None:
+            return None
+        centers = ['center'] if fitStore.peaks == 1 else ['p1_center', 'p2_center']
+        rows = self.dockedOpt.TT.shape[0]
+        return [self.PositionLFit(fitStore.value(name), rows, latticeSettings, fitStore.rowOffset)
+                for name in centers]
+
+    def latticePercentChange(self, lattice):
+        """Computes the 'percentChange' node of the processing graph, the %-change of each lattice constant from
+        the first column.
+        :param lattice: list from latticeConstants
+        :return: list with one array per peak
+        """
+        if lattice is None:
+            return None
+        return [(L - L[0]) / L[0] * 100 for L in lattice]
+
+    @property
+    def LPosData(self):
+        return self.dockedOpt.graph.get('lattice')[0]
+
+    @property
+    def LPos1Data(self):
+        return self.dockedOpt.graph.get('lattice')[0]
+
+    @property
+    def LPos2Data(self):
+        return self.dockedOpt.graph.get('lattice')[1]
+
+    @property
+    def LPosPrcChangeData(self):
+        return self.dockedOpt.graph.get('percentChange')[0]
+
+    @property
+    def LPos1PrcChangeData(self):
+        return self.dockedOpt.graph.get('percentChange')[0]
+
+    @property
+    def LPos2PrcChangeData(self):
+        return self.dockedOpt.graph.get('percentChange')[1]
 
     def graphOnePeakLFitPos(self):
         """This method graphs the Lattice fit position for one peak.
@@ -573,32 +790,6 @@ class GaussianFitting:
 
         self.GraphUtilGaussianFitGraphs(name, x, y, None, xLabel, yLabel, 'L')
 
-    def doLFitPercentChange(self):
-        """This function finds the percentage change of the lattice, depending on the peak.
-        """
-        try:
-            self.LPosPrcChangeData = []
-
-            if self.dockedOpt.onePeakStat == True:
-                for i in range(0, len(self.LPosData)):
-                    pctChangeData = ((self.LPosData[i] - self.LPosData[0]) / self.LPosData[0]) * 100
-                    self.LPosPrcChangeData.append(pctChangeData)
-
-            elif self.dockedOpt.twoPeakStat == True:
-                self.LPos1PrcChangeData = []
-                self.LPos2PrcChangeData = []
-                for i in range(0, len(self.LPos1Data)):
-                    pctChangeData = ((self.LPos1Data[i] - self.LPos1Data[0]) / self.LPos1Data[0]) * 100
-                    self.LPos1PrcChangeData.append(pctChangeData)
-
-                for i in range(0, len(self.LPos2Data)):
-                    pctChangeData = ((self.LPos2Data[i] - self.LPos2Data[0]) / self.LPos2Data[0]) * 100
-                    self.LPos2PrcChangeData.append(pctChangeData)
-        except:
-            QMessageBox.warning(self.myMainWindow, "Error", "Something went wrong while doing the percentage change"
-                                                            "lattice fit. Make sure the lattice fit was "
-                                                            "done correctly.")
-
     def percentageChangeLConstantOnePeak(self):
         """This method graphs the lattice %-change for one peak.
         """
@@ -634,7 +825,7 @@ class GaussianFitting:
 
     def EachFitDataReport(self):
         try:
-            if self.dockedOpt.fitStat == True:
+            if self.dockedOpt.fitStat == True and self.fitReady():
                 selectedFilters = ".txt"
                 reportFile, reportFileFilter = QFileDialog.getSaveFileName(self.myMainWindow, "Save Report", None, selectedFilters)
 
@@ -650,10 +841,13 @@ class GaussianFitting:
 
                     scanNum = self.readSpec.scan
                     comment = "#C PVvalue #" + scanNum + "\n"
+                    rows = self.fitStore.rows()
+                    if self.dockedOpt.graph.peek('roi') is not None:
+                        comment += "#C Fit window: rows %d-%d\n" % (rows.start, rows.stop - 1)
                     if self.dockedOpt.onePeakStat == True:
-                        np.savetxt(reportFile, self.binFitData, fmt=str('%f'), header=header, comments=comment)
+                        np.savetxt(reportFile, self.fitStore.bestFit, fmt=str('%f'), header=header, comments=comment)
                     elif self.dockedOpt.twoPeakStat == True:
-                        np.savetxt(reportFile, self.binFitData, fmt=str('%-14.6f'), delimiter=" ", header=header, comments=comment)
+                        np.savetxt(reportFile, self.fitStore.bestFit, fmt=str('%-14.6f'), delimiter=" ", header=header, comments=comment)
         except:
             QMessageBox.warning(self.myMainWindow, "Error", "Make sure the gaussian fit was done properly, before "
                                                             "exporting the report again.")
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Kernels that evaluate the peaks plus linear background composites and their Jacobians into preallocated buffers.
+#C They are compiled with Numba when it is installed and fall back to numpy otherwise.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import math
+import time
+
+import numpy as np
+from lmfit.models import LinearModel
+
+try:
+    import numba
+except ImportError:  # The numpy kernels are used instead
+    numba = None
+
+from xPlotUtil.Source.PeakModels import PEAK_MODELS, RESIDUAL_SIGN, S2PI, TINY, PV_ETA, PV_GAUSS, PV_LORENTZ, \
+    paramNames, peakValue, peakDerivatives
+from xPlotUtil.Source.FitResultStore import FIT_NAMES
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+NUMBA_AVAILABLE = numba is not None
+JIT_SHAPES = {'G': 0, 'L': 1, 'P': 2}  # Line shapes with compiled kernels. Voigt needs the Faddeeva function.
+
+
+def jit(function):
+    """Compiles a kernel with Numba, or leaves it as it is when Numba is not installed.
+    """
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+@jit
+def _gaussian(dx, amplitude, sigma):
+    """
+    :return: value and derivatives with respect to amplitude, center and sigma of a Gaussian at one point
+    """
+    unit = math.exp(-dx * dx / (2 * sigma * sigma)) / (S2PI * sigma)
+    f = amplitude * unit
+    return f, unit, f * dx / (sigma * sigma), f * (dx * dx / (sigma * sigma * sigma) - 1 / sigma)
+
+
+@jit
+def _lorentzian(dx, amplitude, sigma):
+    """
+    :return: value and derivatives with respect to amplitude, center and sigma of a Lorentzian at one point
+    """
+    D = dx * dx + sigma * sigma
+    unit = sigma / (math.pi * D)
+    return (amplitude * unit, unit, amplitude / math.pi * 2 * sigma * dx / (D * D),
+            amplitude / math.pi * (dx * dx - sigma * sigma) / (D * D))
+
+
+@jit
+def _peak(shape, dx, amplitude, sigma):
+    """
+    :param shape: value of JIT_SHAPES
+    :return: value and derivatives with respect to amplitude, center and sigma of a line shape at one point
+    """
+    if shape == 0:
+        return _gaussian(dx, amplitude, sigma)
+    elif shape == 1:
+        return _lorentzian(dx, amplitude, sigma)
+    l0, l1, l2, l3 = _lorentzian(dx, amplitude, PV_LORENTZ * sigma)
+    g0, g1, g2, g3 = _gaussian(dx, amplitude, PV_GAUSS * sigma)
+    return (PV_ETA * l0 + (1 - PV_ETA) * g0, PV_ETA * l1 + (1 - PV_ETA) * g1, PV_ETA * l2 + (1 - PV_ETA) * g2,
+            PV_ETA * PV_LORENTZ * l3 + (1 - PV_ETA) * PV_GAUSS * g3)
+
+
+@jit
+def _compositeLoops(shape, peaks, x, P, out):
+    """Loops of compositeValues, without temporaries.
+    """
+    nPar = P.shape[1]
+    for j in range(P.shape[0]):
+        for n in range(x.shape[0]):
+            total = P[j, nPar - 2] * x[n] + P[j, nPar - 1]
+            for i in range(peaks):
+                total += _peak(shape, x[n] - P[j, 3 * i + 1], P[j, 3 * i], max(P[j, 3 * i + 2], TINY))[0]
+            out[n, j] = total
+
+
+@jit
+def _jacobianLoops(shape, peaks, x, P, out):
+    """Loops of compositeJacobians, without temporaries.
+    """
+    nPar = P.shape[1]
+    for j in range(P.shape[0]):
+        for n in range(x.shape[0]):
+            for i in range(peaks):
+                value, dAmplitude, dCenter, dSigma = _peak(shape, x[n] - P[j, 3 * i + 1], P[j, 3 * i],
+                                                           max(P[j, 3 * i + 2], TINY))
+                out[j, n, 3 * i] = dAmplitude
+                out[j, n, 3 * i + 1] = dCenter
+                out[j, n, 3 * i + 2] = dSigma
+            out[j, n, nPar - 2] = x[n]
+            out[j, n, nPar - 1] = 1.0
+
+
+def compiled(whichFit):
+    """
+    :param whichFit: char that represents the fit
+    :return: truth value of the fit being evaluated by compiled kernels
+    """
+    return NUMBA_AVAILABLE and whichFit in JIT_SHAPES
+
+
+def compositeValues(whichFit, peaks, x, P, out):
+    """Evaluates the peaks plus linear background of many columns into a buffer.
+    :param whichFit: char that represents the fit
+    :param peaks: number of peaks
+    :param x: x-values (nRow)
+    :param P: parameters (nCol x nPar), ordered as PeakModels.paramNames
+    :param out: buffer (nRow x nCol), may be a view of a larger one
+    :return: out
+    """
+    x = np.asarray(x, dtype=np.float64).ravel()
+    if compiled(whichFit):
+        _compositeLoops(JIT_SHAPES[whichFit], peaks, x, np.ascontiguousarray(P, dtype=np.float64), out)
+        return out
+    x = x.reshape(-1, 1)
+    np.multiply(x, P[:, -2], out=out)
+    out += P[:, -1]
+    for i in range(peaks):
+        out += peakValue(whichFit, x, P[:, 3 * i], P[:, 3 * i + 1], np.maximum(P[:, 3 * i + 2], TINY))
+    return out
+
+
+def compositeJacobians(whichFit, peaks, x, P, out):
+    """Evaluates the Jacobian of the model of many columns into a buffer.
+    :param out: buffer (nCol x nRow x nPar), may be the first columns of a larger one
+    :return: out
+    """
+    x = np.asarray(x, dtype=np.float64).ravel()
+    if compiled(whichFit):
+        _jacobianLoops(JIT_SHAPES[whichFit], peaks, x, np.ascontiguousarray(P, dtype=np.float64), out)
+        return out
+    column = x.reshape(-1, 1)
+    for i in range(peaks):
+        partials = peakDerivatives(whichFit, column, P[:, 3 * i], P[:, 3 * i + 1], np.maximum(P[:, 3 * i + 2], TINY))
+        for k, partial in enumerate(partials):
+            out[:, :, 3 * i + k] = partial.T
+    out[:, :, -2] = x
+    out[:, :, -1] = 1
+    return out
+
+
+def modelJacobian(whichFit, peaks):
+    """Creates the analytic Jacobian of the residual of the composite model from FitEngine.buildModel, to be
+    passed to lmfit as Dfun with col_deriv=1. The kernel and the returned array reuse buffers from one call to the
+    next, which is safe because MINPACK copies the Jacobian.
+    :param whichFit: char that represents the fit
+    :param peaks: number of peaks
+    :return: Jacobian function with the signature lmfit expects
+    """
+    names = paramNames(peaks)
+    buffers = {}
+
+    def Dfun(pars, data, weights, x=None, **kwargs):
+        values = pars.valuesdict()
+        varying = [i for i, name in enumerate(names) if pars[name].vary]
+        shape = (len(varying), len(x))
+        if buffers.get('jac') is None or buffers['jac'].shape != shape:
+            buffers['P'] = np.empty((1, len(names)))
+            buffers['J'] = np.empty((1, len(x), len(names)))
+            buffers['jac'] = np.empty(shape)
+        P, J, jac = buffers['P'], buffers['J'], buffers['jac']
+        P[0] = [values[name] for name in names]
+        compositeJacobians(whichFit, peaks, x, P, J)
+        np.take(J[0].T, varying, axis=0, out=jac)
+        jac *= RESIDUAL_SIGN
+        if weights is not None:
+            jac *= weights
+        return jac
+
+    return Dfun
+
+
+def benchmark(nRow=200, nCol=2000, repeats=3):
+    """Compares the throughput of the kernels with lmfit's built-in line shapes on one peak composites. lmfit
+    evaluates one column per call, the kernels all of them at once.
+    :param nRow: points per column
+    :param nCol: columns
+    :param repeats: timings kept as the best of this many
+    :return: list of (fit, lmfit columns/s, kernel columns/s, kernel Jacobian columns/s)
+    """
+    x = np.arange(nRow, dtype=np.float64)
+    rng = np.random.default_rng(0)
+    P = np.column_stack([rng.uniform(50, 100, nCol), rng.uniform(0.4, 0.6, nCol) * nRow,
+                         rng.uniform(2, 8, nCol), rng.uniform(-0.01, 0.01, nCol), rng.uniform(0, 1, nCol)])
+    values = np.empty((nRow, nCol))
+    jacobians = np.empty((nCol, nRow, P.shape[1]))
+
+    def best(function):
+        times = []
+        for k in range(repeats):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return nCol / min(times)
+
+    rows = []
+    for whichFit in sorted(PEAK_MODELS):
+        mod = PEAK_MODELS[whichFit]() + LinearModel()
+        pars = mod.make_params()
+        names = paramNames(1)
+
+        def lmfitEval():
+            for j in range(nCol):
+                for name, value in zip(names, P[j]):
+                    pars[name].value = value
+                mod.eval(pars, x=x)
+
+        compositeValues(whichFit, 1, x, P[:1], values[:, :1])  # Compiles the kernels outside of the timing
+        compositeJacobians(whichFit, 1, x, P[:1], jacobians[:1])
+        rows.append((whichFit, best(lmfitEval), best(lambda: compositeValues(whichFit, 1, x, P, values)),
+                     best(lambda: compositeJacobians(whichFit, 1, x, P, jacobians))))
+    return rows
+
+
+if __name__ == '__main__':
+    print("Kernels compiled with Numba: " + str(NUMBA_AVAILABLE))
+    print("%-14s %14s %14s %16s" % ('Columns/s', 'lmfit eval', 'kernel eval', 'kernel Jacobian'))
+    for whichFit, lmfitRate, valueRate, jacobianRate in benchmark():
+        print("%-14s %14.0f %14.0f %16.0f" % (FIT_NAMES[whichFit], lmfitRate, valueRate, jacobianRate))
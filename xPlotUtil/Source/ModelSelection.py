@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Picks the line shape and number of peaks of every column by an information criterion. Headless, like FitEngine.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import numpy as np
+
+from xPlotUtil.Source.FitResultStore import FIT_NAMES
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+CANDIDATES = [('G', 1), ('L', 1), ('V', 1), ('G', 2), ('L', 2), ('V', 2)]
+CRITERIA = ('aic', 'bic')
+
+
+def candidateName(whichFit, peaks):
+    """
+    :return: short name of a candidate model, e.g. G1
+    """
+    return "%s%d" % (whichFit, peaks)
+
+
+def informationCriterion(store, nVary, criterion='bic'):
+    """Akaike or Bayesian information criterion of every column of a fit, from its chi-square. Columns whose fit
+    failed get infinity, so they never win.
+    :param store: FitResultStore of the fit
+    :param nVary: number of fitted parameters
+    :param criterion: 'aic' or 'bic'
+    :return: array (nCol)
+    """
+    n = store.nRow
+    with np.errstate(divide='ignore'):
+        likelihood = n * np.log(np.maximum(store.chisqr, np.finfo(float).tiny) / n)
+    if criterion == 'aic':
+        values = likelihood + 2 * nVary
+    elif criterion == 'bic':
+        values = likelihood + nVary * np.log(n)
+    else:
+        raise ValueError("Unknown criterion: " + str(criterion))
+    values[~store.success | ~np.isfinite(store.chisqr)] = np.inf
+    return values
+
+
+class ModelSelection:
+    """Fits of the same data with several candidate models, and the model that won each column.
+    """
+
+    def __init__(self, candidates, stores, nVary, criterion='bic'):
+        """
+        :param candidates: list of (whichFit, peaks)
+        :param stores: FitResultStore of each candidate
+        :param nVary: number of fitted parameters of each candidate
+        :param criterion: 'aic' or 'bic'
+        """
+        self.candidates = list(candidates)
+        self.stores = list(stores)
+        self.criterion = criterion
+        self.values = np.stack([informationCriterion(store, k, criterion) for store, k in zip(stores, nVary)],
+                               axis=1)
+        self.winners = np.argmin(self.values, axis=1)  # Index of the winning candidate of each column
+
+    def names(self):
+        """
+        :return: short names of the candidates
+        """
+        return [candidateName(whichFit, peaks) for whichFit, peaks in self.candidates]
+
+    def wins(self):
+        """
+        :return: number of columns won by each candidate
+        """
+        return np.bincount(self.winners, minlength=len(self.candidates))
+
+    def bestIndex(self):
+        """The candidate that wins the most columns, ties going to the lowest total criterion of the finite
+        columns.
+        :return: index of the candidate
+        """
+        finite = np.where(np.isfinite(self.values), self.values, 0).sum(axis=0)
+        order = np.lexsort((finite, -self.wins()))
+        return int(order[0])
+
+    def best(self):
+        """
+        :return: (whichFit, peaks) of the best candidate
+        """
+        return self.candidates[self.bestIndex()]
+
+    def winnerOf(self, j):
+        """
+        :param j: column
+        :return: (whichFit, peaks) of the model that won the column
+        """
+        return self.candidates[self.winners[j]]
+
+    def summary(self):
+        """
+        :return: line listing the columns won by each candidate and the chosen model
+        """
+        wins = ", ".join("%s %d" % (name, count) for name, count in zip(self.names(), self.wins()) if count > 0)
+        whichFit, peaks = self.best()
+        return "Auto fit (%s): %s columns won; using %s, %d peak(s)" % (
+            self.criterion.upper(), wins, FIT_NAMES[whichFit], peaks)
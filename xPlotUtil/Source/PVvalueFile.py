@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Reading of the PVvalue files, the text matrices of the points (rows) and bins (columns) of a scan.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import glob
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+COMMENT = re.compile(br'#[^\n]*')  # Comments, skipped like np.loadtxt does, the header line among them
+BLANK_LINE = re.compile(br'\n[ \t\r]*(?=\n)')
+C_LOADTXT = tuple(int(v) for v in np.__version__.split('.')[:2]) >= (1, 23)
+TAIL_CAPACITY = 64  # Rows of the first buffer of PVvalueTail
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.xPlotUtil', 'matrixCache')
+DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+_metadata = {}  # File name -> (size, modification time, PVvalueHeader, voltage axis), see pvMetadata
+
+
+def parseMatrix(buf):
+    """Parses a whitespace separated text matrix with the fastest tokenizer written in C that NumPy has: the reader
+    of np.loadtxt from NumPy 1.23 on, and np.fromstring before, when np.loadtxt still parsed line by line in Python.
+    :param buf: bytes of the file
+    :return: array (nRow x nCol)
+    """
+    if C_LOADTXT:
+        return np.loadtxt(io.BytesIO(buf), dtype=np.float64, ndmin=2)
+    if b'#' in buf:
+        buf = COMMENT.sub(b'', buf)
+    buf = buf.strip()
+    if not buf:
+        raise ValueError("No data in the file")
+    firstLine = buf.split(b'\n', 1)[0]
+    nCol = len(firstLine.split())
+    nRow = buf.count(b'\n') + 1 - len(BLANK_LINE.findall(buf))
+    with warnings.catch_warnings():
+        # Text that is not a number stops the parsing with a warning, which is turned into the error it is
+        warnings.simplefilter('error', DeprecationWarning)
+        values = np.fromstring(buf, dtype=np.float64, sep=' ')
+    if values.size != nRow * nCol:
+        raise ValueError("The rows of the file do not all have %d columns" % nCol)
+    return values.reshape(nRow, nCol)
+
+
+def firstEmptyColumn(sums):
+    """
+    :param sums: sum of each column
+    :return: number of columns before the first one that sums to zero
+    """
+    empty = np.flatnonzero(sums == 0)
+    if len(empty):
+        return empty[0]
+    return len(sums)
+
+
+def trimEmptyColumns(data):
+    """Drops the empty bins at the end of the rows, from the first column that sums to zero on.
+    :param data: array (nRow x nCol)
+    :return: view of the first columns of data
+    """
+    return data[:, :firstEmptyColumn(data.sum(axis=0))]
+
+
+def loadPVvalue(fileName):
+    """
+    :param fileName: PVvalue file
+    :return: array (nRow x nCol) of the file, without the empty bins
+    """
+    with open(fileName, 'rb') as f:
+        buf = f.read()
+    return trimEmptyColumns(parseMatrix(buf))
+
+
+class PVvalueHeader(namedtuple('PVvalueHeader', ['fields', 'bins', 'amplitude'])):
+    """Values of the header line of a PVvalue file, '# ... (N_bins, amplitude, ...) ... (200, 10, ...)': every
+    field by title, and the number of bins and the amplitude of the voltage.
+    """
+    __slots__ = ()
+
+
+def parseHeader(line):
+    """
+    :param line: header line of a PVvalue file
+    :return: PVvalueHeader
+    """
+    parts = line.split('(')
+    if len(parts) < 3:
+        raise ValueError("The header line has no (titles) (values): " + line.strip())
+    titles = [title.strip() for title in parts[1].split(')')[0].split(',')]
+    values = [float(value) for value in parts[2].split(')')[0].split(',')]
+    fields = dict(zip(titles, values))
+    return PVvalueHeader(fields, fields['N_bins'], fields['amplitude'])
+
+
+def readHeader(fileName):
+    """Reads a PVvalue file up to its first comment line, the header, and no further.
+    :param fileName: PVvalue file
+    :return: PVvalueHeader
+    """
+    with open(fileName, 'r') as f:
+        for line in f:
+            if line.startswith('#'):
+                return parseHeader(line)
+    raise ValueError("No header line in " + fileName)
+
+
+def triangleAxis(bins, amplitude):
+    """The voltage of the bins, a triangle wave going up a quarter of the bins, down half of them and up the last
+    quarter, from 0 to amplitude/2, -amplitude/2 and back to 0.
+    :param bins: number of bins
+    :param amplitude: peak to peak voltage
+    :return: array of the voltage of each bin
+    """
+    rate = (amplitude / 2) / (bins / 4)
+    quarter = int(bins / 4)
+    steps = np.concatenate([np.full(quarter, rate), np.full(int(bins / 2), -rate), np.full(quarter, rate)])
+    return np.cumsum(steps)
+
+
+def pvMetadata(fileName):
+    """The header and voltage axis of a PVvalue file, read once and reused until the size or modification time of
+    the file changes.
+    :param fileName: PVvalue file
+    :return: PVvalueHeader, read-only voltage axis
+    """
+    st = os.stat(fileName)
+    entry = _metadata.get(fileName)
+    if entry is None or entry[:2] != (st.st_size, st.st_mtime_ns):
+        header = readHeader(fileName)
+        voltage = triangleAxis(header.bins, header.amplitude)
+        voltage.setflags(write=False)  # Shared by every graph
+        entry = (st.st_size, st.st_mtime_ns, header, voltage)
+        _metadata[fileName] = entry
+    return entry[2], entry[3]
+
+
+def pvHeader(fileName):
+    """
+    :param fileName: PVvalue file
+    :return: PVvalueHeader of the file
+    """
+    return pvMetadata(fileName)[0]
+
+
+def voltageAxis(fileName):
+    """
+    :param fileName: PVvalue file
+    :return: read-only array of the voltage of each bin of the file
+    """
+    return pvMetadata(fileName)[1]
+
+
+class PVvalueTail:
+    """A PVvalue file that is still being written, one row per point of the scan. Each read parses only the complete
+    lines appended since the last one, into a buffer of rows that doubles its capacity when it is full, so that a
+    scan of n points is copied O(log n) times rather than n times.
+    """
+
+    def __init__(self, fileName):
+        """
+        :param fileName: PVvalue file
+        """
+        self.fileName = fileName
+        self.reset()
+
+    def reset(self):
+        """Forgets the rows read so far.
+        """
+        self.offset = 0  # Bytes of the file parsed so far, whole lines only
+        self.buffer = None  # Rows read so far, followed by unused capacity
+        self.nRow = 0
+        self.columnSums = None  # Sum of each column of the rows read so far, for the empty bins
+
+    def read(self):
+        """Parses the lines appended to the file since the last read. A file that shrank is read again from its
+        start.
+        :return: number of new rows
+        """
+        size = os.path.getsize(self.fileName)
+        if size < self.offset:
+            self.reset()
+        with open(self.fileName, 'rb') as f:
+            f.seek(self.offset)
+            buf = f.read(size - self.offset)
+        complete = buf[:buf.rfind(b'\n') + 1]
+        self.offset += len(complete)
+        if not COMMENT.sub(b'', complete).strip():
+            return 0
+        rows = parseMatrix(complete)
+        self.append(rows)
+        return rows.shape[0]
+
+    def append(self, rows):
+        """
+        :param rows: array (n x nCol) of new rows
+        """
+        n, nCol = rows.shape
+        if self.buffer is None:
+            self.buffer = np.empty((max(2 * n, TAIL_CAPACITY), nCol))
+            self.columnSums = np.zeros(nCol)
+        elif nCol != self.buffer.shape[1]:
+            raise ValueError("The new rows of %s have %d columns instead of %d" % (self.fileName, nCol,
+                                                                                   self.buffer.shape[1]))
+        if self.nRow + n > self.buffer.shape[0]:
+            grown = np.empty((max(2 * self.buffer.shape[0], self.nRow + n), nCol))
+            grown[:self.nRow] = self.buffer[:self.nRow]
+            self.buffer = grown
+        self.buffer[self.nRow:self.nRow + n] = rows
+        self.columnSums += rows.sum(axis=0)
+        self.nRow += n
+
+    def matrix(self):
+        """
+        :return: view (nRow x nCol) of the rows read so far, without the empty bins. Later reads only write past
+        its last row, so it can be used while the file is read.
+        """
+        if self.buffer is None:
+            return np.empty((0, 0))
+        return self.buffer[:self.nRow, :firstEmptyColumn(self.columnSums)]
+
+
+class MatrixCache:
+    """Sidecar .npy files of the parsed PVvalue files. The first load of a file parses its text and saves the
+    matrix; the next loads memory-map the sidecar read-only, so only the pages that are used are read. The name of
+    a sidecar holds the path, size and modification time of its file, so a changed file gets a new sidecar and the
+    old one is deleted. The modification time of a sidecar is when it was last loaded, and the least recently
+    loaded sidecars are deleted once the sidecars take more than maxBytes.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, maxBytes=DEFAULT_CACHE_MAX_BYTES):
+        """
+        :param directory: directory of the sidecars, created when needed
+        :param maxBytes: size cap of the sidecars
+        """
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.error = None  # Last error writing a sidecar, the file is then parsed on every load
+        self.hit = False  # Whether the last load was read from a sidecar
+
+    def sidecarPrefix(self, fileName):
+        """
+        :param fileName: PVvalue file
+        :return: start of the name of every sidecar of the file, whatever its size and modification time
+        """
+        path = os.path.abspath(fileName)
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, "%s.%s." % (os.path.basename(path), digest))
+
+    def sidecarName(self, fileName):
+        """
+        :param fileName: PVvalue file
+        :return: sidecar of the current contents of the file
+        """
+        st = os.stat(fileName)
+        return self.sidecarPrefix(fileName) + "%d.%d.npy" % (st.st_size, st.st_mtime_ns)
+
+    def load(self, fileName):
+        """
+        :param fileName: PVvalue file
+        :return: array (nRow x nCol) of the file, without the empty bins. Read-only when read from a sidecar.
+        """
+        sidecar = self.sidecarName(fileName)
+        if os.path.isfile(sidecar):
+            try:
+                TT = np.load(sidecar, mmap_mode='r')
+                self.hit = True
+                try:
+                    os.utime(sidecar)  # Marks it as recently used
+                except OSError:
+                    pass
+                return TT
+            except (OSError, ValueError) as e:  # Truncated or unreadable, parsed and written again
+                self.error = str(e)
+        self.hit = False
+        TT = loadPVvalue(fileName)
+        self.save(fileName, sidecar, TT)
+        return TT
+
+    def save(self, fileName, sidecar, TT):
+        """Writes the sidecar of a file, replacing its sidecars of other sizes or modification times, then drops
+        the least recently used sidecars above the size cap. The sidecar is written under a temporary name first,
+        so a load never sees half of it. A matrix larger than the cap gets no sidecar.
+        :param fileName: PVvalue file
+        :param sidecar: name of the sidecar
+        :param TT: parsed matrix
+        """
+        self.error = None
+        if TT.nbytes > self.maxBytes:
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            for stale in glob.glob(glob.escape(self.sidecarPrefix(fileName)) + "*.npy"):
+                os.remove(stale)
+            fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, TT)
+            os.replace(temporary, sidecar)
+            self.evict(sidecar)
+        except OSError as e:
+            self.error = str(e)
+
+    def evict(self, keep=None):
+        """Deletes the least recently loaded sidecars until the sidecars fit in maxBytes.
+        :param keep: sidecar that is not deleted, e.g. the one just written
+        """
+        sidecars = []
+        for sidecar in glob.glob(os.path.join(glob.escape(self.directory), "*.npy")):
+            try:
+                st = os.stat(sidecar)
+            except OSError:  # Deleted meanwhile, e.g. by another MatrixCache
+                continue
+            sidecars.append((st.st_mtime_ns, st.st_size, sidecar))
+        total = sum(size for used, size, sidecar in sidecars)
+        for used, size, sidecar in sorted(sidecars):
+            if total <= self.maxBytes:
+                break
+            if sidecar == keep:
+                continue
+            try:
+                os.remove(sidecar)
+                total -= size
+            except OSError as e:  # Still mapped, on Windows
+                self.error = str(e)
+
+    def size(self):
+        """
+        :return: bytes of the sidecars
+        """
+        total = 0
+        for sidecar in glob.glob(os.path.join(glob.escape(self.directory), "*.npy")):
+            try:
+                total += os.path.getsize(sidecar)
+            except OSError:
+                pass
+        return total
+
+    def clear(self):
+        """Deletes every sidecar.
+        """
+        self.error = None
+        for sidecar in glob.glob(os.path.join(glob.escape(self.directory), "*.npy")):
+            try:
+                os.remove(sidecar)
+            except OSError as e:  # Still mapped, on Windows
+                self.error = str(e)
+
+
+def loadPVvalueText(fileName):
+    """The reading DockedOption.loadFile used to do, kept to compare with loadPVvalue.
+    :param fileName: PVvalue file
+    :return: array (nRow x nCol) of the file, without the empty bins
+    """
+    data = np.loadtxt(open(fileName))
+    nCol = 0
+    for f in range(data.shape[1]):
+        if np.mean(data[:, f]) == 0:
+            break
+        nCol += 1
+    TT = np.zeros((data.shape[0], nCol))
+    for i in range(nCol):
+        TT[:, i] = data[:, i]
+    return TT
+
+
+def benchmark(fileName=None, nRow=400, nCol=2000, repeats=3):
+    """Compares the throughput of loadPVvalue with the np.loadtxt reading it replaces, and with the reopening of
+    the sidecar of MatrixCache.
+    :param fileName: PVvalue file, or None for a generated one of nRow x nCol counts with empty bins at the end
+    :param nRow: points of the generated file
+    :param nCol: bins of the generated file
+    :param repeats: timings kept as the best of this many
+    :return: size of the file in MB, np.loadtxt MB/s, loadPVvalue MB/s, sidecar MB/s
+    """
+    generated = fileName is None
+    if generated:
+        rng = np.random.default_rng(0)
+        data = np.hstack([rng.poisson(50, (nRow, nCol)), np.zeros((nRow, nCol // 10), dtype=int)])
+        fd, fileName = tempfile.mkstemp(prefix='PVvalue.', suffix='.bench')
+        with os.fdopen(fd, 'w') as f:
+            f.write('# PVvalue (N_bins, amplitude) (%d, 10.0)\n' % nCol)
+            np.savetxt(f, data, fmt='%d')
+
+    def best(function):
+        times = []
+        for k in range(repeats):
+            start = time.perf_counter()
+            result = function(fileName)
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    cache = None
+    try:
+        size = os.path.getsize(fileName) / 1e6
+        textTime, textData = best(loadPVvalueText)
+        fastTime, fastData = best(loadPVvalue)
+        cache = MatrixCache(tempfile.mkdtemp(prefix='matrixCache.'))
+        cache.load(fileName)
+        sidecarTime, sidecarData = best(cache.load)
+        if not (np.array_equal(textData, fastData) and np.array_equal(textData, sidecarData)):
+            raise ValueError("The readings of " + fileName + " disagree")
+    finally:
+        if generated:
+            os.remove(fileName)
+        if cache is not None:
+            shutil.rmtree(cache.directory, ignore_errors=True)
+    return size, size / textTime, size / fastTime, size / sidecarTime
+
+
+if __name__ == '__main__':
+    print("%10s %16s %16s %10s %18s" % ('File (MB)', 'loadtxt (MB/s)', 'fast (MB/s)', 'Speed-up', 'sidecar (MB/s)'))
+    for nRow, nCol in [(100, 200), (400, 2000), (1000, 5000)]:
+        size, textRate, fastRate, sidecarRate = benchmark(nRow=nRow, nCol=nCol)
+        print("%10.1f %16.1f %16.1f %10.1f %18.0f" % (size, textRate, fastRate, fastRate / textRate, sidecarRate))
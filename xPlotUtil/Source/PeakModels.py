@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Line shapes used by the fits. Parameters follow the lmfit conventions (amplitude is the peak area).
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import numpy as np
+from lmfit import Model
+from lmfit.models import GaussianModel, LorentzianModel, VoigtModel, LinearModel, fwhm_expr, height_expr
+from scipy.special import erfcx, wofz
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+PEAK_PARAMS = ('amplitude', 'center', 'sigma')
+BACKGROUND_PARAMS = ('slope', 'intercept')
+
+S2PI = np.sqrt(2 * np.pi)
+GAUSSIAN_FWHM = 2 * np.sqrt(2 * np.log(2))  # fwhm / sigma
+VOIGT_FWHM = 3.6013  # fwhm / sigma when gamma = sigma
+VOIGT_HEIGHT = erfcx(1 / np.sqrt(2)) / S2PI  # height * sigma / amplitude when gamma = sigma
+TINY = 1.0e-15
+
+
+def _pseudoVoigtWidths():
+    """Thompson-Cox-Hastings approximation of the Voigt shape with gamma = sigma as eta * Lorentzian +
+    (1 - eta) * Gaussian of the same fwhm. Every width is proportional to sigma, so eta is a constant.
+    :return: fwhm / sigma and eta
+    """
+    fG, fL = GAUSSIAN_FWHM, 2.0
+    fwhm = (fG ** 5 + 2.69269 * fG ** 4 * fL + 2.42843 * fG ** 3 * fL ** 2 + 4.47163 * fG ** 2 * fL ** 3 +
+            0.07842 * fG * fL ** 4 + fL ** 5) ** 0.2
+    ratio = fL / fwhm
+    return fwhm, 1.36603 * ratio - 0.47719 * ratio ** 2 + 0.11116 * ratio ** 3
+
+
+PV_FWHM, PV_ETA = _pseudoVoigtWidths()  # fwhm / sigma and Lorentzian fraction of the pseudo-Voigt shape
+PV_LORENTZ = PV_FWHM / 2.0  # gamma of the Lorentzian part / sigma
+PV_GAUSS = PV_FWHM / GAUSSIAN_FWHM  # sigma of the Gaussian part / sigma
+PV_HEIGHT = PV_ETA / (np.pi * PV_LORENTZ) + (1 - PV_ETA) / (S2PI * PV_GAUSS)  # height * sigma / amplitude
+
+
+def peakPrefixes(peaks):
+    """Parameter prefixes used by the composite models.
+    :param peaks: number of peaks
+    :return: list of prefixes
+    """
+    if peaks == 1:
+        return ['']
+    return ['p%d_' % (i + 1) for i in range(peaks)]
+
+
+def paramNames(peaks):
+    """Names of the parameters in the order used by the seed matrix, peaks first and background last.
+    :param peaks: number of peaks
+    :return: list of parameter names
+    """
+    names = [prefix + name for prefix in peakPrefixes(peaks) for name in PEAK_PARAMS]
+    return names + list(BACKGROUND_PARAMS)
+
+
+def peakFromHeightWidth(whichFit, height, fwhm):
+    """Converts a peak height and full width at half maximum into the amplitude and sigma of a line shape.
+    :param whichFit: 'G' (Gaussian), 'L' (Lorentzian), 'V' (Voigt) or 'P' (pseudo-Voigt)
+    :param height: peak height, scalar or array
+    :param fwhm: full width at half maximum, scalar or array
+    :return: amplitude and sigma
+    """
+    if whichFit == 'G':
+        sigma = fwhm / GAUSSIAN_FWHM
+        return height * sigma * S2PI, sigma
+    elif whichFit == 'L':
+        sigma = fwhm / 2.0
+        return height * sigma * np.pi, sigma
+    elif whichFit == 'V':
+        sigma = fwhm / VOIGT_FWHM
+        return height * sigma / VOIGT_HEIGHT, sigma
+    elif whichFit == 'P':
+        sigma = fwhm / PV_FWHM
+        return height * sigma / PV_HEIGHT, sigma
+    raise ValueError("Unknown fit: " + str(whichFit))
+
+
+def peakValue(whichFit, x, amplitude, center, sigma):
+    """Evaluates a line shape. Broadcasts, so x can be a column (nRow x 1) and the parameters rows (nCol).
+    :param whichFit: 'G' (Gaussian), 'L' (Lorentzian), 'V' (Voigt with gamma = sigma) or 'P' (pseudo-Voigt)
+    :param x: x-values
+    :param amplitude: peak area
+    :param center: peak position
+    :param sigma: peak width
+    :return: line shape values
+    """
+    dx = x - center
+    if whichFit == 'G':
+        return amplitude / (S2PI * sigma) * np.exp(-dx * dx / (2 * sigma * sigma))
+    elif whichFit == 'L':
+        return amplitude / np.pi * sigma / (dx * dx + sigma * sigma)
+    elif whichFit == 'V':
+        z = (dx + 1j * sigma) / (sigma * np.sqrt(2))
+        return amplitude / (S2PI * sigma) * wofz(z).real
+    elif whichFit == 'P':
+        return (PV_ETA * peakValue('L', x, amplitude, center, PV_LORENTZ * sigma) +
+                (1 - PV_ETA) * peakValue('G', x, amplitude, center, PV_GAUSS * sigma))
+    raise ValueError("Unknown fit: " + str(whichFit))
+
+
+def peakDerivatives(whichFit, x, amplitude, center, sigma):
+    """Analytic partial derivatives of a line shape with respect to its amplitude, center and sigma. For the
+    Voigt shape gamma is tied to sigma, so the sigma derivative includes the gamma term. Broadcasts like
+    peakValue.
+    :return: derivatives with respect to amplitude, center and sigma
+    """
+    dx = x - center
+    if whichFit == 'G':
+        unit = np.exp(-dx * dx / (2 * sigma * sigma)) / (S2PI * sigma)
+        f = amplitude * unit
+        return unit, f * dx / sigma ** 2, f * (dx * dx / sigma ** 3 - 1 / sigma)
+    elif whichFit == 'L':
+        D = dx * dx + sigma * sigma
+        unit = sigma / (np.pi * D)
+        return unit, amplitude / np.pi * 2 * sigma * dx / D ** 2, amplitude / np.pi * (dx * dx - sigma * sigma) / D ** 2
+    elif whichFit == 'V':
+        # w'(z) = -2 z w(z) + 2i/sqrt(pi), with dz/dc = -1/(sigma sqrt2) and dz/dsigma = -z/sigma + i/(sigma sqrt2)
+        s2 = sigma * np.sqrt(2)
+        z = (dx + 1j * sigma) / s2
+        w = wofz(z)
+        dw = -2 * z * w + 2j / np.sqrt(np.pi)
+        unit = 1 / (S2PI * sigma)
+        f = amplitude * unit * w.real
+        dCenter = amplitude * unit * (-dw / s2).real
+        dSigma = -f / sigma + amplitude * unit * (dw * (-z / sigma + 1j / s2)).real
+        return unit * w.real, dCenter, dSigma
+    elif whichFit == 'P':
+        lorentz = peakDerivatives('L', x, amplitude, center, PV_LORENTZ * sigma)
+        gauss = peakDerivatives('G', x, amplitude, center, PV_GAUSS * sigma)
+        return (PV_ETA * lorentz[0] + (1 - PV_ETA) * gauss[0], PV_ETA * lorentz[1] + (1 - PV_ETA) * gauss[1],
+                PV_ETA * PV_LORENTZ * lorentz[2] + (1 - PV_ETA) * PV_GAUSS * gauss[2])
+    raise ValueError("Unknown fit: " + str(whichFit))
+
+
+def pseudoVoigt(x, amplitude=1.0, center=0.0, sigma=1.0):
+    """Pseudo-Voigt line shape for lmfit, with sigma clipped at tiny like lmfit's own shapes.
+    """
+    return peakValue('P', x, amplitude, center, max(sigma, TINY))
+
+
+class PseudoVoigtModel(Model):
+    """Fast stand-in for VoigtModel with gamma = sigma: the same three parameters, evaluated without the Faddeeva
+    function. Not lmfit's PseudoVoigtModel, which fits the Lorentzian fraction as a fourth parameter.
+    """
+
+    fwhm_factor = PV_FWHM
+    height_factor = PV_HEIGHT
+
+    def __init__(self, independent_vars=['x'], prefix='', nan_policy='raise', **kwargs):
+        kwargs.update({'prefix': prefix, 'nan_policy': nan_policy, 'independent_vars': independent_vars})
+        super(PseudoVoigtModel, self).__init__(pseudoVoigt, **kwargs)
+        self.set_param_hint('sigma', min=0)
+        self.set_param_hint('fwhm', expr=fwhm_expr(self))
+        self.set_param_hint('height', expr=height_expr(self))
+
+
+PEAK_MODELS = {'G': GaussianModel, 'L': LorentzianModel, 'V': VoigtModel, 'P': PseudoVoigtModel}
+
+
+def _residualSign():
+    """lmfit has used both data - model and model - data as the residual, so the sign is probed once.
+    """
+    mod = LinearModel()
+    pars = mod.make_params(slope=0, intercept=1)
+    return np.sign(mod._residual(pars, np.zeros(1), None, x=np.zeros(1))[0])
+
+
+RESIDUAL_SIGN = _residualSign()
+
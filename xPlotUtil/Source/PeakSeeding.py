@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Starting values for every column of the raw data, computed at once with numpy.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import numpy as np
+
+from xPlotUtil.Source.PeakModels import GAUSSIAN_FWHM, peakFromHeightWidth
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+PEAK_FRACTION = 0.25  # Points above this fraction of the peak height are used for the log-parabola
+WINDOW_SIGMAS = 5.0  # Half width of an automatic fit window, in peak widths
+MIN_WINDOW_ROWS = 10
+
+
+def seedBackground(TT):
+    """Line through the first and last point of every column, flat for a single row.
+    :param TT: 2D array, rows are points and columns are bins
+    :return: slope and intercept arrays (nCol)
+    """
+    last = TT.shape[0] - 1
+    m = (TT[-1, :] - TT[0, :]) / max(last, 1)
+    b = TT[-1, :] - m * last
+    return m, b
+
+
+def seedPeak(R, start, stop, whichFit):
+    """Finds the height, center and full width at half maximum of the highest peak between the rows start and
+    stop of every column. The points around the maximum that are above PEAK_FRACTION of it are fitted with a
+    parabola: ln(y) for Gaussian and (pseudo-)Voigt shapes (Caruana's method, weighted by y^2) and 1/y for Lorentzian
+    shapes (weighted by y^4). Columns where that fails use the width of those points instead.
+    :param R: background subtracted data
+    :param start: first row of the region
+    :param stop: row after the last row of the region
+    :param whichFit: char that represents the fit
+    :return: height, center and fwhm arrays (nCol)
+    """
+    region = R[start:stop, :]
+    nRow, nCol = region.shape
+    rows = np.arange(nRow).reshape(nRow, 1)
+    cols = np.arange(nCol)
+
+    top = np.argmax(region, axis=0)
+    height = region[top, cols]
+
+    # Contiguous run of points above the threshold that contains the maximum
+    below = region <= PEAK_FRACTION * height
+    left = np.where(below & (rows < top), rows, -1).max(axis=0)
+    right = np.where(below & (rows > top), rows, nRow).min(axis=0)
+    mask = (rows > left) & (rows < right) & (region > 0)
+
+    # Weighted least squares of t(y) = a + b x + c x^2, x relative to the maximum
+    x = (rows - top).astype(float)
+    y = np.where(mask, region, 1.0)
+    if whichFit == 'L':
+        t = 1 / y
+        w = np.where(mask, y ** 4, 0.0)
+    else:
+        t = np.log(y)
+        w = np.where(mask, y * y, 0.0)
+    xPow = [np.sum(w * x ** k, axis=0) for k in range(5)]
+    A = np.empty((nCol, 3, 3))
+    for i in range(3):
+        for k in range(3):
+            A[:, i, k] = xPow[i + k]
+    rhs = np.stack([np.sum(w * t * x ** k, axis=0) for k in range(3)], axis=1)
+
+    good = (mask.sum(axis=0) >= 3) & (np.abs(np.linalg.det(A)) > 0)
+    coef = np.zeros((nCol, 3))
+    if np.any(good):
+        coef[good] = np.linalg.solve(A[good], rhs[good, :, np.newaxis])[:, :, 0]
+    a, b, c = coef[:, 0], coef[:, 1], coef[:, 2]
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if whichFit == 'L':
+            good &= c > 0
+            offset = -b / (2 * c)
+            fitHeight = 1 / (a - b * b / (4 * c))
+            fitWidth = 2 * np.sqrt(1 / (fitHeight * c))
+        else:
+            good &= c < 0
+            offset = -b / (2 * c)
+            fitHeight = np.exp(a - b * b / (4 * c))
+            fitWidth = GAUSSIAN_FWHM * np.sqrt(-1 / (2 * c))
+        good &= np.isfinite(fitWidth) & (fitHeight > 0) & (np.abs(offset) <= (right - left) / 2.0)
+
+    # Width of the points above the threshold, for columns without a usable parabola
+    runWidth = GAUSSIAN_FWHM * np.maximum(right - left - 1, 1) / (2 * np.sqrt(2 * np.log(1 / PEAK_FRACTION)))
+
+    center = start + top + np.where(good, offset, 0.0)
+    fwhm = np.where(good, fitWidth, runWidth)
+    height = np.where(good, fitHeight, height)
+    return height, center, fwhm
+
+
+def seedColumns(TT, whichFit, peaks):
+    """Computes the starting parameters of every column.
+    :param TT: 2D array, rows are points and columns are bins
+    :param whichFit: 'G' (Gaussian), 'L' (Lorentzian), 'V' (Voigt) or 'P' (pseudo-Voigt)
+    :param peaks: number of peaks, 1 or 2. With two peaks each half of the rows holds one peak.
+    :return: seed matrix (nCol x len(paramNames(peaks))), ordered as PeakModels.paramNames
+    """
+    TT = np.asarray(TT, dtype=np.float64)
+    nRow, nCol = TT.shape
+    m, b = seedBackground(TT)
+    R = TT - (m * np.arange(nRow).reshape(nRow, 1) + b)
+
+    if peaks == 1:
+        regions = [(0, nRow)]
+    else:
+        half = (nRow + 1) // 2
+        regions = [(0, half), (half, nRow)]
+
+    seeds = np.zeros((nCol, 3 * peaks + 2))
+    for i, (start, stop) in enumerate(regions):
+        height, center, fwhm = seedPeak(R, start, stop, whichFit)
+        amplitude, sigma = peakFromHeightWidth(whichFit, height, fwhm)
+        seeds[:, 3 * i:3 * i + 3] = np.stack([amplitude, center, np.maximum(sigma, 1e-3)], axis=1)
+    seeds[:, -2] = m
+    seeds[:, -1] = b
+    return seeds
+
+
+def seedWindow(TT, peaks, sigmas=WINDOW_SIGMAS, minRows=MIN_WINDOW_ROWS):
+    """Rows that hold the seeded peaks of every column, widened by a few peak widths on each side, to restrict the
+    fit to.
+    :param TT: 2D array, rows are points and columns are bins
+    :param peaks: number of peaks
+    :param sigmas: widths kept on each side of the centers
+    :param minRows: smallest window
+    :return: (start, stop) rows
+    """
+    nRow = TT.shape[0]
+    seeds = seedColumns(TT, 'G', peaks)
+    centers = seeds[:, 1:3 * peaks:3]
+    widths = sigmas * seeds[:, 2:3 * peaks:3]
+    low = centers - widths
+    high = centers + widths
+    finite = np.isfinite(low) & np.isfinite(high)
+    if not np.any(finite):
+        return 0, nRow
+    start = int(max(np.floor(low[finite].min()), 0))
+    stop = int(min(np.ceil(high[finite].max()) + 1, nRow))
+    if stop - start < minRows:
+        middle = (start + stop) // 2
+        start = max(0, min(middle - minRows // 2, nRow - minRows))
+        stop = min(nRow, start + minRows)
+    return start, stop
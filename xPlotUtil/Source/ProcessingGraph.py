@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Lazy evaluation graph of the processing steps: raw data -> normalized -> fitted -> lattice -> %-change, and
+#C normalized -> SVD. Headless, like FitEngine.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+
+class Node:
+    """One step of the processing. A node without a compute function is a source, whose value is set from outside.
+    Other nodes compute their value from the values of their inputs the first time it is asked for, and keep it
+    until one of their inputs changes.
+    """
+
+    def __init__(self, name, compute=None, inputs=(), value=None):
+        """
+        :param name: name of the node
+        :param compute: function called with the values of the inputs, None for a source
+        :param inputs: list of input nodes
+        :param value: initial value of a source
+        """
+        self.name = name
+        self.compute = compute
+        self.inputs = list(inputs)
+        self.dependents = []
+        self.value = value
+        self.valid = compute is None
+        for node in self.inputs:
+            node.dependents.append(self)
+
+    def get(self):
+        """Computes the value if it is out of date, after bringing the inputs up to date.
+        :return: value of the node
+        """
+        if not self.valid:
+            self.value = self.compute(*[node.get() for node in self.inputs])
+            self.valid = True
+        return self.value
+
+    def set(self, value):
+        """Changes the value of a source and invalidates everything downstream of it. Setting the value a source
+        already holds does nothing.
+        :param value: new value
+        """
+        if self.compute is not None:
+            raise ValueError("Only a source node can be set: " + self.name)
+        if value is self.value:
+            return
+        self.value = value
+        for node in self.dependents:
+            node.invalidate()
+
+    def put(self, value):
+        """Stores a value that was computed outside of the graph from the current values of the inputs, e.g. on a
+        worker thread, and invalidates everything downstream of it.
+        :param value: new value
+        """
+        if self.compute is None:
+            self.set(value)
+            return
+        self.value = value
+        self.valid = True
+        for node in self.dependents:
+            node.invalidate()
+
+    def invalidate(self):
+        """Drops the cached value of this node and of its dependents. A node that is already out of date has out of
+        date dependents too, so the walk stops there.
+        """
+        if self.compute is None or not self.valid:
+            return
+        self.valid = False
+        self.value = None
+        for node in self.dependents:
+            node.invalidate()
+
+
+class ProcessingGraph:
+    """Named collection of nodes.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.computeCount = {}  # Number of times each node has been computed
+
+    def addSource(self, name, value=None):
+        """
+        :param name: name of the source
+        :param value: initial value
+        """
+        self.nodes[name] = Node(name, value=value)
+
+    def addNode(self, name, compute, inputs):
+        """
+        :param name: name of the node
+        :param compute: function called with the values of the inputs, in order
+        :param inputs: names of the input nodes, which must already exist
+        """
+        def counted(*values):
+            self.computeCount[name] = self.computeCount.get(name, 0) + 1
+            return compute(*values)
+
+        self.nodes[name] = Node(name, counted, [self.nodes[input] for input in inputs])
+
+    def get(self, name):
+        """
+        :param name: name of a node
+        :return: up to date value of the node
+        """
+        return self.nodes[name].get()
+
+    def set(self, name, value):
+        """
+        :param name: name of a source
+        :param value: new value
+        """
+        self.nodes[name].set(value)
+
+    def put(self, name, value):
+        """
+        :param name: name of a node
+        :param value: value computed outside of the graph, see Node.put
+        """
+        self.nodes[name].put(value)
+
+    def peek(self, name):
+        """Value of a node without computing it.
+        :param name: name of a node
+        :return: the cached value, None when it is out of date
+        """
+        return self.nodes[name].value
+
+    def isValid(self, name):
+        """
+        :param name: name of a node
+        :return: truth value of the node holding an up to date value
+        """
+        return self.nodes[name].valid
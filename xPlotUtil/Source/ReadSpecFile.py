@@ -15,7 +15,12 @@ import os
 from PyQt5.QtWidgets import *
 from pylab import *
 
+from xPlotUtil.Source.CatalogDialog import CatalogDialog
 from xPlotUtil.Source.GaussianFit import GaussianFitting
+from xPlotUtil.Source.ScanList import ScanListModel, pvFileIndex, scanRows
+from xPlotUtil.Source.ScanPrefetch import ScanPrefetcher
+from xPlotUtil.Source.SpecFollower import SpecFollower
+from xPlotUtil.Source.SpecIndex import specIndex
 import traceback
 
 
@@ -34,6 +39,13 @@ class ReadSpec:
         self.algebraExp = self.gausFit.algebraExp
         self.specFileOpened = False
         self.specFileName = None
+        self.PvFiles = []
+        self.pvIndex = {}  # Scan key -> PVvalue files of the scan
+        self.listedFiles = []  # PVvalue file of each row of the specDataList
+        self.scanList = ScanListModel()  # Model of the specDataList
+        self.follower = SpecFollower(self)
+        self.prefetcher = ScanPrefetcher(self.dockedOpt.matrixCache.directory)
+        self.catalogDialog = None
 
         # Initializing lattice information
         self.lElement = 0
@@ -51,68 +63,125 @@ class ReadSpec:
             if response == "Y":
                 self.openSpecDialog()
 
-    def getPVNumKey(self, text):
-        h = text.split('.')
-        return int(h[1])
-
     def openSpecDialog(self):
         """This method creates a file dialog to open the spec file. Once the file has been open it resets
         various attributes to their original value to initialize/reestablish functionality.
         """
+        selectedFilter = "Spec files (*.spec)"
+        specFileName, self.specFileFilter = QFileDialog.getOpenFileName(self.myMainWindow, "Open Spec File", None,
+                                                                        selectedFilter)
+        self.openSpec(specFileName)
+
+    def openSpec(self, specFileName):
+        """Opens a spec file, chosen in the file dialog or the beamtime catalog.
+        :param specFileName: spec file
+        """
         try:
-            selectedFilter = "Spec files (*.spec)"
-            self.specFileName, self.specFileFilter = QFileDialog.getOpenFileName(self.myMainWindow, "Open Spec File",
-                                                                                 None, selectedFilter)
+            self.specFileName = specFileName
             # Makes sure a file has been opened
             if os.path.isfile(self.specFileName):
                 # Gets the PVvalue files in the directory
                 self.specDirectory = os.path.dirname(self.specFileName)
-                self.PvFiles = [f for f in os.listdir(self.specDirectory) if f.find("PVvalue") == 0]
-                sorted(self.PvFiles, key=self.getPVNumKey)
+                self.PvFiles = sorted(f for f in os.listdir(self.specDirectory) if f.find("PVvalue") == 0)
+                self.pvIndex = pvFileIndex(self.PvFiles)
 
+                self.prefetcher.clear()
                 self.dockedOpt.mainOptions.close()
                 self.dockedOpt.DockMainOptions()
-                self.dockedOpt.fitStat = False
-                self.dockedOpt.LFitStat = False
-                self.dockedOpt.normalizingStat = False
-                self.algebraicExpStat = False
+                self.dockedOpt.resetProcessing()
                 self.dockedOpt.specFileInfo()
                 self.specFileOpened = True
                 self.dockedOpt.fileOpened = False
-                self.continueGraphingEachFit = True
                 self.myMainWindow.latticeFitAction.setEnabled(False)
+                if self.follower.isFollowing():
+                    self.follower.start(self.specFileName, self.specDirectory)
                 self.myMainWindow.showProgress("Spec file opened")
         except Exception as e:
             QMessageBox.warning(self.myMainWindow, "Error", "There was an error \n\n Exception: " + str(e)
                                 + "\n\nTraceback: " + str(traceback.print_stack()))
 
     def loadScans(self, scans):
-        """Loads the scan into the specDataList
-        :param scans: list of scans provided using spec2nexus.spec
+        """Loads the scans that have a PVvalue file into the specDataList, by scan number. The files are matched to
+        the scans by a dict, and the scans are not parsed yet.
+        :param scans: mapping of scan number to scan, from SpecIndex
         """
         self.scans = scans
-        scanKeys = self.scans.keys()
-        sorted(scanKeys, key=int)  # Sorts the scans in order lowest-greater
-        for scan in scanKeys:
-            for file in self.PvFiles:
-                f = file.split('.')
-                if f[1] == scan:
-                    PValue = 'PVvalue #' + str(scans[scan].scanNum)
-                    self.dockedOpt.specDataList.addItem(PValue)
+        rows = scanRows(scans.index.keys, self.pvIndex)
+        self.listedFiles = [file for scan, file in rows]  # PVvalue file of each row of the specDataList
+        self.scanList.setRows(rows, scans.index.titles)
+
+    def refreshScans(self):
+        """Adds the scans appended to the spec file and the PVvalue files that appeared in its directory since the
+        list was loaded. Only the new bytes of the spec file are read.
+        :return: number of PVvalue files added to the list
+        """
+        index = specIndex(self.specFileName)
+        known = set(self.PvFiles)
+        newFiles = sorted(f for f in os.listdir(self.specDirectory) if f.find("PVvalue") == 0 and f not in known)
+        self.PvFiles.extend(newFiles)
+        pvFileIndex(newFiles, self.pvIndex)
+        wanted = scanRows(index.keys, self.pvIndex)
+
+        added = len(wanted) - len(self.listedFiles)
+        if index.scans is self.scans and [file for scan, file in wanted[:len(self.listedFiles)]] == self.listedFiles:
+            # Acquisition only appends, so the new rows go at the end
+            self.scanList.appendRows(wanted[len(self.listedFiles):], index.titles)
+            self.listedFiles.extend(file for scan, file in wanted[len(self.listedFiles):])
+        else:
+            # The file was rewritten or a PVvalue file of an earlier scan appeared, the list is loaded again
+            selected = self.dockedOpt.specDataList.currentRow()
+            selectedFile = self.listedFiles[selected] if 0 <= selected < len(self.listedFiles) else None
+            self.loadScans(index.scans)
+            if selectedFile in self.listedFiles:
+                self.dockedOpt.specDataList.setCurrentRow(self.listedFiles.index(selectedFile))
+        return added
+
+    def BeamtimeCatalog(self):
+        """Shows the window searching the beamtime catalog.
+        """
+        if self.catalogDialog is None:
+            self.catalogDialog = CatalogDialog(self, parent=self.myMainWindow)
+        self.catalogDialog.show()
+        self.catalogDialog.raise_()
+
+    def setFollow(self, follow):
+        """Starts or stops following the spec file and its directory while they are being written.
+        :param follow: truth value
+        """
+        if not follow:
+            self.follower.stop()
+        elif self.specFileOpened == False:
+            QMessageBox.warning(self.myMainWindow, "Error", "Please open a spec file first.")
+            self.myMainWindow.followAction.setChecked(False)
+        else:
+            self.follower.start(self.specFileName, self.specDirectory)
+
+    def pvFileName(self, row):
+        """
+        :param row: row of the specDataList
+        :return: path of the PVvalue file of the row
+        """
+        if self.specDirectory.find("/") == 0:
+            return self.specDirectory + "/" + self.listedFiles[row]
+        else:
+            return self.specDirectory + "\\" + self.listedFiles[row]
 
     def currentScan(self):
         """This method calls on the open file dialog to open the PVvalue file. It gets the required data
-        from the  spec file for the PVvalue/scan.
+        from the  spec file for the PVvalue/scan. The scans around it are prefetched afterwards.
         """
-        scan = self.PvFiles[self.dockedOpt.specDataList.currentRow()].split(".")
+        scan = self.listedFiles[self.dockedOpt.specDataList.currentRow()].split(".")
         self.scan = scan[1]
         self.currentRow = self.dockedOpt.specDataList.currentRow()
+        with self.prefetcher.foreground():
+            self.openScan(self.pvFileName(self.currentRow))
+        if self.dockedOpt.fileOpened == True:
+            self.prefetchNeighbours()
 
-        if self.specDirectory.find("/") == 0:
-            fileName = self.specDirectory + "/" + self.PvFiles[self.currentRow]
-        else:
-            fileName = self.specDirectory + "\\" + self.PvFiles[self.currentRow]
-
+    def openScan(self, fileName):
+        """Opens the PVvalue file of the current scan and gets the lattice and normalizers of the scan.
+        :param fileName: PVvalue file
+        """
         self.dockedOpt.openFile(fileName)
 
         # Making sure the file of the PVvalue has been opened
@@ -137,6 +206,47 @@ class ReadSpec:
             except Exception as e:
                 QMessageBox.warning(self.myMainWindow, "Error", "There was an error \n\n Exception: " + str(e))
 
+    def prefetchNeighbours(self):
+        """Asks the prefetcher for the scans of the rows around the current one, nearest first and the next row
+        before the previous one, as the list is mostly walked down.
+        """
+        rows = []
+        for distance in range(1, self.prefetcher.depth + 1):
+            rows += [self.currentRow + distance, self.currentRow - distance]
+        self.prefetcher.request([(self.pvFileName(row), self.scans.index, self.listedFiles[row].split(".")[1])
+                                 for row in rows if 0 <= row < len(self.listedFiles)])
+
+    def PrefetchDialog(self):
+        """Dialog setting how many scans on each side of the open one are prefetched, and the memory they may
+        take.
+        """
+        dialog = QDialog(self.myMainWindow)
+        dialog.setWindowTitle("Prefetch")
+        depthSpin = QSpinBox()
+        depthSpin.setRange(0, 20)
+        depthSpin.setValue(self.prefetcher.depth)
+        depthSpin.setStatusTip("0 turns prefetching off")
+        memorySpin = QSpinBox()
+        memorySpin.setRange(16, 65536)
+        memorySpin.setSuffix(" MB")
+        memorySpin.setValue(self.prefetcher.memoryLimit)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+
+        form = QFormLayout()
+        form.addRow("Scans on each side:", depthSpin)
+        form.addRow("Memory:", memorySpin)
+        form.addRow(QLabel("%d scan(s) kept, %.1f MB" % (len(self.prefetcher.cache),
+                                                         self.prefetcher.memory() / 2.0 ** 20)))
+        vbox = QVBoxLayout()
+        vbox.addLayout(form)
+        vbox.addWidget(buttons)
+        dialog.setLayout(vbox)
+
+        if dialog.exec_() == QDialog.Accepted:
+            self.prefetcher.setLimits(depthSpin.value(), memorySpin.value())
+
     ''' # Currently using the L from the spec file
     def getRLU(self):
         """This function gets the Lattice for the particular file, using the lattice max, lattice min and the
@@ -156,9 +266,9 @@ class ReadSpec:
 
     def NormalizerDialog(self):
         """This method creates a dialog with dynamically created radio buttons from the spec file, which allow the
-        user to pick which chamber was used to normalize.
+        user to pick which chamber was used to normalize. Picking another normalizer later replaces the first one.
         """
-        if self.dockedOpt.normalizingStat == False and self.dockedOpt.FileError() == False :
+        if self.dockedOpt.FileError() == False :
             self.normalizeDialog = QDialog(self.myMainWindow)
             dialogBox = QVBoxLayout()
             buttonLayout = QHBoxLayout()
@@ -193,17 +303,20 @@ class ReadSpec:
             self.normalizeDialog.exec_()
 
     def getNormalizer(self):
-        """This function divides the raw data stored in array TT by the normalizer to normalize it.
+        """This function sets the normalizer of the processing graph. The raw data is divided by it lazily, and
+        only what depends on the normalized data is recomputed.
         """
         try:
             if self.buttonGroup.checkedId() != -1:
                 self.normalizeDialog.close()
                 for norm in self.normalizers:
                     if norm.endswith(str(self.buttonGroup.checkedId())):
-                        self.normalizer = self.scans[self.scan].data[norm]
-                        self.normalizer = np.reshape(self.normalizer, (len(self.normalizer), 1))
-                        self.dockedOpt.TT = np.divide(self.dockedOpt.TT, self.normalizer)
-                        self.dockedOpt.normalizingStat = True
+                        normalizer = np.asarray(self.scans[self.scan].data[norm], dtype=float)
+                        normalizer = np.reshape(normalizer, (len(normalizer), 1))
+                        if normalizer.shape[0] != self.dockedOpt.fileInfo()[0]:
+                            raise ValueError("%d normalizer rows" % normalizer.shape[0])
+                        self.dockedOpt.graph.set('normalizer', normalizer)
+                        self.gausFit.refreshFit()
         except Exception as e:
             QMessageBox.warning(self.myMainWindow, "Dimension Error", "Please make sure the selected normalizer "
                                                                       "has the same row dimension as the raw data." +
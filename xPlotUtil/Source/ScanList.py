@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C List of the scans of the spec file that have a PVvalue file, with a filter by scan number, command or date.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import re
+
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+FETCH_BATCH = 500  # Rows handed to the view each time it scrolls to the end
+SCAN_RANGE = re.compile(r'^(\d+)-(\d+)$')
+
+
+def pvScanKey(fileName):
+    """
+    :param fileName: name of a PVvalue file, PVvalue.<scan number>
+    :return: key of its scan, or None if the name has none
+    """
+    key = fileName.partition('.')[2].partition('.')[0]
+    return key or None
+
+
+def scanNumberKey(key):
+    """Sort key of a scan key, by number and then by repetition, e.g. 12 < 12.1 < 13.
+    :param key: scan key
+    :return: tuple
+    """
+    number, dot, repeat = key.partition('.')
+    try:
+        return int(number), int(repeat or 0), key
+    except ValueError:  # Not a number, after the numbered scans
+        return float('inf'), 0, key
+
+
+def pvFileIndex(fileNames, byScan=None):
+    """Groups the PVvalue files of a directory by scan, in one pass.
+    :param fileNames: names of the PVvalue files
+    :param byScan: index the files are added to, or None for a new one
+    :return: dict of scan key to the names of its files, sorted
+    """
+    if byScan is None:
+        byScan = {}
+    changed = set()
+    for fileName in fileNames:
+        key = pvScanKey(fileName)
+        if key is not None:
+            byScan.setdefault(key, []).append(fileName)
+            changed.add(key)
+    for key in changed:
+        byScan[key].sort()
+    return byScan
+
+
+def scanRows(keys, byScan):
+    """
+    :param keys: scan keys of the spec file
+    :param byScan: dict of scan key to PVvalue files, see pvFileIndex
+    :return: list of (scan key, PVvalue file) of the scans with a file, by scan number
+    """
+    return [(key, fileName) for key in sorted((key for key in keys if key in byScan), key=scanNumberKey)
+            for fileName in byScan[key]]
+
+
+class ScanListModel(QAbstractListModel):
+    """Rows of (scan key, PVvalue file). The rows that pass the filter are handed to the view FETCH_BATCH at a
+    time, as it asks for them. A row is known by its source row, its place in the unfiltered list, which is what
+    ReadSpec.listedFiles holds.
+    """
+    filterChanged = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        """
+        :param parent: parent object
+        """
+        super(ScanListModel, self).__init__(parent)
+        self.rows = []  # (scan key, PVvalue file)
+        self.titles = {}  # Scan key -> (command, date)
+        self.searchText = None  # Lower case command and date of each row, made when a filter first needs them
+        self.visible = []  # Source rows passing the filter
+        self.fetched = 0  # Visible rows handed to the view
+        self.filterText = ""
+
+    def setRows(self, rows, titles):
+        """Replaces the rows.
+        :param rows: list of (scan key, PVvalue file)
+        :param titles: dict of scan key to (command, date)
+        """
+        self.beginResetModel()
+        self.rows = list(rows)
+        self.titles = titles
+        self.searchText = None
+        self.visible = self.filtered(range(len(self.rows)))
+        self.fetched = min(len(self.visible), FETCH_BATCH)
+        self.endResetModel()
+
+    def appendRows(self, rows, titles):
+        """Adds rows at the end, e.g. the scans of a spec file being written.
+        :param rows: list of (scan key, PVvalue file)
+        :param titles: dict of scan key to (command, date)
+        """
+        self.titles = titles
+        start = len(self.rows)
+        self.rows.extend(rows)
+        if self.searchText is not None:
+            self.searchText.extend(self.rowText(key) for key, fileName in rows)
+        added = self.filtered(range(start, len(self.rows)))
+        if self.fetched < len(self.visible):
+            self.visible.extend(added)  # Fetched with the rest
+        elif added:
+            self.beginInsertRows(QModelIndex(), len(self.visible), len(self.visible) + len(added) - 1)
+            self.visible.extend(added)
+            self.fetched = len(self.visible)
+            self.endInsertRows()
+
+    def rowText(self, key):
+        """
+        :param key: scan key
+        :return: lower case command and date of the scan
+        """
+        return " ".join(self.titles.get(key, ("", ""))).lower()
+
+    def setFilter(self, text):
+        """Shows only the scans matching every word of text: a scan number, a range of scan numbers such as 10-20,
+        or a part of the command or date of the scan.
+        :param text: filter, empty to show every scan
+        """
+        if text == self.filterText:
+            return
+        self.beginResetModel()
+        self.filterText = text
+        self.visible = self.filtered(range(len(self.rows)))
+        self.fetched = min(len(self.visible), FETCH_BATCH)
+        self.endResetModel()
+        self.filterChanged.emit(text)
+
+    def filtered(self, sourceRows):
+        """
+        :param sourceRows: source rows
+        :return: list of the source rows passing the filter
+        """
+        words = self.filterText.lower().split()
+        if not words:
+            return list(sourceRows)
+        if self.searchText is None:
+            self.searchText = [self.rowText(key) for key, fileName in self.rows]
+        tests = []
+        for word in words:
+            scanRange = SCAN_RANGE.match(word)
+            if word.isdigit():
+                tests.append(lambda key, text, word=word: key == word or key.startswith(word + '.'))
+            elif scanRange is not None:
+                first, last = int(scanRange.group(1)), int(scanRange.group(2))
+                tests.append(lambda key, text, first=first, last=last:
+                             first <= scanNumberKey(key)[0] <= last)
+            else:
+                tests.append(lambda key, text, word=word: word in text)
+        return [row for row in sourceRows if all(test(self.rows[row][0], self.searchText[row]) for test in tests)]
+
+    def sourceRow(self, row):
+        """
+        :param row: row of the view
+        :return: source row, or -1
+        """
+        return self.visible[row] if 0 <= row < len(self.visible) else -1
+
+    def viewRow(self, sourceRow):
+        """The row of the view of a source row, fetching the rows up to it.
+        :param sourceRow: source row
+        :return: row of the view, or -1 when the filter hides it
+        """
+        try:
+            row = self.visible.index(sourceRow)
+        except ValueError:
+            return -1
+        if row >= self.fetched:
+            self.beginInsertRows(QModelIndex(), self.fetched, row)
+            self.fetched = row + 1
+            self.endInsertRows()
+        return row
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.fetched
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.fetched < len(self.visible)
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        count = min(FETCH_BATCH, len(self.visible) - self.fetched)
+        if count > 0:
+            self.beginInsertRows(QModelIndex(), self.fetched, self.fetched + count - 1)
+            self.fetched += count
+            self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < self.fetched:
+            return None
+        key, fileName = self.rows[self.visible[index.row()]]
+        if role == Qt.DisplayRole:
+            return 'PVvalue #' + key
+        if role in (Qt.ToolTipRole, Qt.StatusTipRole):
+            command, date = self.titles.get(key, ("", ""))
+            return "\n".join(text for text in (command, date, fileName) if text)
+        return None
+
+
+class ScanListView(QListView):
+    """View of a ScanListModel whose rows are the source rows of the model, like the rows of the QListWidget it
+    replaces.
+    """
+
+    def currentRow(self):
+        """
+        :return: source row of the current row, or -1
+        """
+        return self.model().sourceRow(self.currentIndex().row())
+
+    def setCurrentRow(self, sourceRow):
+        """Makes a source row current, clearing the filter if it hides the row.
+        :param sourceRow: source row
+        """
+        model = self.model()
+        row = model.viewRow(sourceRow)
+        if row < 0 and model.filterText and 0 <= sourceRow < len(model.rows):
+            model.setFilter("")
+            row = model.viewRow(sourceRow)
+        if row >= 0:
+            self.setCurrentIndex(model.index(row))
+            self.scrollTo(model.index(row))
+        else:
+            self.setCurrentIndex(QModelIndex())
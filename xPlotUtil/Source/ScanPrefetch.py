@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Loads the scans next to the open one in the background, so that stepping through the list does not wait on I/O.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+from xPlotUtil.Source.PVvalueFile import MatrixCache, pvMetadata
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+DEFAULT_DEPTH = 2  # Scans prefetched on each side of the open one
+DEFAULT_MEMORY_LIMIT = 256  # MB of matrices kept
+
+
+class PrefetchedScan(namedtuple('PrefetchedScan', ['fileName', 'stamp', 'TT', 'index', 'key', 'sections', 'scan'])):
+    """A PVvalue file read into memory, with the size and modification time it had, and its scan parsed from the
+    sections of the spec file index it had then. The scan is None when it could not be parsed.
+    """
+    __slots__ = ()
+
+
+def fileStamp(fileName):
+    """
+    :param fileName: file
+    :return: size and modification time of the file
+    """
+    st = os.stat(fileName)
+    return st.st_size, st.st_mtime_ns
+
+
+class ScanPrefetcher:
+    """Background thread loading the PVvalue matrix, header and voltage axis and the spec scan of the scans around
+    the open one, nearest first, into a cache of the most recently used ones bounded by the memory of the matrices.
+    A load in the foreground pauses the thread at the next step, and the scans wanted change with every open.
+    The thread has a MatrixCache of its own, so a file parsed here has its sidecar for later sessions too.
+    """
+
+    def __init__(self, cacheDirectory, depth=DEFAULT_DEPTH, memoryLimit=DEFAULT_MEMORY_LIMIT):
+        """
+        :param cacheDirectory: directory of the sidecars of the PVvalue files
+        :param depth: scans prefetched on each side of the open one, 0 to prefetch none
+        :param memoryLimit: MB of matrices kept
+        """
+        self.matrixCache = MatrixCache(cacheDirectory)
+        self.depth = depth
+        self.memoryLimit = memoryLimit
+        self.cache = OrderedDict()  # File name -> PrefetchedScan, least recently used first
+        self.queue = []  # (file name, spec index, scan key) still to prefetch, nearest first
+        self.foregroundLoads = 0
+        self.condition = threading.Condition()  # Guards the cache, queue and foregroundLoads
+        self.thread = None
+        self.hits = 0
+        self.misses = 0
+
+    def setLimits(self, depth, memoryLimit):
+        """
+        :param depth: scans prefetched on each side of the open one, 0 to prefetch none
+        :param memoryLimit: MB of matrices kept
+        """
+        with self.condition:
+            self.depth = depth
+            self.memoryLimit = memoryLimit
+            if depth == 0:
+                del self.queue[:]
+            self.evict()
+
+    def request(self, items):
+        """Replaces the scans to prefetch, the scans already kept are skipped.
+        :param items: (PVvalue file, SpecIndex, scan key) of each scan, nearest first
+        """
+        with self.condition:
+            self.queue = [item for item in items if item[0] not in self.cache]
+            if self.queue and self.thread is None:
+                # A daemon thread, so that quitting does not wait for a prefetch
+                self.thread = threading.Thread(target=self.run, name='ScanPrefetcher')
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify_all()
+
+    def take(self, fileName):
+        """The prefetched scan of a PVvalue file, if it is kept and the file did not change since. Its spec scan is
+        handed to the spec file index, so that the scan is not parsed again.
+        :param fileName: PVvalue file
+        :return: PrefetchedScan or None
+        """
+        with self.condition:
+            entry = self.cache.get(fileName)
+            if entry is not None:
+                try:
+                    current = fileStamp(fileName) == entry.stamp
+                except OSError:
+                    current = False
+                if current:
+                    self.cache.move_to_end(fileName)
+                else:
+                    del self.cache[fileName]
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        if entry.scan is not None:
+            entry.index.adopt(entry.key, entry.sections, entry.scan)
+        return entry
+
+    @contextmanager
+    def foreground(self):
+        """Context of a load in the foreground, during which the thread waits before its next step.
+        """
+        with self.condition:
+            self.foregroundLoads += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.foregroundLoads -= 1
+                self.condition.notify_all()
+
+    def clear(self):
+        """Forgets the scans kept and the scans to prefetch, e.g. when another spec file is opened.
+        """
+        with self.condition:
+            del self.queue[:]
+            self.cache.clear()
+
+    def memory(self):
+        """
+        :return: bytes of the matrices kept
+        """
+        return sum(entry.TT.nbytes for entry in self.cache.values())
+
+    def evict(self):
+        """Drops the least recently used scans until the matrices fit in the memory limit. Called holding the
+        condition.
+        """
+        limit = self.memoryLimit * 2 ** 20
+        total = self.memory()
+        while self.cache and total > limit:
+            fileName, entry = self.cache.popitem(last=False)
+            total -= entry.TT.nbytes
+
+    def waitForeground(self):
+        """Waits until no load is running in the foreground.
+        """
+        with self.condition:
+            while self.foregroundLoads > 0:
+                self.condition.wait()
+
+    def nextItem(self):
+        """Waits until there is a scan to prefetch and no load is running in the foreground.
+        :return: the next scan to prefetch, (file name, spec index, scan key)
+        """
+        with self.condition:
+            while True:
+                while self.queue and self.queue[0][0] in self.cache:
+                    self.queue.pop(0)  # Requested again while it was being prefetched
+                if self.foregroundLoads == 0 and self.queue:
+                    return self.queue[0]
+                self.condition.wait()
+
+    def run(self):
+        """Prefetches the scans of the queue one after another, for as long as the program runs.
+        """
+        while True:
+            item = self.nextItem()
+            try:
+                entry = self.prefetch(item)
+            except Exception:  # Not a PVvalue file, or being written; it is loaded in the foreground if opened
+                entry = None
+            with self.condition:
+                if self.queue and self.queue[0] == item:
+                    self.queue.pop(0)
+                if entry is not None and entry.TT.nbytes <= self.memoryLimit * 2 ** 20:
+                    self.cache[entry.fileName] = entry
+                    self.evict()
+
+    def prefetch(self, item):
+        """Reads one scan, waiting for the loads in the foreground between the steps.
+        :param item: (PVvalue file, SpecIndex, scan key)
+        :return: PrefetchedScan
+        """
+        fileName, index, key = item
+        stamp = fileStamp(fileName)
+        TT = self.matrixCache.load(fileName)
+        if isinstance(TT, np.memmap):
+            TT = np.array(TT)  # Read now, not on the first use of each page
+            TT.setflags(write=False)
+        self.waitForeground()
+        pvMetadata(fileName)  # Header and voltage axis, kept by PVvalueFile
+
+        self.waitForeground()
+        scan = None
+        sections = index.sections.get(key)
+        if sections is not None and key not in index.parsed:
+            try:
+                scan = index.parse(key, sections)
+                scan.interpret()
+            except Exception:  # Parsed again in the foreground, which reports the error
+                scan = None
+        return PrefetchedScan(fileName, stamp, TT, index, key, sections, scan)
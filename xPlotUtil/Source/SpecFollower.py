@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Follows a spec file and its directory during acquisition, adding the new scans and PVvalue files to the list.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import os
+
+from PyQt5.QtCore import *
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+POLL_INTERVAL = 2000  # ms between checks when no change is notified, e.g. on network file systems
+SETTLE_INTERVAL = 200  # ms to wait after a notification, as a scan is written in many small appends
+
+
+class SpecFollower(QObject):
+    """Watches the spec file and its directory with QFileSystemWatcher, which uses inotify where the system has it,
+    and polls them as well, since changes made on another host of a network file system are not notified. Each
+    check asks ReadSpec to add what is new.
+    """
+
+    def __init__(self, readSpec, parent=None):
+        """
+        :param readSpec: ReadSpec whose list is kept up to date
+        :param parent: parent object
+        """
+        super(SpecFollower, self).__init__(parent)
+        self.readSpec = readSpec
+        self.fileName = None
+        self.directory = None
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.changed)
+        self.watcher.directoryChanged.connect(self.changed)
+        self.pollTimer = QTimer(self)
+        self.pollTimer.timeout.connect(self.check)
+        self.settleTimer = QTimer(self)
+        self.settleTimer.setSingleShot(True)
+        self.settleTimer.timeout.connect(self.check)
+
+    def isFollowing(self):
+        """
+        :return: truth value of a spec file being followed
+        """
+        return self.fileName is not None
+
+    def start(self, fileName, directory, interval=POLL_INTERVAL):
+        """Starts following a spec file, after adding what changed since it was loaded.
+        :param fileName: spec file
+        :param directory: directory of the PVvalue files
+        :param interval: ms between polls
+        """
+        self.stop()
+        self.fileName = fileName
+        self.directory = directory
+        self.watcher.addPaths([fileName, directory])
+        self.pollTimer.start(interval)
+        self.check()
+
+    def stop(self):
+        """Stops following the spec file.
+        """
+        self.pollTimer.stop()
+        self.settleTimer.stop()
+        paths = self.watcher.files() + self.watcher.directories()
+        if paths:
+            self.watcher.removePaths(paths)
+        self.fileName = None
+        self.directory = None
+
+    def changed(self, path):
+        """Checks shortly after a notification, so that a burst of appends is read at once.
+        """
+        if self.fileName is not None and self.fileName not in self.watcher.files() and os.path.isfile(self.fileName):
+            self.watcher.addPath(self.fileName)  # Replaced by a new file, which is not watched
+        self.settleTimer.start(SETTLE_INTERVAL)
+
+    def check(self):
+        """Adds the new scans and PVvalue files to the list.
+        """
+        if self.fileName is None:
+            return
+        try:
+            added = self.readSpec.refreshScans()
+        except Exception as e:  # The file is read while it is written, the next check tries again
+            self.readSpec.myMainWindow.myStatusBar.showMessage("Following the spec file failed: " + str(e), 5000)
+            return
+        if added > 0:
+            self.readSpec.myMainWindow.myStatusBar.showMessage("%d new PVvalue file(s) listed" % added, 5000)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Byte-offset index of the scans of a spec file, so that one scan can be parsed without parsing the others.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+import bisect
+import os
+import re
+
+from spec2nexus.control_lines import control_line_registry
+from spec2nexus.spec import SpecDataFile, NotASpecDataFile
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+# Lines starting a section, as split by SpecDataFile.dissect_file: #E, #F or #S as the first word, then the rest of
+# the line, the command of a scan; or #D lines, the dates. Found in one pass, searched from the newline before the
+# line, which is much faster than a multiline ^.
+CONTROL_LINE = re.compile(br'\n[ \t]*#(?:([EFS])(?=\s)[ \t]*(\S*)([^\n]*)|D[ \t]+([^\n]*))')
+
+_indexes = {}  # File name -> SpecIndex, see specIndex
+
+
+def specIndex(fileName):
+    """The index of a spec file, reused until the file changes. A file that grew is indexed from where the index
+    stopped, any other change indexes the file again.
+    :param fileName: spec file
+    :return: SpecIndex
+    """
+    index = _indexes.get(fileName)
+    if index is None or (not index.isCurrent() and index.update() is None):
+        index = SpecIndex(fileName)
+        _indexes[fileName] = index
+    return index
+
+
+class SpecIndex:
+    """Offsets of the sections of a spec file. Finding the sections only scans the bytes of the file for the #E, #F
+    and #S lines; a scan is parsed by spec2nexus from its own bytes and those of its header the first time it is
+    used, and kept.
+    """
+
+    def __init__(self, fileName):
+        """
+        :param fileName: spec file
+        """
+        self.fileName = fileName
+        self.size = os.path.getsize(fileName)
+        self.mtime = os.path.getmtime(fileName)
+        self.starts = []  # (offset, kind, first word, rest) of the line starting each section
+        self.dates = []  # (offset, text) of the #D lines
+        self.keys = []  # Scan keys in the order of the file
+        self.sections = {}  # Scan key -> (start, stop) of its #F and #E sections, None if missing, and of the scan
+        self.parsed = {}  # Scan key -> parsed SpecDataFileScan
+        self.titles = {}  # Scan key -> command and date, from its #S and #D lines
+        self.scans = SpecScans(self)
+
+        with open(fileName, 'rb') as f:
+            buf = f.read()
+        self.indexSections(buf, 0)
+        if not self.starts:
+            raise NotASpecDataFile("No #E, #F or #S lines found in file: " + self.fileName)
+
+    def indexSections(self, buf, offset):
+        """Finds the sections starting in the bytes of the file from offset on, and rebuilds the sections of the
+        scans and their titles. Only complete lines start sections, so a line being written is not mistaken for a
+        shorter one; a last line being written that is not a control line is part of the last section. Repeated scan
+        numbers get the keys spec2nexus gives them, e.g. 12.1 for the second scan 12.
+        :param buf: bytes of the file from offset to its end
+        :param offset: offset of buf in the file, the start of a section or 0
+        """
+        complete = buf[:buf.rfind(b'\n') + 1]
+        # Each match starts at the newline before its line, which is where the line starts without the b'\n' added
+        for match in CONTROL_LINE.finditer(b'\n' + complete):
+            kind, word, rest, date = match.groups()
+            if kind is not None:
+                self.starts.append((offset + match.start(), kind, word, rest))
+            else:
+                self.dates.append((offset + match.start(), date))
+        dateOffsets = [start for start, text in self.dates]
+        end = offset + len(buf)
+        if buf[len(complete):].lstrip().startswith(b'#'):
+            end = offset + len(complete)
+
+        sections = {}
+        titles = {}
+        keys = []
+        ends = [start for start, kind, word, rest in self.starts[1:]] + [end]
+        current = {b'F': None, b'E': None}
+        for (start, kind, word, rest), stop in zip(self.starts, ends):
+            if kind != b'S':
+                current[kind] = (start, stop)
+                continue
+            key = word.decode('utf-8', 'replace')
+            if key in sections:
+                i = 1
+                while "%s.%d" % (key, i) in sections:
+                    i += 1
+                key = "%s.%d" % (key, i)
+            sections[key] = (current[b'F'], current[b'E'], (start, stop))
+            i = bisect.bisect_left(dateOffsets, start)
+            date = self.dates[i][1] if i < len(self.dates) and dateOffsets[i] < stop else b''
+            titles[key] = (rest.strip().decode('utf-8', 'replace'), date.strip().decode('utf-8', 'replace'))
+            keys.append(key)
+
+        # Scans whose bytes changed, the last one while it is being written, are parsed again
+        for key in list(self.parsed):
+            if sections.get(key) != self.sections.get(key):
+                del self.parsed[key]
+        self.sections = sections
+        self.titles = titles
+        self.keys = keys
+
+    def update(self):
+        """Indexes the bytes appended to the file since it was indexed. The last section is found again, as it may
+        have grown.
+        :return: keys of the new scans, or None when the file did not grow and needs to be indexed again
+        """
+        try:
+            size = os.path.getsize(self.fileName)
+            mtime = os.path.getmtime(self.fileName)
+        except OSError:
+            return None
+        if size == self.size and mtime == self.mtime:
+            return []
+        if size <= self.size or not self.starts:
+            return None
+        known = set(self.keys)
+        start = self.starts.pop()[0]
+        while self.dates and self.dates[-1][0] >= start:
+            self.dates.pop()
+        with open(self.fileName, 'rb') as f:
+            f.seek(start)
+            buf = f.read(size - start)
+        self.size = start + len(buf)
+        self.mtime = mtime
+        self.indexSections(buf, start)
+        return [key for key in self.keys if key not in known]
+
+    def isCurrent(self):
+        """
+        :return: truth value of the file being unchanged since it was indexed
+        """
+        try:
+            return os.path.getsize(self.fileName) == self.size and os.path.getmtime(self.fileName) == self.mtime
+        except OSError:
+            return False
+
+    def readSection(self, f, section):
+        """
+        :param f: spec file opened in binary mode
+        :param section: (start, stop) offsets
+        :return: text of the section, with the line endings SpecDataFile uses
+        """
+        f.seek(section[0])
+        text = f.read(section[1] - section[0]).decode('utf-8', 'replace')
+        return text.replace("\r\n", "\n").replace("\r", "\n").rstrip("\n")
+
+    def scan(self, key):
+        """
+        :param key: scan key
+        :return: spec2nexus SpecDataFileScan, parsed the first time
+        """
+        if key not in self.parsed:
+            self.parsed[key] = self.parse(key, self.sections[key])
+        return self.parsed[key]
+
+    def parse(self, key, sections):
+        """Parses one scan, the way SpecDataFile.read would: the #F and #E sections before the scan are processed
+        first, so that the scan gets its header. The scan is not kept, see scan and adopt.
+        :param key: scan key
+        :param sections: sections of the scan, as in self.sections
+        :return: spec2nexus SpecDataFileScan
+        """
+        specFile = SpecDataFile(None)
+        specFile.fileName = self.fileName
+        with open(self.fileName, 'rb') as f:
+            for section in sections:
+                if section is not None:
+                    block = self.readSection(f, section)
+                    control_line_registry.process(control_line_registry.get_control_key(block.splitlines()[0]),
+                                                  block, specFile)
+        scan = list(specFile.scans.values())[-1]
+        scan.scanNum = key
+        return scan
+
+    def adopt(self, key, sections, scan):
+        """Keeps a scan parsed elsewhere, e.g. by another thread, if its sections did not change since.
+        :param key: scan key
+        :param sections: sections the scan was parsed from
+        :param scan: spec2nexus SpecDataFileScan
+        """
+        if key not in self.parsed and self.sections.get(key) == sections:
+            self.parsed[key] = scan
+
+
+class SpecScans(Mapping):
+    """Read-only mapping of scan key to scan, like SpecDataFile.scans, that parses each scan when it is first used.
+    """
+
+    def __init__(self, index):
+        """
+        :param index: SpecIndex
+        """
+        self.index = index
+
+    def __getitem__(self, key):
+        if key not in self.index.sections:
+            raise KeyError(key)
+        return self.index.scan(key)
+
+    def __iter__(self):
+        return iter(self.index.keys)
+
+    def __len__(self):
+        return len(self.index.keys)
+
+    def __contains__(self, key):
+        return key in self.index.sections
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) UChicago Argonne, LLC. All rights reserved.
+See LICENSE file.
+
+#C Fits a PVvalue file while its scan is running, refitting the columns each time new points are written.
+"""
+# ---------------------------------------------------------------------------------------------------------------------#
+from __future__ import unicode_literals
+
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+from matplotlib.backends.backend_qt5 import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+import numpy as np
+
+from xPlotUtil.Source.FitEngine import FitEngine
+from xPlotUtil.Source.FitResultStore import FIT_NAMES
+from xPlotUtil.Source.FitWorker import FitWorker
+from xPlotUtil.Source.PeakModels import PEAK_PARAMS, peakPrefixes
+from xPlotUtil.Source.PeakSeeding import MIN_WINDOW_ROWS, seedColumns
+from xPlotUtil.Source.PVvalueFile import PVvalueTail, voltageAxis
+from xPlotUtil.Source.SpecIndex import specIndex
+
+# ---------------------------------------------------------------------------------------------------------------------#
+
+STREAM_INTERVAL = 1000  # ms between reads of the PVvalue file
+
+
+class StreamingFit(QObject):
+    """Follows the open PVvalue file with a PVvalueTail. Each point of the scan adds a row to every column, so
+    whenever rows were added every column is refitted, starting from its own fit before the new rows; the columns
+    that appear are seeded by PeakSeeding. The fits run on a FitWorker with a fit engine of their own, one at a
+    time, with the batched solver: until the peaks are among the rows read, fitting column by column takes many
+    function evaluations per column. Each finished fit becomes the current fit and updates the graphs of its tab in
+    place.
+    """
+
+    def __init__(self, gausFit, parent=None):
+        """
+        :param gausFit: GaussianFitting whose data and graphs are kept up to date
+        :param parent: parent object
+        """
+        super(StreamingFit, self).__init__(parent)
+        self.gausFit = gausFit
+        self.readSpec = gausFit.readSpec
+        self.dockedOpt = gausFit.dockedOpt
+        self.myMainWindow = gausFit.myMainWindow
+        self.fitEngine = FitEngine(solver='fast')  # No cache, the data of a running scan does not come back
+        self.tail = None  # PVvalueTail of the followed file, None when not streaming
+        self.fitSettings = None
+        self.store = None  # Last fit
+        self.fittedRows = 0  # Rows of the data of the last fit
+        self.worker = None
+        self.graphs = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+
+    def isStreaming(self):
+        """
+        :return: truth value of a PVvalue file being followed
+        """
+        return self.tail is not None
+
+    def start(self, fitSettings, interval=STREAM_INTERVAL):
+        """Starts following the open PVvalue file. The current fit, normalizer and fit window are dropped, since
+        the rows they were made for are about to change. Refused while a fit of the user is running, whose result
+        would replace the streamed fit.
+        :param fitSettings: line shape and number of peaks
+        :param interval: ms between reads of the file
+        :return: truth value of error
+        """
+        if self.gausFit.fitRunning():
+            QMessageBox.warning(self.myMainWindow, "Error", "A fit is already running. Wait for it to finish or "
+                                                            "cancel it before streaming.")
+            return True
+        self.stop()
+        self.dockedOpt.resetFit()
+        self.dockedOpt.graph.set('normalizer', None)
+        self.dockedOpt.graph.set('roi', None)
+        self.tail = PVvalueTail(self.dockedOpt.fileName)
+        self.fitSettings = fitSettings
+        self.store = None
+        self.fittedRows = 0
+        self.streamingGraphs()
+        self.timer.start(interval)
+        self.check()
+        return False
+
+    def stop(self):
+        """Stops following the file. The last fit stays the current fit, with its graphing options.
+        """
+        self.timer.stop()
+        streamed = self.tail is not None and self.store is not None
+        self.tail = None
+        if streamed and self.dockedOpt.fitTopBranch is None and self.dockedOpt.fitStat:
+            self.dockedOpt.GraphingFitOptionsTree(self.fitSettings[0])
+
+    def check(self):
+        """Reads the new rows of the file and starts refitting, unless the previous fit is still running; its
+        rows are then picked up by the next check.
+        """
+        if self.tail is None or (self.worker is not None and self.worker.isRunning()):
+            return
+        try:
+            self.tail.read()
+        except (OSError, ValueError) as e:
+            self.myMainWindow.myStatusBar.showMessage("Reading the PVvalue file failed: " + str(e), 5000)
+            return
+        TT = self.tail.matrix()
+        nRow, nCol = TT.shape
+        if nRow == self.fittedRows or nRow < MIN_WINDOW_ROWS or nCol == 0:
+            return
+
+        whichFit, peaks = self.fitSettings
+        seeds = None
+        if self.store is not None:
+            seeds = self.store.params[:min(self.store.nCol, nCol), :, 0]
+            if nCol > len(seeds):
+                seeds = np.vstack([seeds, seedColumns(TT[:, len(seeds):], whichFit, peaks)])
+
+        def fit(progress):
+            return self.fitEngine.fitColumns(TT, whichFit, peaks, seeds=seeds)
+
+        self.worker = FitWorker(fit, parent=self.myMainWindow)
+        self.worker.fitFinished.connect(lambda store: self.fitted(TT, store))
+        self.worker.fitFailed.connect(lambda error: self.myMainWindow.myStatusBar.showMessage(
+            "Streaming fit failed: " + error, 5000))
+        self.worker.start()
+
+    def fitted(self, TT, store):
+        """Makes a finished fit the current fit and graphs it.
+        :param TT: data that was fitted
+        :param store: FitResultStore of the fit
+        """
+        if self.tail is None:
+            return
+        self.store = store
+        self.fittedRows = TT.shape[0]
+        self.scanRange(TT.shape[0])
+        graph = self.dockedOpt.graph
+        graph.set('raw', TT)
+        graph.set('fitSettings', self.fitSettings)
+        graph.put('fitted', store)
+        self.updateStreamingGraphs(store)
+        self.myMainWindow.myStatusBar.showMessage("Streaming fit, %d points: %s" % (TT.shape[0],
+                                                                                   self.fitEngine.fitLog[-1]), 5000)
+
+    def scanRange(self, nRow):
+        """Takes the L of the rows read so far from the scan, which is read again as the spec file grows.
+        :param nRow: rows of the data
+        """
+        try:
+            L = specIndex(self.readSpec.specFileName).scans[self.readSpec.scan].data["L"]
+        except Exception:  # The scan line of the point may not be written yet, the range is kept
+            return
+        if len(L) > 0:
+            self.readSpec.L = L[:nRow]
+            self.readSpec.lMin = self.readSpec.L[0]
+            self.readSpec.lMax = self.readSpec.L[-1]
+
+    def streamingGraphs(self):
+        """Tab with the amplitude, position and width of each peak, and the lattice constant of its position,
+        against the voltage.
+        """
+        whichFit, peaks = self.fitSettings
+        try:
+            x = np.asarray(voltageAxis(self.dockedOpt.fileName), dtype=float)
+        except (OSError, ValueError, KeyError):
+            x = None  # Graphed against the bins
+        fig = Figure((5.0, 5.0), dpi=100)
+        canvas = FigureCanvas(fig)
+        lines = []
+        for i, (param, yLabel) in enumerate(zip(PEAK_PARAMS + ('lattice',),
+                                                ['Intensity', 'Position', 'Width', 'L Constant (Å)'])):
+            axes = fig.add_subplot(4, 1, i + 1)
+            for prefix in peakPrefixes(peaks):
+                lines.append((prefix + param, axes.plot([], [], 'o', markersize=3)[0]))
+            axes.set_ylabel(yLabel)
+        axes.set_xlabel('Voltage' if x is not None else 'Bin')
+        name = FIT_NAMES[whichFit] + ' Streaming Fit (Scan#: ' + self.readSpec.scan + ')'
+        fig.suptitle(name)
+
+        tab = QWidget()
+        tab.setStatusTip(name)
+        vbox = QVBoxLayout()
+        vbox.addWidget(NavigationToolbar(canvas, tab))
+        vbox.addWidget(canvas)
+        tab.setLayout(vbox)
+        self.myMainWindow.savingCanvasTabs(tab, name, canvas, fig)
+        self.graphs = {'canvas': canvas, 'fig': fig, 'lines': lines, 'x': x}
+
+    def updateStreamingGraphs(self, store):
+        """Replaces the data of the lines of the streaming tab with a new fit, unless the tab was closed.
+        :param store: FitResultStore of the fit
+        """
+        if self.graphs is None or self.graphs['fig'] not in self.myMainWindow.figArray:
+            return
+        x = self.graphs['x']
+        if x is None or len(x) < store.nCol:
+            x = np.arange(store.nCol)
+        x = x[:store.nCol]
+        latticeSettings = (self.readSpec.lElement, self.readSpec.lMin, self.readSpec.lMax)
+        for name, line in self.graphs['lines']:
+            if name.endswith('lattice'):
+                if self.readSpec.lElement == 0 or self.readSpec.lMax == self.readSpec.lMin:
+                    continue
+                values = self.gausFit.PositionLFit(store.value(name[:-len('lattice')] + 'center'), store.nRow,
+                                                   latticeSettings)
+            else:
+                values = store.value(name)
+            line.set_data(x, values)
+            line.axes.relim()
+            line.axes.autoscale_view()
+        self.graphs['canvas'].draw_idle()